@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+"""
+Runs the benchmark scenarios (see scenarios.py), and reports the time per operation of each one, compared to the raw
+json baseline of the same data.
+
+    benchmarks/bench.py                        # Run all scenarios
+    benchmarks/bench.py -f migration -f flat   # Run the scenarios whose names contain one of the patterns
+    benchmarks/bench.py --json results.json    # Write the results as json as well
+
+A json results file can serve as a baseline for later runs:
+
+    benchmarks/bench.py -r 5 --json baseline.json
+    benchmarks/bench.py -r 5 --compare baseline.json --threshold 0.1
+
+The comparison prints a diff table of the scenarios, and exits with status 1 if any of them has regressed - Its
+median time per operation is slower than the baseline median by more than the threshold, and the interquartile ranges
+of the samples of both runs do not overlap, so the difference is unlikely to be noise.
+"""
+
+import argparse
+import json
+import platform
+import sys, os
+import time
+
+sys.path.insert(0, os.path.join(sys.path[0], '..'))
+
+from scenarios import create_scenarios
+
+DEFAULT_MIN_TIME = 0.2
+DEFAULT_REPEATS = 3
+DEFAULT_THRESHOLD = 0.1
+
+
+def time_calls(func, number):
+    start_time = time.time()
+    for _ in xrange(number):
+        func()
+    return time.time() - start_time
+
+
+def measure(func, min_time, repeats):
+    """
+    Returns a list of repeats samples of the time per call of func, in seconds. Each sample calls func enough times to run for at least min_time seconds
+    """
+    number = 1
+    while True:
+        elapsed = time_calls(func, number)
+        if elapsed >= min_time:
+            break
+        if elapsed <= 0:
+            number *= 10
+        else:
+            number = max(number * 2, int(number * min_time / elapsed * 1.1))
+    samples = [elapsed / number]
+    for _ in range(repeats - 1):
+        samples.append(time_calls(func, number) / number)
+    return samples
+
+
+def percentile(values, fraction):
+    # Linear interpolation between the closest ranks
+    values = sorted(values)
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def median(values):
+    return percentile(values, 0.5)
+
+
+def run_scenario(scenario, min_time, repeats):
+    samples = [seconds / scenario.ops_per_call for seconds in measure(scenario.serium_func, min_time, repeats)]
+    baseline_samples = [seconds / scenario.ops_per_call for seconds in measure(scenario.baseline_func, min_time, repeats)]
+    seconds_per_op = median(samples)
+    baseline_seconds_per_op = median(baseline_samples)
+    return {
+        'name': scenario.name,
+        'ops_per_call': scenario.ops_per_call,
+        'samples': samples,
+        'ms_per_op': seconds_per_op * 1000,
+        'q1_ms_per_op': percentile(samples, 0.25) * 1000,
+        'q3_ms_per_op': percentile(samples, 0.75) * 1000,
+        'ops_per_sec': 1 / seconds_per_op if seconds_per_op > 0 else None,
+        'json_ms_per_op': baseline_seconds_per_op * 1000,
+        'json_ratio': seconds_per_op / baseline_seconds_per_op if baseline_seconds_per_op > 0 else None
+    }
+
+
+def select_scenarios(scenarios, patterns):
+    if not patterns:
+        return scenarios
+    return [scenario for scenario in scenarios if any(pattern in scenario.name for pattern in patterns)]
+
+
+def format_results(results):
+    name_width = max([len('scenario')] + [len(result['name']) for result in results])
+    line_format = '{:<%d}  {:>12}  {:>12}  {:>12}  {:>8}' % name_width
+    lines = [line_format.format('scenario', 'ms/op', 'ops/sec', 'json ms/op', 'x json')]
+    for result in results:
+        lines.append(line_format.format(result['name'],
+                                        '{:.4f}'.format(result['ms_per_op']),
+                                        '{:.0f}'.format(result['ops_per_sec']) if result['ops_per_sec'] is not None else '-',
+                                        '{:.4f}'.format(result['json_ms_per_op']),
+                                        '{:.1f}'.format(result['json_ratio']) if result['json_ratio'] is not None else '-'))
+    return '\n'.join(lines)
+
+
+def compare_result(baseline, result, threshold):
+    """
+    Returns the status of result compared to the baseline result of the same scenario
+    """
+    change = result['ms_per_op'] / baseline['ms_per_op'] - 1
+    if abs(change) <= threshold:
+        return 'ok'
+    # Results which were saved without quartiles are compared by their medians only
+    baseline_q1 = baseline.get('q1_ms_per_op', baseline['ms_per_op'])
+    baseline_q3 = baseline.get('q3_ms_per_op', baseline['ms_per_op'])
+    if change > 0 and result['q1_ms_per_op'] > baseline_q3:
+        return 'REGRESSION'
+    if change < 0 and result['q3_ms_per_op'] < baseline_q1:
+        return 'improved'
+    return 'noisy'
+
+
+def compare_results(baseline_results, results, threshold):
+    """
+    Returns a diff table of results compared to baseline_results, and whether any of the scenarios has regressed
+    """
+    baseline_by_name = {result['name']: result for result in baseline_results}
+    names = [result['name'] for result in results]
+    name_width = max([len('scenario')] + [len(name) for name in names])
+    line_format = '{:<%d}  {:>14}  {:>14}  {:>8}  {:>10}' % name_width
+    lines = [line_format.format('scenario', 'baseline ms/op', 'ms/op', 'change', 'status')]
+    regressed = False
+    for result in results:
+        baseline = baseline_by_name.get(result['name'])
+        if baseline is None:
+            lines.append(line_format.format(result['name'], '-', '{:.4f}'.format(result['ms_per_op']), '-', 'new'))
+            continue
+        status = compare_result(baseline, result, threshold)
+        regressed = regressed or status == 'REGRESSION'
+        lines.append(line_format.format(result['name'],
+                                        '{:.4f}'.format(baseline['ms_per_op']),
+                                        '{:.4f}'.format(result['ms_per_op']),
+                                        '{:+.1f}%'.format((result['ms_per_op'] / baseline['ms_per_op'] - 1) * 100),
+                                        status))
+    return '\n'.join(lines), regressed
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='Run the serium benchmark scenarios')
+    parser.add_argument('-f', '--filter', dest='patterns', action='append', help='Run only scenarios whose names contain this string. Can be given multiple times')
+    parser.add_argument('-l', '--list', action='store_true', help='List the scenarios and exit')
+    parser.add_argument('--min-time', type=float, default=DEFAULT_MIN_TIME, help='Minimal duration of each sample, in seconds. Defaults to %(default)s')
+    parser.add_argument('-r', '--repeats', type=int, default=DEFAULT_REPEATS, help='Number of samples per scenario. Defaults to %(default)s')
+    parser.add_argument('--json', dest='json_path', help='Write the results to this file as json')
+    parser.add_argument('--compare', dest='baseline_path', help='Compare the results to a baseline json results file, and exit with status 1 if any scenario has regressed')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Relative slowdown which is considered a regression. Defaults to %(default)s')
+    return parser
+
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    scenarios = select_scenarios(create_scenarios(), args.patterns)
+
+    if args.list:
+        for scenario in scenarios:
+            print scenario.name
+        return 0
+
+    results = []
+    for scenario in scenarios:
+        results.append(run_scenario(scenario, args.min_time, args.repeats))
+        print >> sys.stderr, 'Done {}'.format(scenario.name)
+
+    print format_results(results)
+
+    if args.json_path is not None:
+        with open(args.json_path, 'wb') as f:
+            json.dump({'python_version': platform.python_version(), 'timestamp': time.time(),
+                       'min_time': args.min_time, 'repeats': args.repeats, 'results': results}, f, indent=2, sort_keys=True)
+
+    if args.baseline_path is not None:
+        with open(args.baseline_path, 'rb') as f:
+            baseline = json.load(f)
+        diff_table, regressed = compare_results(baseline['results'], results, args.threshold)
+        print
+        print 'Compared to {} (threshold {:.0f}%):'.format(args.baseline_path, args.threshold * 100)
+        print diff_table
+        if regressed:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+"""
+Measures the throughput of case class construction, serialization and deserialization using 1..N threads and
+processes, and verifies that the results are correct while the shared caches are used concurrently.
+
+All the threads of a run share a single env which has a migration cache and an in-memory metrics sink, and the run
+checks that their counters add up exactly once the threads are done.
+
+    benchmarks/concurrency.py
+    benchmarks/concurrency.py --workers 1 --workers 16 --ops 5000 --mode threads
+"""
+
+import argparse
+import multiprocessing
+import sys, os
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(sys.path[0], '..'))
+
+from serium.caseclasses import SeriumEnv, CaseClassSerializationContext, CaseClassDeserializationContext, \
+    cc_compact_json_serialization
+from serium.caches import CaseClassMigrationCache
+from serium.metrics import InMemoryMetricsSink, CC_TO_DICT, CC_FROM_DICT
+from scenarios import Payment, Chain5, Chain5__v1, order, Order
+
+DEFAULT_WORKER_COUNTS = [1, 2, 4, 8]
+DEFAULT_OPS = 2000
+# Number of distinct old-version records, so the migration cache gets both hits and misses
+MIGRATION_RECORDS = 100
+
+
+def create_env():
+    return SeriumEnv(CaseClassSerializationContext(),
+                     CaseClassDeserializationContext(migration_cache=CaseClassMigrationCache(MIGRATION_RECORDS // 2)),
+                     cc_compact_json_serialization,
+                     metrics_sink=InMemoryMetricsSink())
+
+
+def construct(env, i):
+    payment_id = uuid.UUID(int=i)
+    payment = Payment(payment_id, payment_id, Decimal(i), Decimal('0.5'))
+    assert payment.payment_id == payment_id and payment.amount == Decimal(i)
+
+
+def to_json(env, i):
+    assert env.cc_to_json_str(ORDERS[i % len(ORDERS)]) == ORDER_STRS[i % len(ORDERS)]
+
+
+def from_json(env, i):
+    assert env.cc_from_json_str(ORDER_STRS[i % len(ORDERS)], Order) == ORDERS[i % len(ORDERS)]
+
+
+def migrate(env, i):
+    record = env.cc_from_json_str(CHAIN_STRS[i % MIGRATION_RECORDS], Chain5)
+    assert record == Chain5(i % MIGRATION_RECORDS, 0, 5)
+
+
+OPERATIONS = [('construct', construct), ('to_json', to_json), ('from_json', from_json), ('migrate', migrate)]
+
+ORDERS = [order(i) for i in range(20)]
+ORDER_STRS = [create_env().cc_to_json_str(o) for o in ORDERS]
+CHAIN_STRS = [create_env().cc_to_json_str(Chain5__v1(i, 0, 0)) for i in range(MIGRATION_RECORDS)]
+
+
+def run_worker(env, operation, worker_index, ops):
+    # Each worker starts from a different offset, so workers don't run in lock step over the same data
+    for i in xrange(worker_index * 7, worker_index * 7 + ops):
+        operation(env, i)
+
+
+def run_threads(env, operation, workers, ops):
+    errors = []
+    start_event = threading.Event()
+
+    def target(worker_index):
+        start_event.wait()
+        try:
+            run_worker(env, operation, worker_index, ops)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=target, args=(worker_index,)) for worker_index in range(workers)]
+    for thread in threads:
+        thread.start()
+    start_time = time.time()
+    start_event.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start_time
+    if errors:
+        raise errors[0]
+    return elapsed
+
+
+def _process_worker(args):
+    operation_name, worker_index, ops = args
+    run_worker(_process_env, dict(OPERATIONS)[operation_name], worker_index, ops)
+
+
+_process_env = None
+
+
+def run_processes(env, operation, workers, ops):
+    global _process_env
+    # The workers are forked, so each of them gets a copy of the env
+    _process_env = env
+    pool = multiprocessing.Pool(workers)
+    try:
+        # Make sure that the workers have started before measuring
+        pool.map(time.sleep, [0] * workers)
+        operation_name = [name for name, func in OPERATIONS if func is operation][0]
+        start_time = time.time()
+        pool.map(_process_worker, [(operation_name, worker_index, ops) for worker_index in range(workers)], chunksize=1)
+        return time.time() - start_time
+    finally:
+        pool.terminate()
+
+
+def verify_shared_state(env, operation_name, workers, ops):
+    # Checks that the locked counters of the shared caches and metrics did not lose any update
+    timings = env.metrics_sink.snapshot()['timings']
+    if operation_name == 'to_json':
+        assert timings[(CC_TO_DICT, 'Order')]['count'] == workers * ops
+    if operation_name == 'from_json':
+        assert timings[(CC_FROM_DICT, 'Order')]['count'] == workers * ops
+    if operation_name == 'migrate':
+        migration_cache = env.deserialization_ctx.migration_cache
+        assert migration_cache.hits + migration_cache.misses == workers * ops, migration_cache.stats()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure the throughput of serium operations using multiple threads and processes')
+    parser.add_argument('-w', '--workers', type=int, action='append', help='Number of workers. Can be given multiple times. Defaults to {}'.format(DEFAULT_WORKER_COUNTS))
+    parser.add_argument('-n', '--ops', type=int, default=DEFAULT_OPS, help='Number of operations per worker. Defaults to %(default)s')
+    parser.add_argument('-m', '--mode', choices=['threads', 'processes', 'all'], default='all', help='Defaults to %(default)s')
+    args = parser.parse_args(argv)
+
+    modes = [('threads', run_threads), ('processes', run_processes)]
+    if args.mode != 'all':
+        modes = [(name, func) for name, func in modes if name == args.mode]
+
+    line_format = '{:<10}  {:<10}  {:>8}  {:>12}  {:>10}'
+    print line_format.format('operation', 'mode', 'workers', 'ops/sec', 'scaling')
+    for operation_name, operation in OPERATIONS:
+        for mode_name, run in modes:
+            single_worker_rate = None
+            for workers in args.workers or DEFAULT_WORKER_COUNTS:
+                env = create_env()
+                elapsed = run(env, operation, workers, args.ops)
+                if mode_name == 'threads':
+                    verify_shared_state(env, operation_name, workers, args.ops)
+                rate = workers * args.ops / elapsed
+                if single_worker_rate is None:
+                    single_worker_rate = rate / workers
+                print line_format.format(operation_name, mode_name, workers, '{:.0f}'.format(rate),
+                                         '{:.2f}'.format(rate / single_worker_rate))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Reports the memory footprint of the benchmark workloads (see scenarios.py) - The deep size of each deserialized
+instance per record, next to the size of its json and of the dicts which json parsing creates - and the peak memory
+used while deserializing large documents.
+
+Peak memory is measured using tracemalloc when it's available. Otherwise, each measurement runs in a fresh child
+process, and the growth of its maximum resident set size is reported, which is coarser (it includes interpreter and
+allocator overhead, and is reported by the OS in KB).
+
+    benchmarks/memory.py
+    benchmarks/memory.py --orders 1000 --orders 20000
+"""
+
+import argparse
+import json
+import multiprocessing
+import sys, os
+
+sys.path.insert(0, os.path.join(sys.path[0], '..'))
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+    import resource
+
+from serium.caseclasses import create_default_env, cc_sizeof
+from scenarios import WORKLOADS, Batch, order
+
+DEFAULT_ORDER_COUNTS = [1000, 10000]
+
+
+def _measure_in_child(func):
+    # Runs in a fresh worker process, so the peak is not affected by previous measurements
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    func()
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) * 1024
+
+
+class _Call(object):
+    # A picklable call of a function with arguments
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __call__(self):
+        return self.func(*self.args)
+
+
+def peak_memory(call):
+    """
+    Returns the peak number of bytes allocated while running call
+    """
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            call()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    pool = multiprocessing.Pool(1)
+    try:
+        return pool.apply(_measure_in_child, (call,))
+    finally:
+        pool.terminate()
+
+
+def deserialize(s, cc_type):
+    create_default_env().cc_from_json_str(s, cc_type)
+
+
+def parse_json(s):
+    json.loads(s)
+
+
+def footprint_table(env):
+    line_format = '{:<16}  {:>14}  {:>14}  {:>14}'
+    lines = [line_format.format('workload', 'instance bytes', 'dict bytes', 'json bytes')]
+    for workload_name, (factory, records) in WORKLOADS.iteritems():
+        original = factory()
+        s = env.cc_to_json_str(original)
+        instance = env.cc_from_json_str(s, type(original))
+        lines.append(line_format.format(workload_name,
+                                        cc_sizeof(instance) // records,
+                                        cc_sizeof(json.loads(s)) // records,
+                                        len(s) // records))
+    return '\n'.join(lines)
+
+
+def peak_table(env, order_counts):
+    line_format = '{:>8}  {:>10}  {:>14}  {:>14}  {:>14}'
+    lines = [line_format.format('orders', 'json MB', 'result MB', 'peak MB', 'json peak MB')]
+    for order_count in order_counts:
+        batch = Batch([order(i) for i in range(order_count)])
+        s = env.cc_to_json_str(batch)
+        result_size = cc_sizeof(env.cc_from_json_str(s, Batch))
+        del batch
+        lines.append(line_format.format(order_count,
+                                        '{:.2f}'.format(len(s) / 1e6),
+                                        '{:.2f}'.format(result_size / 1e6),
+                                        '{:.2f}'.format(peak_memory(_Call(deserialize, s, Batch)) / 1e6),
+                                        '{:.2f}'.format(peak_memory(_Call(parse_json, s)) / 1e6)))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Report the memory footprint of deserialized case classes')
+    parser.add_argument('--orders', type=int, action='append', help='Number of orders in a large document. Can be given multiple times. Defaults to {}'.format(DEFAULT_ORDER_COUNTS))
+    args = parser.parse_args(argv)
+
+    env = create_default_env()
+    print 'Bytes per record (deep size of the deserialized instance, of the parsed json dict, and of the json string):'
+    print footprint_table(env)
+    print
+    print 'Peak memory while deserializing a large document ({}):'.format('tracemalloc' if tracemalloc is not None else 'max rss growth of a child process')
+    print peak_table(env, args.orders or DEFAULT_ORDER_COUNTS)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+"""
+Benchmark scenarios. Each scenario measures a single serium operation on a workload, together with the equivalent raw
+json operation on the same data, which serves as a baseline.
+"""
+
+import array
+import json
+import uuid
+from collections import OrderedDict
+from decimal import Decimal
+
+from serium.caseclasses import CaseClass, SeriumEnv, CaseClassDeserializationContext, create_default_env, STRING_POLICY_UTF8, \
+    STRING_POLICY_INTERN
+from serium.types import cc_list, cc_dict, cc_self_type, cc_uuid, cc_decimal, cc_subtype_key, cc_subtype_value, \
+    cc_array
+
+
+class Flat(CaseClass):
+    CC_TYPES = OrderedDict([
+        ('i', int),
+        ('l', long),
+        ('b', bool),
+        ('s', str),
+        ('u', unicode),
+        ('f', float)
+    ])
+
+    def __init__(self, i, l, b, s, u, f):
+        self.i = i
+        self.l = l
+        self.b = b
+        self.s = s
+        self.u = u
+        self.f = f
+
+
+class Address(CaseClass):
+    CC_TYPES = OrderedDict([('street', str), ('city', str), ('zip_code', str)])
+
+    def __init__(self, street, city, zip_code):
+        self.street = street
+        self.city = city
+        self.zip_code = zip_code
+
+
+class Customer(CaseClass):
+    CC_TYPES = OrderedDict([('customer_id', int), ('name', str), ('address', Address)])
+
+    def __init__(self, customer_id, name, address):
+        self.customer_id = customer_id
+        self.name = name
+        self.address = address
+
+
+class LineItem(CaseClass):
+    CC_TYPES = OrderedDict([('sku', str), ('quantity', int), ('price', float)])
+
+    def __init__(self, sku, quantity, price):
+        self.sku = sku
+        self.quantity = quantity
+        self.price = price
+
+
+class Order(CaseClass):
+    CC_TYPES = OrderedDict([('order_id', int), ('customer', Customer), ('items', cc_list(LineItem))])
+
+    def __init__(self, order_id, customer, items):
+        self.order_id = order_id
+        self.customer = customer
+        self.items = items
+
+
+class ItemList(CaseClass):
+    CC_TYPES = OrderedDict([('items', cc_list(LineItem))])
+
+    def __init__(self, items):
+        self.items = items
+
+
+class ItemDict(CaseClass):
+    CC_TYPES = OrderedDict([('items', cc_dict(str, LineItem))])
+
+    def __init__(self, items):
+        self.items = items
+
+
+class Click(CaseClass):
+    CC_TYPES = OrderedDict([('x', int), ('y', int), ('target', str)])
+
+    def __init__(self, x, y, target):
+        self.x = x
+        self.y = y
+        self.target = target
+
+
+class Event(CaseClass):
+    CC_TYPES = OrderedDict([('event_type', cc_subtype_key('payload')), ('payload', cc_subtype_value('event_type'))])
+
+    def __init__(self, event_type, payload):
+        self.event_type = event_type
+        self.payload = payload
+
+
+class Payment(CaseClass):
+    CC_TYPES = OrderedDict([
+        ('payment_id', cc_uuid),
+        ('account_id', cc_uuid),
+        ('amount', cc_decimal),
+        ('fee', cc_decimal)
+    ])
+
+    def __init__(self, payment_id, account_id, amount, fee):
+        self.payment_id = payment_id
+        self.account_id = account_id
+        self.amount = amount
+        self.fee = fee
+
+
+class Telemetry(CaseClass):
+    CC_TYPES = OrderedDict([('timestamps', cc_list(long)), ('values', cc_list(float)), ('labels', cc_dict(str, str))])
+
+    def __init__(self, timestamps, values, labels):
+        self.timestamps = timestamps
+        self.values = values
+        self.labels = labels
+
+
+class IdList(CaseClass):
+    CC_TYPES = OrderedDict([('ids', cc_list(cc_uuid))])
+
+    def __init__(self, ids):
+        self.ids = ids
+
+
+class CompactTelemetry(CaseClass):
+    CC_TYPES = OrderedDict([('timestamps', cc_array('d')), ('values', cc_array('d')), ('labels', cc_dict(str, str))])
+
+    def __init__(self, timestamps, values, labels):
+        self.timestamps = timestamps
+        self.values = values
+        self.labels = labels
+
+
+class Node(CaseClass):
+    CC_TYPES = OrderedDict([('value', int), ('children', cc_list(cc_self_type))])
+
+    def __init__(self, value, children):
+        self.value = value
+        self.children = children
+
+
+class Product(CaseClass):
+    CC_TYPES = OrderedDict([
+        ('sku', str),
+        ('name', str),
+        ('category', str),
+        ('country', str),
+        ('status', str),
+        ('tags', cc_list(str)),
+        ('attributes', cc_dict(str, str))
+    ])
+
+    def __init__(self, sku, name, category, country, status, tags, attributes):
+        self.sku = sku
+        self.name = name
+        self.category = category
+        self.country = country
+        self.status = status
+        self.tags = tags
+        self.attributes = attributes
+
+
+class Catalog(CaseClass):
+    CC_TYPES = OrderedDict([('products', cc_list(Product))])
+
+    def __init__(self, products):
+        self.products = products
+
+
+class Batch(CaseClass):
+    CC_TYPES = OrderedDict([('orders', cc_list(Order))])
+
+    def __init__(self, orders):
+        self.orders = orders
+
+
+def _chain_record_init(self, x, y, hops):
+    self.x = x
+    self.y = y
+    self.hops = hops
+
+
+def define_migration_chain(name, length):
+    """
+    Defines the case classes name__v1 ... name__v<length> and the current version name, where each version migrates to
+    the next one. Returns the oldest version
+    """
+    def migration_to(class_name):
+        return lambda old: globals()[class_name](old.x, old.y, old.hops + 1)
+
+    for v in range(1, length + 2):
+        class_name = '{}__v{}'.format(name, v) if v <= length else name
+        d = {
+            'CC_TYPES': OrderedDict([('x', int), ('y', int), ('hops', int)]),
+            'CC_V': v,
+            'CC_MIGRATIONS': {v - 1: migration_to(class_name)} if v > 1 else {},
+            '__init__': _chain_record_init,
+            '__module__': __name__
+        }
+        globals()[class_name] = type(class_name, (CaseClass,), d)
+    return globals()['{}__v1'.format(name)]
+
+
+MIGRATION_CHAIN_LENGTHS = [1, 2, 5, 10]
+BATCH_MIGRATION_CHAIN_LENGTH = 5
+BATCH_MIGRATION_RECORDS = 1000
+
+for _length in MIGRATION_CHAIN_LENGTHS:
+    define_migration_chain('Chain{}'.format(_length), _length)
+
+
+def flat():
+    return Flat(100, 200L, True, 'blah', u'blah', 12.3)
+
+
+def address(i):
+    return Address('{} Main St'.format(i), 'Springfield', '{:05d}'.format(i))
+
+
+def order(i, item_count=10):
+    return Order(i, Customer(i, 'customer {}'.format(i), address(i)),
+                 [LineItem('sku-{}'.format(j), j, j * 1.5) for j in range(item_count)])
+
+
+def product(i):
+    return Product('sku-{}'.format(i), 'product {}'.format(i), 'category-{}'.format(i % 10), 'US', 'active', ['new', 'sale', 'tag-{}'.format(i % 7)],
+                   {'color': 'red', 'size': 'M', 'material': 'cotton'})
+
+
+def deep_tree(depth):
+    node = Node(0, [])
+    for i in range(1, depth):
+        node = Node(i, [node])
+    return node
+
+
+def wide_tree(depth, width):
+    if depth == 1:
+        return Node(0, [])
+    return Node(depth, [wide_tree(depth - 1, width) for _ in range(width)])
+
+
+class Scenario(object):
+    def __init__(self, name, serium_func, baseline_func, ops_per_call=1):
+        """
+        serium_func and baseline_func are called without parameters, and perform ops_per_call operations each
+        """
+        self.name = name
+        self.serium_func = serium_func
+        self.baseline_func = baseline_func
+        self.ops_per_call = ops_per_call
+
+
+# name -> (instance factory, number of records in each instance)
+WORKLOADS = OrderedDict([
+    ('flat', (flat, 1)),
+    ('nested', (lambda: order(1, item_count=1), 1)),
+    ('list_of_cc', (lambda: ItemList([LineItem('sku-{}'.format(j), j, j * 1.5) for j in range(100)]), 1)),
+    ('dict_of_cc', (lambda: ItemDict({'sku-{}'.format(j): LineItem('sku-{}'.format(j), j, j * 1.5) for j in range(100)}), 1)),
+    ('subtypes', (lambda: Event('Click', Click(10, 20, 'button')), 1)),
+    ('numeric_lists', (lambda: Telemetry([1500000000000L + i for i in range(10000)], [i * 0.5 for i in range(10000)], {'host': 'h1', 'metric': 'cpu'}), 1)),
+    ('numeric_arrays', (lambda: CompactTelemetry(array.array('d', [1500000000000.0 + i for i in range(10000)]), array.array('d', [i * 0.5 for i in range(10000)]), {'host': 'h1', 'metric': 'cpu'}), 1)),
+    ('uuid_decimal', (lambda: Payment(uuid.uuid4(), uuid.uuid4(), Decimal('1234.56'), Decimal('0.99')), 1)),
+    ('uuid_list', (lambda: IdList([uuid.UUID(int=i * 7919) for i in range(1000)]), 1)),
+    # Each level is two levels of json nesting, and the json module is bound by the recursion limit
+    ('deep_tree', (lambda: deep_tree(300), 1)),
+    ('wide_tree', (lambda: wide_tree(4, 8), 1)),
+    ('large_batch', (lambda: Batch([order(i) for i in range(1000)]), 1000)),
+    # Mostly str values, which are converted from the unicode strings of parsed json according to the string policy
+    ('strings', (lambda: Catalog([product(i) for i in range(100)]), 100)),
+])
+
+
+# Workloads which are deserialized using one_pass_decoding as well
+ONE_PASS_WORKLOADS = ['nested', 'list_of_cc', 'large_batch']
+
+# Workloads which are deserialized using the non-default string policies as well
+STRING_POLICY_WORKLOADS = ['strings']
+
+
+def create_scenarios(env=None):
+    env = env if env is not None else create_default_env()
+    scenarios = []
+
+    for workload_name, (factory, records) in WORKLOADS.iteritems():
+        instance = factory()
+        cc_type = type(instance)
+        s = env.cc_to_json_str(instance)
+        d = json.loads(s)
+
+        scenarios.append(Scenario('{}.to_json'.format(workload_name),
+                                  lambda instance=instance: env.cc_to_json_str(instance),
+                                  lambda d=d: json.dumps(d),
+                                  records))
+        scenarios.append(Scenario('{}.from_json'.format(workload_name),
+                                  lambda s=s, cc_type=cc_type: env.cc_from_json_str(s, cc_type),
+                                  lambda s=s: json.loads(s),
+                                  records))
+
+    one_pass_env = SeriumEnv(env.serialization_ctx, CaseClassDeserializationContext(one_pass_decoding=True), env.serialization)
+    for workload_name in ONE_PASS_WORKLOADS:
+        factory, records = WORKLOADS[workload_name]
+        instance = factory()
+        s = env.cc_to_json_str(instance)
+        scenarios.append(Scenario('{}.from_json_one_pass'.format(workload_name),
+                                  lambda s=s, cc_type=type(instance): one_pass_env.cc_from_json_str(s, cc_type),
+                                  lambda s=s: json.loads(s),
+                                  records))
+
+    for string_policy in [STRING_POLICY_UTF8, STRING_POLICY_INTERN]:
+        string_policy_env = SeriumEnv(env.serialization_ctx, CaseClassDeserializationContext(string_policy=string_policy), env.serialization)
+        for workload_name in STRING_POLICY_WORKLOADS:
+            factory, records = WORKLOADS[workload_name]
+            instance = factory()
+            s = env.cc_to_json_str(instance)
+            scenarios.append(Scenario('{}.from_json_{}'.format(workload_name, string_policy),
+                                      lambda s=s, cc_type=type(instance), string_policy_env=string_policy_env: string_policy_env.cc_from_json_str(s, cc_type),
+                                      lambda s=s: json.loads(s),
+                                      records))
+
+    for length in MIGRATION_CHAIN_LENGTHS:
+        oldest_type = globals()['Chain{}__v1'.format(length)]
+        cc_type = globals()['Chain{}'.format(length)]
+        s = env.cc_to_json_str(oldest_type(1, 2, 0))
+        scenarios.append(Scenario('migration_chain_{}.from_json'.format(length),
+                                  lambda s=s, cc_type=cc_type: env.cc_from_json_str(s, cc_type),
+                                  lambda s=s: json.loads(s)))
+
+    # Old records which are read as a batch, and migrated together (see SeriumEnv.cc_from_json_str_batch())
+    oldest_type = globals()['Chain{}__v1'.format(BATCH_MIGRATION_CHAIN_LENGTH)]
+    strs = [env.cc_to_json_str(oldest_type(i, i, 0)) for i in range(BATCH_MIGRATION_RECORDS)]
+    scenarios.append(Scenario('migration_chain_{}.from_json_batch'.format(BATCH_MIGRATION_CHAIN_LENGTH),
+                              lambda cc_type=globals()['Chain{}'.format(BATCH_MIGRATION_CHAIN_LENGTH)]: env.cc_from_json_str_batch(strs, cc_type),
+                              lambda: [json.loads(s) for s in strs],
+                              BATCH_MIGRATION_RECORDS))
+
+    return scenarios
@@ -1 +1,2 @@
 #!/usr/bin/env python
+from serium.profiling import profile
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from serium.cc_exceptions import CaseClassInvalidParameterException
+
+__all__ = ['LRUCache', 'CaseClassMigrationCache', 'CaseClassDeserializationCache']
+
+
+class LRUCache(object):
+    """
+    A bounded, thread-safe, least-recently-used cache with hit/miss counters. When ttl (in seconds) is provided,
+    entries expire ttl seconds after they have been added
+    """
+
+    def __init__(self, max_size, ttl=None):
+        if max_size <= 0:
+            raise CaseClassInvalidParameterException('Cache size must be positive. Got {}'.format(max_size))
+        if ttl is not None and ttl <= 0:
+            raise CaseClassInvalidParameterException('Cache ttl must be positive. Got {}'.format(ttl))
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # key -> (value, expiration time or None)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the cached value for key, or None if it's not in the cache
+        """
+        with self._lock:
+            try:
+                value, expires_at = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            if expires_at is not None and expires_at <= time.time():
+                self.expirations += 1
+                self.misses += 1
+                return None
+            # Reinsert in order to mark the entry as the most recently used one
+            self._entries[key] = value, expires_at
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value, expires_at
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.expirations = 0
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'expirations': self.expirations}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def canonical_digest(d):
+    """
+    Returns a digest of a dict of raw (json-compatible) data, which does not depend on key order. Returns None
+    if the data contains values that cannot be canonically encoded
+    """
+    try:
+        canonical = json.dumps(d, sort_keys=True, separators=(',', ':'))
+    except (TypeError, ValueError):
+        return None
+    return hashlib.sha1(canonical).digest()
+
+
+class CaseClassMigrationCache(LRUCache):
+    """
+    Caches the results of deserializing old-version data, so data which is read repeatedly is migrated only once.
+
+    Set as the migration_cache of a CaseClassDeserializationContext. Entries are keyed by the target case class,
+    the versioned type of the data and a canonical digest of the raw data, and hold the resulting (immutable) case
+    class instances. A cache should be used only with a single deserialization context, since the results depend
+    on its settings.
+    """
+
+    def key_for(self, cc_type, d):
+        """
+        Returns the cache key for deserializing dict d into cc_type, or None if no migration is needed for this data
+        """
+        ccvt_str = d.get('_ccvt')
+        if ccvt_str is None or ccvt_str == str(cc_type.get_versioned_type()):
+            return None
+        digest = canonical_digest(d)
+        if digest is None:
+            return None
+        return cc_type, ccvt_str, digest
+
+
+class CaseClassDeserializationCache(LRUCache):
+    """
+    Caches the results of deserializing serialized payloads, so byte-identical payloads which are deserialized
+    over and over again are parsed and converted only once.
+
+    Set as the deserialization_cache of a SeriumEnv. Entries are keyed by a digest of the payload and the requested
+    case class type, and hold the resulting (immutable) case class instances. Note that the instances are shared
+    between all callers, so mutable field values (e.g. lists and dicts) must not be modified.
+    """
+
+    def key_for(self, s, cc_type):
+        if isinstance(s, unicode):
+            s = s.encode('utf-8')
+        return hashlib.sha1(s).digest(), cc_type
@@ -1,9 +1,11 @@
 #!/usr/bin/env python
+import collections
 import itertools
 import json
 import sys
 from collections import OrderedDict
 import logging
+import time
 
 from serium.cc_exceptions import VersionNotFoundCaseClassException, MigrationPathNotFoundCaseClassException, \
     MigrationFunctionCaseClassException, ExternalVersionProviderCaseClassException, \
@@ -13,10 +15,13 @@ from serium.cc_exceptions import VersionNotFoundCaseClassException, MigrationPat
     CaseClassDefinitionException, CaseClassUnexpectedTypeException, CaseClassUnknownFieldException, \
     CaseClassInvalidVersionedTypeException, CaseClassCreationException, CaseClassFieldMismatchException, \
     CaseClassUnexpectedFieldTypeException, CaseClassImmutabilityException, CaseClassSubTypeCannotBeNullException
+from serium.utils import bounded_repr
+from serium.metrics import CC_TO_DICT, CC_FROM_DICT, MIGRATE, EXTERNAL_VERSION_PROVIDER, SUBTYPE_RESOLUTION
 from serium.types import CaseClassListType, CaseClassDictType, CaseClassSelfType, CaseClassTypeAsString, \
-    CaseClassSubTypeKey, CaseClassSubTypeValue
+    CaseClassSubTypeKey, CaseClassSubTypeValue, CaseClassCustomType
 
-__all__ = ['CaseClass', 'cc_to_dict', 'cc_from_dict', 'cc_to_json_str', 'cc_to_json_str', 'cc_check',
+__all__ = ['CaseClass', 'cc_to_dict', 'cc_from_dict', 'cc_to_json_str', 'cc_to_json_str', 'cc_check', 'cc_sizeof',
+           'cc_from_dict_batch', 'cc_from_json_str_batch',
            'create_default_env', 'default_to_version_1_func',
            'SeriumEnv', 'CaseClassSerializationContext', 'CaseClassDeserializationContext',
            'CaseClassJsonSerialization', 'cc_compact_json_serialization', 'cc_pretty_json_serialization']
@@ -33,7 +38,7 @@ class FrozenCaseClassMetaClass(type):
                 if not hasattr(self, name):
                     raise CaseClassImmutabilityException("'" + name + "' not an attribute of " + clsname + " object. and can't update after creation anyway")
                 raise CaseClassImmutabilityException(
-                    "Caseclass is immutable - cannot update after creation. Use copy() to create a modified instance {}. field name {} field value {}".format(self, name, repr(value)))
+                    "Caseclass is immutable - cannot update after creation. Use copy() to create a modified instance {}. field name {} field value {}".format(bounded_repr(self), name, bounded_repr(value)))
 
         def check_parameter_types(expected_types, args, kwargs):
             if expected_types is None:
@@ -48,6 +53,11 @@ class FrozenCaseClassMetaClass(type):
                 if field_name not in expected_types:
                     raise CaseClassUnknownFieldException('Field {} is not part of case class {}'.format(field_name, cls))
                 expected_type = expected_types[field_name]
+                if isinstance(expected_type, CaseClassCustomType):
+                    if not expected_type.check_value(arg):
+                        raise CaseClassUnexpectedFieldTypeException(
+                            "For caseclass {} - Expected type for parameter {} is {}. Got value of type {}. Value is {}".format(cls, field_name, expected_type, type(arg), bounded_repr(arg)))
+                    continue
                 if isinstance(expected_type, CaseClassListType):
                     expected_type = list
                     # TODO Check element types
@@ -73,7 +83,7 @@ class FrozenCaseClassMetaClass(type):
                     if issubclass(expected_type, CaseClass) and normalize_type_name(type(arg).__name__) == expected_type.__name__:
                         continue
                     raise CaseClassUnexpectedFieldTypeException(
-                        "For caseclass {} - Expected type for parameter {} is {}. Got value of type {}. Value is {}".format(cls, field_name, expected_type, type(arg), arg))
+                        "For caseclass {} - Expected type for parameter {} is {}. Got value of type {}. Value is {}".format(cls, field_name, expected_type, type(arg), bounded_repr(arg)))
 
         # check_actual_parameters is called only after __init__ is done, to prevent the need for any reflection
         def check_actual_parameters(expected_types, d):
@@ -123,6 +133,39 @@ def normalize_type_name(type_name):
         return type_name
 
 
+def _old_version_of(d, cc_type):
+    # Returns the versioned type of d if it's a versioned dict of an old version of cc_type, and None otherwise
+    if not isinstance(d, dict) or '_ccvt' not in d:
+        return None
+    ccvt = str_to_versioned_type(cc_type, d['_ccvt'])
+    if ccvt.cc_type_name != normalize_type_name(cc_type.__name__) or ccvt.version == cc_type.get_ccv():
+        return None
+    return ccvt
+
+
+def _call_batch_migration(batch_migration_func, instances, from_version, to_version, cc_of_to_version):
+    try:
+        migrated_instances = list(batch_migration_func(instances))
+    except Exception, e:
+        raise MigrationFunctionCaseClassException(instances, from_version, to_version, e)
+    if len(migrated_instances) != len(instances):
+        raise MigrationFunctionCaseClassException(instances, from_version, to_version, CaseClassInvalidParameterException(
+            'Batch migration returned {} instances for {} instances'.format(len(migrated_instances), len(instances))))
+    for migrated_instance in migrated_instances:
+        if type(migrated_instance) is not cc_of_to_version:
+            raise MigrationFunctionCaseClassException(migrated_instance, from_version, to_version, CaseClassInvalidParameterException(
+                'Batch migration returned an instance of type {} instead of {}'.format(type(migrated_instance), cc_of_to_version)))
+    return migrated_instances
+
+
+def _values_equal(a, b):
+    # numpy arrays (see cc_ndarray) are compared element-wise, so the result of == is an array and not a bool
+    result = a == b
+    if type(result) is not bool and hasattr(result, 'all'):
+        return bool(result.all())
+    return bool(result)
+
+
 class CaseClassVersionedType(object):
     def __init__(self, cc_type, version):
         self.cc_type = cc_type
@@ -183,6 +226,10 @@ class CaseClass(object):
     # TODO Should backward compatibility be done here or in the code itself
     CC_V = 1
     CC_MIGRATIONS = {}
+    # Migrations which get a list of instances of the old version, and return a list of the migrated instances in the
+    # same order. Used for migrating batches of records (see SeriumEnv.cc_from_dict_batch()), so costs such as loading
+    # lookup tables are paid once per batch instead of once per record
+    CC_BATCH_MIGRATIONS = {}
 
     def __str__(self):
         params_str = ",".join(["{}={}".format(field_name, repr(self.__dict__[field_name])) for field_name, desc in self.__class__.CC_TYPES.iteritems()])
@@ -211,7 +258,7 @@ class CaseClass(object):
             return False
         for k, v in self.__dict__.iteritems():
             other_v = getattr(other, k)
-            if other_v != v:
+            if not _values_equal(other_v, v):
                 return False
         return True
 
@@ -224,55 +271,51 @@ class CaseClass(object):
 
     # Missing some stuff for completeness, but not urgent
 
-    def _to_dict(self, serialization_ctx):
-        subtype_keys_dict = {field_name: self.__dict__[field_name] for field_name, field_type in self.__class__.CC_TYPES.iteritems()
-                             if isinstance(field_type, CaseClassSubTypeKey)}
+    def _to_dict(self, serialization_ctx, metrics_sink=None, binary_values=False):
+        return _ToDictConverter(serialization_ctx, metrics_sink, binary_values).convert(self)
 
-        def cc_value(v, expected_type):
-            if v is None:
-                return None
-            if type(expected_type) is CaseClassListType:
-                element_type = expected_type.element_type
-                return [cc_value(e, element_type) for e in v]
-            if type(expected_type) is CaseClassDictType:
-                key_type = expected_type.key_type
-                value_type = expected_type.value_type
-                return {cc_value(k, key_type): cc_value(v, value_type) for k, v in v.iteritems()}
-            if type(expected_type) is CaseClassSelfType:
-                return cc_value(v, self.__class__)  # TODO probably wrong
-            if type(expected_type) is CaseClassTypeAsString:
-                return cc_value(str(v), str)
-            if type(expected_type) is CaseClassSubTypeKey:
-                return cc_value(v, str)
-            if type(expected_type) is CaseClassSubTypeValue:
-                subtype_class_name = subtype_keys_dict[expected_type.subtype_key_field_name]
-
-                m = sys.modules[self.__module__]
-                try:
-                    subtype_class = getattr(m, subtype_class_name)
-                    return cc_value(v, subtype_class)
-                except AttributeError:
-                    raise CaseClassCannotBeFoundException(
-                        'Could not find case class {} in module {} for subtype key {}. Case class subtypes must be in the same module as the supertype.'.format(subtype_class_name, m,
-                                                                                                                                                                expected_type.subtype_key_field_name))
-            elif issubclass(expected_type, CaseClass):
-                if isinstance(v, CaseClass):
-                    return v._to_dict(serialization_ctx)
-                else:
-                    raise CaseClassUnexpectedTypeException("Expected CaseClass of type {} and got instead value of type {}. Value is {}".format(expected_type, type(v), v))
-            else:
-                if isinstance(v, expected_type):
-                    return v
-                else:
-                    return expected_type(v)
+    @classmethod
+    def from_columns(cls, columns, lazy=False):
+        """
+        Creates instances from a dict of field name -> sequence of values, one instance per position in the sequences.
 
-        resulting_dict = {field_name: cc_value(field_value, self.__class__.CC_TYPES[field_name])  # pylint: disable=unsubscriptable-object
-                          for field_name, field_value in self.__dict__.iteritems()}
+        The values of each column are type-checked once for the whole column, and the instances are created without
+        calling __init__, so the values are stored as is. This is meant for case classes whose __init__ only stores its
+        parameters, which is what case classes normally do.
 
-        if not serialization_ctx.force_unversioned_serialization:
-            ccvt = self.__class__.get_versioned_type()
-            resulting_dict['_ccvt'] = versioned_type_to_str(ccvt)
-        return resulting_dict
+        Returns a list, or a lazy sequence which creates each instance when it's first accessed if lazy is True
+        """
+        cls.check_expected_types_metadata()
+        field_names = cls.CC_TYPES.keys()
+        extra = set(columns.keys()).difference(field_names)
+        missing = set(field_names).difference(columns.keys())
+        if len(extra) > 0 or len(missing) > 0:
+            raise CaseClassFieldMismatchException('Missing/Extra columns provided for case class {}. Extra fields are {} Missing fields are {}'.format(cls, extra, missing))
+        values_by_field = [columns[field_name] for field_name in field_names]
+        lengths = set(len(values) for values in values_by_field)
+        if len(lengths) > 1:
+            raise CaseClassInvalidParameterException('All columns must have the same length. Got lengths {}'.format(sorted(lengths)))
+        for field_name, values in zip(field_names, values_by_field):
+            _check_column(cls, field_name, values, columns)
+        rows = zip(*values_by_field) if len(field_names) > 0 else [()] * (lengths.pop() if lengths else 0)
+        if lazy:
+            return _LazyInstances(cls, field_names, rows)
+        return [_create_trusted(cls, field_names, row) for row in rows]
+
+    @classmethod
+    def from_rows(cls, rows, lazy=False):
+        """
+        Same as from_columns(), for a sequence of tuples holding the field values in CC_TYPES order
+        """
+        cls.check_expected_types_metadata()
+        field_names = cls.CC_TYPES.keys()
+        rows = list(rows)
+        for row in rows:
+            if len(row) != len(field_names):
+                raise CaseClassFieldMismatchException('Each row must contain {} values ({}). Got {}'.format(len(field_names), ', '.join(field_names), bounded_repr(row)))
+        if len(rows) == 0:
+            return _LazyInstances(cls, field_names, []) if lazy else []
+        return cls.from_columns(dict(zip(field_names, zip(*rows))), lazy)
 
     @classmethod
     def get_ccv(cls):
@@ -308,7 +351,8 @@ class CaseClass(object):
             return [to_version]
         else:
             cc_of_to_version = find_versioned_cc(cls, CaseClassVersionedType(cls, to_version))
-            possible_migrations = cc_of_to_version.CC_MIGRATIONS.keys()
+            possible_migrations = cc_of_to_version.CC_MIGRATIONS.keys() + \
+                [v for v in cc_of_to_version.CC_BATCH_MIGRATIONS.keys() if v not in cc_of_to_version.CC_MIGRATIONS]
             for possible_version in possible_migrations:
                 mp = cls.find_migration_path(possible_version, from_version)
                 if mp is not None:
@@ -316,40 +360,92 @@ class CaseClass(object):
             return None
 
     @classmethod
-    def migrate(cls, old_instance, ccvt):
+    def migrate(cls, old_instance, ccvt, metrics_sink=None):
         old_version = ccvt.version
         new_version = cls.CC_V
-        LOG.debug("Gonna migrate instance {} from version {} to version {}".format(old_instance, old_version, new_version))
+        debug = LOG.isEnabledFor(logging.DEBUG)
+        if debug:
+            LOG.debug("Gonna migrate instance %s from version %s to version %s", bounded_repr(old_instance), old_version, new_version)
         mp = cls.find_migration_path(new_version, old_version)
         if mp is None:
             raise MigrationPathNotFoundCaseClassException(ccvt, cls.get_versioned_type())
 
         intermediate_instance = old_instance
         for from_version, to_version in itertools.izip(mp, mp[1:]):
-            LOG.debug("-- Migrating instance of type {} from version {} to version {}".format(cls.__name__, from_version, to_version))
-            vcc = find_versioned_cc(cls, CaseClassVersionedType(cls, to_version)).CC_MIGRATIONS
-            migration_func = vcc[from_version]
-            try:
-                intermediate_instance = migration_func(intermediate_instance)
-            except Exception, e:
-                raise MigrationFunctionCaseClassException(intermediate_instance, from_version, to_version, e)
+            if debug:
+                LOG.debug("-- Migrating instance of type %s from version %s to version %s", cls.__name__, from_version, to_version)
+            cc_of_to_version, migration_func, batch_migration_func = cls._get_migration_funcs(from_version, to_version)
+            if metrics_sink is not None:
+                start_time = time.time()
+            if migration_func is not None:
+                try:
+                    intermediate_instance = migration_func(intermediate_instance)
+                except Exception, e:
+                    raise MigrationFunctionCaseClassException(intermediate_instance, from_version, to_version, e)
+            else:
+                intermediate_instance = _call_batch_migration(batch_migration_func, [intermediate_instance], from_version, to_version, cc_of_to_version)[0]
+            if metrics_sink is not None:
+                metrics_sink.timing(MIGRATE, (normalize_type_name(cls.__name__), from_version, to_version), time.time() - start_time)
 
-        LOG.debug("Migrated instance {} from version {} to version {} - End result is {}".format(old_instance, old_version, new_version, intermediate_instance))
+        if debug:
+            LOG.debug("Migrated instance %s from version %s to version %s - End result is %s", bounded_repr(old_instance), old_version, new_version,
+                      bounded_repr(intermediate_instance))
         return intermediate_instance
 
     @classmethod
-    def _get_version_from_external_provider(cls, d, external_version_provider_func):
+    def migrate_batch(cls, old_instances, ccvt, metrics_sink=None):
+        """
+        Migrates a list of instances of versioned type ccvt to the current version, and returns the list of migrated
+        instances. Migration steps which have a batch migration (see CC_BATCH_MIGRATIONS) migrate the whole list in a
+        single call, and other steps migrate the instances one by one
+        """
+        mp = cls.find_migration_path(cls.CC_V, ccvt.version)
+        if mp is None:
+            raise MigrationPathNotFoundCaseClassException(ccvt, cls.get_versioned_type())
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("Gonna migrate %s instances from version %s to version %s", len(old_instances), ccvt.version, cls.CC_V)
+
+        intermediate_instances = list(old_instances)
+        for from_version, to_version in itertools.izip(mp, mp[1:]):
+            cc_of_to_version, migration_func, batch_migration_func = cls._get_migration_funcs(from_version, to_version)
+            if metrics_sink is not None:
+                start_time = time.time()
+            if batch_migration_func is not None:
+                intermediate_instances = _call_batch_migration(batch_migration_func, intermediate_instances, from_version, to_version, cc_of_to_version)
+            else:
+                migrated_instances = []
+                for intermediate_instance in intermediate_instances:
+                    try:
+                        migrated_instances.append(migration_func(intermediate_instance))
+                    except Exception, e:
+                        raise MigrationFunctionCaseClassException(intermediate_instance, from_version, to_version, e)
+                intermediate_instances = migrated_instances
+            if metrics_sink is not None:
+                metrics_sink.timing(MIGRATE, (normalize_type_name(cls.__name__), from_version, to_version), time.time() - start_time)
+        return intermediate_instances
+
+    @classmethod
+    def _get_migration_funcs(cls, from_version, to_version):
+        # Returns the case class of to_version, and the migration function and the batch migration function of a migration
+        # step. At least one of the functions exists
+        cc_of_to_version = find_versioned_cc(cls, CaseClassVersionedType(cls, to_version))
+        return cc_of_to_version, cc_of_to_version.CC_MIGRATIONS.get(from_version), cc_of_to_version.CC_BATCH_MIGRATIONS.get(from_version)
+
+    @classmethod
+    def _get_version_from_external_provider(cls, d, external_version_provider_func, metrics_sink=None):
         if external_version_provider_func is None:
             return None
 
+        if metrics_sink is not None:
+            start_time = time.time()
         try:
             result = external_version_provider_func(cls, d)
         except Exception, e:
-            import traceback
-            print traceback.format_exc()
-            msg = "Exception while calling external version provider function for case class {} dict {}".format(cls, d)
+            msg = "Exception while calling external version provider function for case class {} dict {}".format(cls, bounded_repr(d))
             LOG.exception(msg)
             raise ExternalVersionProviderCaseClassException(msg)
+        if metrics_sink is not None:
+            metrics_sink.timing(EXTERNAL_VERSION_PROVIDER, (cls.__name__,), time.time() - start_time)
 
         if result is not None:
             if isinstance(result, int):
@@ -358,27 +454,32 @@ class CaseClass(object):
                 ccvt = result
             else:
                 raise ExternalVersionProviderCaseClassException("Result from external version provider must either be a version number or a CaseClassVersionedType instance")
-            LOG.debug("External version provider returned version {} for case class {}".format(ccvt, cls))
+            if LOG.isEnabledFor(logging.DEBUG):
+                LOG.debug("External version provider returned version %s for case class %s", ccvt, cls)
         else:
             ccvt = None
 
         return ccvt
 
     @classmethod
-    def deversionize_dict(cls, d, deserialization_ctx, cc_from_dict_func, cc_to_dict_func):
+    def deversionize_dict(cls, d, deserialization_ctx, cc_from_dict_func, cc_to_dict_func, metrics_sink=None):
+        debug = LOG.isEnabledFor(logging.DEBUG)
         if not '_ccvt' in d:
-            LOG.debug("Cannot find ccvt in data for case class {}".format(cls))
-            ccvt = cls._get_version_from_external_provider(d, deserialization_ctx.external_version_provider_func)
-            LOG.debug("External version provider returned {} for case class {}".format(ccvt, cls))
+            if debug:
+                LOG.debug("Cannot find ccvt in data for case class %s", cls)
+            ccvt = cls._get_version_from_external_provider(d, deserialization_ctx.external_version_provider_func, metrics_sink)
+            if debug:
+                LOG.debug("External version provider returned %s for case class %s", ccvt, cls)
 
             if ccvt is None:
                 if deserialization_ctx.fail_on_unversioned_data:
                     raise MissingVersionDataCaseClassException(cls.get_versioned_type())
                 else:
                     ccvt = cls.get_versioned_type()
-                    LOG.debug('Data does not contain version info. Assuming current version {}. Use fail_on_unversioned_data=True to generate failure in such cases'.format(ccvt))
-            else:
-                LOG.debug("ccvt for case class {} has been set be external provider to {}".format(cls, ccvt))
+                    if debug:
+                        LOG.debug('Data does not contain version info. Assuming current version %s. Use fail_on_unversioned_data=True to generate failure in such cases', ccvt)
+            elif debug:
+                LOG.debug("ccvt for case class %s has been set be external provider to %s", cls, ccvt)
         else:
             ccvt = str_to_versioned_type(cls, d['_ccvt'])
             del d['_ccvt']
@@ -388,95 +489,848 @@ class CaseClass(object):
             if deserialization_ctx.fail_on_incompatible_types:
                 raise IncompatibleTypesCaseClassException(ccvt, self_vt)
             else:
-                LOG.debug('Incompatible types {} and {}, but fail_on_incompatible_types=False, so continuing anyway'.format(ccvt, self_vt))
+                if debug:
+                    LOG.debug('Incompatible types %s and %s, but fail_on_incompatible_types=False, so continuing anyway', ccvt, self_vt)
                 return d
         else:
-            LOG.debug('Types {} and {} are compatible'.format(ccvt, self_vt))
+            if debug:
+                LOG.debug('Types %s and %s are compatible', ccvt, self_vt)
             if ccvt.version != cls.get_ccv():
-                LOG.debug("version {} vs {} - Gonna do a migration".format(ccvt.version, cls.get_ccv()))
+                if debug:
+                    LOG.debug("version %s vs %s - Gonna do a migration", ccvt.version, cls.get_ccv())
                 old_version_cc = find_versioned_cc(cls, ccvt)
-                LOG.debug("old version cc {}".format(old_version_cc))
+                if debug:
+                    LOG.debug("old version cc %s", old_version_cc)
 
                 d['_ccvt'] = versioned_type_to_str(ccvt)
                 old_version_instance = cc_from_dict_func(d, old_version_cc)
 
-                LOG.debug("old version instance {}".format(old_version_instance))
-                new_version_instance = cls.migrate(old_version_instance, ccvt)
+                if debug:
+                    LOG.debug("old version instance %s", bounded_repr(old_version_instance))
+                new_version_instance = cls.migrate(old_version_instance, ccvt, metrics_sink)
                 # Hack - Reconvert the new instance to a dict, and delete the top-level version info (we already know that we have the right version, we just migrated to it)
                 new_d = cc_to_dict_func(new_version_instance)
                 del new_d['_ccvt']
 
                 return new_d
             else:
-                LOG.debug("Instance of class {} - No need for migration".format(ccvt))
+                if debug:
+                    LOG.debug("Instance of class %s - No need for migration", ccvt)
                 return d
 
     @classmethod
-    def _from_dict(cls, d, deserialization_ctx, cc_from_dict_func, cc_to_dict_func):
-        subtype_keys_dict = {field_name: d[field_name] for field_name, field_type in cls.CC_TYPES.iteritems()
-                             if isinstance(field_type, CaseClassSubTypeKey)}
-
-        def value_with_cc_support(v, expected_type):
-            if v is None:
-                if deserialization_ctx.fail_on_null_subtypes:
-                    if type(expected_type) is CaseClassSubTypeValue:
-                        raise CaseClassSubTypeCannotBeNullException('Subtype value cannot be null')
-                return None
-            if type(expected_type) is CaseClassListType:
-                element_type = expected_type.element_type
-                return [value_with_cc_support(e, element_type) for e in v]
-            if type(expected_type) is CaseClassDictType:
-                key_type = expected_type.key_type
-                value_type = expected_type.value_type
-                return {value_with_cc_support(k, key_type): value_with_cc_support(v, value_type) for k, v in v.iteritems()}
-            if type(expected_type) is CaseClassSelfType:
-                return value_with_cc_support(v, cls)
-            if type(expected_type) is CaseClassTypeAsString:
-                if isinstance(v, expected_type.real_type):
-                    return value_with_cc_support(v, expected_type.real_type)
-                else:
-                    try:
-                        real_v = expected_type.real_type(v)
-                    except Exception as ee:
-                        raise CaseClassTypeAsStringException('Could not convert the value {} to the expected type {}. Low-level error:{}'.format(v, expected_type, str(ee)))
-                    return value_with_cc_support(real_v, expected_type.real_type)
-            if type(expected_type) is CaseClassSubTypeKey:
-                return value_with_cc_support(v, str)
-            if type(expected_type) is CaseClassSubTypeValue:
-                subtype_key = subtype_keys_dict[expected_type.subtype_key_field_name]
-                target_module = sys.modules[cls.__module__]
-                try:
-                    expected_subtype = getattr(target_module, subtype_key)
-                    if v is None:
-                        raise CaseClassSubTypeException('Value of expected type {} cannot be null'.format(expected_subtype))
-                    return value_with_cc_support(v, expected_subtype)
-                except AttributeError:
-                    raise CaseClassCannotBeFoundException('Could not find case class definition for subtype {} in module {}'.format(subtype_key, target_module))
-            if issubclass(expected_type, CaseClass):
-                return expected_type._from_dict(v, deserialization_ctx, cc_from_dict_func, cc_to_dict_func)
+    def _from_dict(cls, d, deserialization_ctx, cc_from_dict_func, cc_to_dict_func, metrics_sink=None, owns_input=False, binary_values=False):
+        return _FromDictConverter(deserialization_ctx, cc_from_dict_func, cc_to_dict_func, metrics_sink, owns_input, binary_values).convert(d, cls)
+
+
+# Module-level caches are shared by all threads, and are lock-free. They are only read and written using single dict
+# operations, which are atomic, and their values are computed from immutable class definitions, so threads that race
+# on a missing entry compute equivalent values
+
+# Cache of whether each field type can contain case classes (a "nested" type), keyed by the type descriptor object
+_nested_type_cache = {}
+
+
+def _is_nested_type(t):
+    try:
+        return _nested_type_cache[t]
+    except KeyError:
+        pass
+    tt = type(t)
+    if tt is CaseClassListType:
+        nested = _is_nested_type(t.element_type)
+    elif tt is CaseClassDictType:
+        nested = _is_nested_type(t.key_type) or _is_nested_type(t.value_type)
+    elif tt is CaseClassSelfType or tt is CaseClassSubTypeValue:
+        nested = True
+    elif tt is CaseClassTypeAsString or tt is CaseClassSubTypeKey:
+        nested = False
+    else:
+        nested = isinstance(t, type) and issubclass(t, CaseClass)
+    _nested_type_cache[t] = nested
+    return nested
+
+
+class _CaseClassPlan(object):
+    """
+    Per-class information needed for converting instances to and from dicts, computed once per case class
+    """
+
+    def __init__(self, cls):
+        # Fields which can contain case classes. These are converted through the work stack, and all other fields are converted directly
+        self.nested_fields = frozenset([field_name for field_name, field_type in cls.CC_TYPES.iteritems() if _is_nested_type(field_type)])
+        self.subtype_key_fields = [field_name for field_name, field_type in cls.CC_TYPES.iteritems() if type(field_type) is CaseClassSubTypeKey]
+        self.versioned_type_str = versioned_type_to_str(cls.get_versioned_type())
+
+
+_plans = {}
+
+
+def _get_plan(cls):
+    try:
+        return _plans[cls]
+    except KeyError:
+        # setdefault() makes sure that all threads end up using the same plan, even if several of them computed one
+        return _plans.setdefault(cls, _CaseClassPlan(cls))
+
+
+def _find_subtype(owner_cls, subtype_key, subtype_key_field_name):
+    m = sys.modules[owner_cls.__module__]
+    try:
+        return getattr(m, subtype_key)
+    except (AttributeError, TypeError):
+        raise CaseClassCannotBeFoundException(
+            'Could not find case class {} in module {} for subtype key {}. Case class subtypes must be in the same module as the supertype.'.format(subtype_key, m,
+                                                                                                                                                    subtype_key_field_name))
+
+
+def _column_expected_type(cls, expected_type):
+    # The python type which the constructor requires for the values of expected_type (see check_parameter_types)
+    tt = type(expected_type)
+    if tt is CaseClassListType:
+        return list
+    if tt is CaseClassDictType:
+        return dict
+    if tt is CaseClassSelfType:
+        return cls
+    if tt is CaseClassTypeAsString:
+        return expected_type.real_type
+    if tt is CaseClassSubTypeKey:
+        return str
+    return expected_type
+
+
+def _check_column(cls, field_name, values, columns):
+    """
+    Checks the types of all the values of a from_columns() column, the same way the constructor checks a single value
+    """
+    expected_type = cls.CC_TYPES[field_name]
+    if isinstance(expected_type, CaseClassCustomType):
+        invalid_values = [v for v in values if v is not None and not expected_type.check_value(v)]
+    elif type(expected_type) is CaseClassSubTypeValue:
+        subtype_keys = columns[expected_type.subtype_key_field_name]
+        invalid_values = [v for k, v in zip(subtype_keys, values)
+                          if v is not None and k is not None and type(v) is not _find_subtype(cls, k, expected_type.subtype_key_field_name)]
+    else:
+        expected_type = _column_expected_type(cls, expected_type)
+        unexpected_types = set(map(type, values))
+        unexpected_types.difference_update([expected_type, type(None)])
+        if len(unexpected_types) == 0:
+            return
+        unexpected_types = set(t for t in unexpected_types
+                               if not (issubclass(expected_type, CaseClass) and normalize_type_name(t.__name__) == expected_type.__name__))
+        invalid_values = [v for v in values if type(v) in unexpected_types]
+    if len(invalid_values) > 0:
+        raise CaseClassUnexpectedFieldTypeException(
+            "For caseclass {} - Expected type for column {} is {}. Got {} values of other types, e.g. a value of type {}. Value is {}".format(
+                cls, field_name, expected_type, len(invalid_values), type(invalid_values[0]), bounded_repr(invalid_values[0])))
+
+
+def _create_trusted(cls, field_names, row):
+    # Creates an instance from values which have already been checked, without calling __init__
+    instance = object.__new__(cls)
+    instance.__dict__.update(zip(field_names, row))
+    return instance
+
+
+class _LazyInstances(collections.Sequence):
+    """
+    The result of from_columns(lazy=True). Each instance is created when it is first accessed, and is kept afterwards
+    """
+
+    def __init__(self, cls, field_names, rows):
+        self.cls = cls
+        self.field_names = field_names
+        self.rows = rows
+        self.instances = [None] * len(rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(len(self)))]
+        instance = self.instances[index]
+        if instance is None:
+            instance = self.instances[index] = _create_trusted(self.cls, self.field_names, self.rows[index])
+        return instance
+
+    def __repr__(self):
+        return '<{} lazy instances of {}>'.format(len(self), self.cls.__name__)
+
+
+# String policies of the deserialization context. The json module returns unicode strings, which are converted into
+# the values of str fields using str() by default, so non-ASCII strings are rejected. The utf8 policy encodes them as
+# UTF-8 instead, and the intern policy interns the converted strings, so repeated values (e.g. country codes) share a
+# single object. Fields which should hold the unicode strings as is can be declared as unicode fields
+STRING_POLICY_ASCII = 'ascii'
+STRING_POLICY_UTF8 = 'utf8'
+STRING_POLICY_INTERN = 'intern'
+
+
+def _str_from_unicode_utf8(v):
+    return v.encode('utf-8') if type(v) is unicode else str(v)
+
+
+def _str_from_unicode_interned(v):
+    return intern(str(v))
+
+
+_STRING_POLICY_CONVERTERS = {
+    STRING_POLICY_ASCII: str,
+    STRING_POLICY_UTF8: _str_from_unicode_utf8,
+    STRING_POLICY_INTERN: _str_from_unicode_interned
+}
+
+
+# Types whose values are json values as is. Lists and dicts of these are converted in bulk
+_PRIMITIVE_TYPES = frozenset([int, long, float, bool, str, unicode])
+_STRING_TYPES = frozenset([str, unicode])
+
+
+def _primitive_list(v, element_type, reuse, convert_element, bulk_convert=None):
+    """
+    Converts a sequence of values into a list of element_type values, where element_type is one of _PRIMITIVE_TYPES.
+
+    The types of the values are checked in a single pass. If all of them are of element_type, the list is returned as is
+    (when reuse is true) or copied. Otherwise, the values are converted in bulk if possible (using bulk_convert, which
+    defaults to element_type), and one by one using convert_element() if not. The results are the same as converting
+    each value separately.
+    """
+    value_types = set(map(type, v))
+    if value_types <= set([element_type]):
+        return v if reuse and type(v) is list else list(v)
+    # Values of subclasses of element_type are kept as is by convert_element(), and None values are kept as None
+    if type(None) not in value_types and not any(t is not element_type and issubclass(t, element_type) for t in value_types):
+        try:
+            return map(bulk_convert or element_type, v)
+        except Exception:
+            # Converted one by one below, in order to raise the appropriate exception
+            pass
+    return [e if type(e) is element_type else convert_element(e, element_type) for e in v]
+
+
+def _primitive_dict(v, key_type, value_type, reuse, convert_element, bulk_convert_key=None, bulk_convert_value=None):
+    # Same as _primitive_list(), for dicts whose key and value types are both in _PRIMITIVE_TYPES
+    keys = v.keys()
+    values = v.values()
+    converted_keys = _primitive_list(keys, key_type, True, convert_element, bulk_convert_key)
+    converted_values = _primitive_list(values, value_type, True, convert_element, bulk_convert_value)
+    if converted_keys is keys and converted_values is values:
+        return v if reuse and type(v) is dict else dict(v)
+    return dict(itertools.izip(converted_keys, converted_values))
+
+
+def _leaf_value_to_dict(v, expected_type, binary_values=False):
+    # Converts values of non-nested types (see _is_nested_type). When binary_values is true, binary field values are kept as raw bytes
+    if v is None:
+        return None
+    if type(expected_type) is CaseClassListType:
+        element_type = expected_type.element_type
+        if element_type in _PRIMITIVE_TYPES:
+            return _primitive_list(v, element_type, False, _leaf_value_to_dict)
+        if isinstance(element_type, CaseClassCustomType) and element_type.json_compatible_values and not binary_values and element_type.check_values(v):
+            return list(v)
+        if type(element_type) is CaseClassTypeAsString and not (binary_values and element_type.to_binary is not None) and type(None) not in set(map(type, v)):
+            return map(str, v)
+        return [_leaf_value_to_dict(e, element_type, binary_values) for e in v]
+    if type(expected_type) is CaseClassDictType:
+        key_type = expected_type.key_type
+        value_type = expected_type.value_type
+        if key_type in _PRIMITIVE_TYPES and value_type in _PRIMITIVE_TYPES:
+            return _primitive_dict(v, key_type, value_type, False, _leaf_value_to_dict)
+        return {_leaf_value_to_dict(k, key_type, binary_values): _leaf_value_to_dict(v, value_type, binary_values) for k, v in v.iteritems()}
+    if type(expected_type) is CaseClassTypeAsString:
+        if binary_values and expected_type.to_binary is not None:
+            return expected_type.to_binary(v)
+        return str(v)
+    if type(expected_type) is CaseClassSubTypeKey:
+        expected_type = str
+    if isinstance(expected_type, CaseClassCustomType):
+        return expected_type.to_binary_value(v) if binary_values else expected_type.to_json_value(v)
+    if isinstance(v, expected_type):
+        return v
+    else:
+        return expected_type(v)
+
+
+class _ToDictConverter(object):
+    """
+    Converts a case class instance into a dict.
+
+    Nested case classes are converted using an explicit work stack instead of recursion, so the depth of nested
+    structures (e.g. trees defined using cc_self_type) is not limited by the interpreter's recursion limit. The dicts and
+    lists of the result are created before their content is converted, and work items fill them in place.
+    """
+
+    def __init__(self, serialization_ctx, metrics_sink=None, binary_values=False):
+        self.versioned = not serialization_ctx.force_unversioned_serialization
+        self.preserve_references = getattr(serialization_ctx, 'preserve_references', False)
+        self.binary_values = binary_values
+        self.metrics_sink = metrics_sink
+
+    def convert(self, cc):
+        if self.preserve_references:
+            return self._convert_with_references(cc)
+        result = [None]
+        # Work items are (case class instance, container, key), meaning that the instance's dict should be stored in container[key]
+        stack = [(cc, result, 0)]
+        while stack:
+            instance, container, key = stack.pop()
+            container[key] = self._instance_to_dict(instance, stack)
+        return result[0]
+
+    def convert_value(self, v, expected_type, owner):
+        """
+        Converts the value of a field of expected_type in the case class instance owner
+        """
+        result = [None]
+        stack = []
+        self._nested_value_to_dict(v, expected_type, owner, result, 0, stack)
+        while stack:
+            instance, container, key = stack.pop()
+            container[key] = self._instance_to_dict(instance, stack)
+        return result[0]
+
+    def _convert_with_references(self, cc):
+        # Same as convert(), but instances which are referenced from more than one place are converted only once. The
+        # first place gets the dict of the instance, with a _ccid key, and the other places get {"_ccref": <id>}
+        reference_ids = dict.fromkeys(self._shared_instance_ids(cc))
+        next_reference_id = 0
+        result = [None]
+        stack = [(cc, result, 0)]
+        while stack:
+            instance, container, key = stack.pop()
+            instance_id = id(instance)
+            if instance_id in reference_ids:
+                reference_id = reference_ids[instance_id]
+                if reference_id is not None:
+                    container[key] = {_REFERENCE_KEY: reference_id}
+                    continue
+                reference_id = reference_ids[instance_id] = next_reference_id
+                next_reference_id += 1
+                container[key] = self._instance_to_dict(instance, stack)
+                container[key][_REFERENCE_ID_KEY] = reference_id
             else:
-                if isinstance(v, expected_type):
-                    return v
-                else:
-                    try:
-                        return expected_type(v)
-                    except Exception as ee:
-                        raise CaseClassFieldTypeException('Value is of type {} while expected type is {}. Original Error: {}. Actual Value: {}'.format(type(v), expected_type, str(ee), v))
+                container[key] = self._instance_to_dict(instance, stack)
+        if len(reference_ids) > 0:
+            result[0][_REFERENCE_COUNT_KEY] = len(reference_ids)
+        return result[0]
+
+    def _shared_instance_ids(self, cc):
+        # Returns the ids of the case class instances which are reachable from cc through more than one path
+        seen = set()
+        shared = set()
+        instances = [cc]
+        while instances:
+            instance = instances.pop()
+            if id(instance) in seen:
+                shared.add(id(instance))
+                continue
+            seen.add(id(instance))
+            values = [instance.__dict__[field_name] for field_name in _get_plan(instance.__class__).nested_fields]
+            while values:
+                v = values.pop()
+                if isinstance(v, CaseClass):
+                    instances.append(v)
+                elif type(v) is list:
+                    values.extend(v)
+                elif type(v) is dict:
+                    values.extend(v.itervalues())
+        return shared
+
+    def _instance_to_dict(self, instance, stack):
+        cls = instance.__class__
+        cc_types = cls.CC_TYPES
+        plan = _get_plan(cls)
+        nested_fields = plan.nested_fields
+
+        resulting_dict = {}
+        for field_name, field_value in instance.__dict__.iteritems():
+            if field_name in nested_fields:
+                self._nested_value_to_dict(field_value, cc_types[field_name], instance, resulting_dict, field_name, stack)
+            else:
+                resulting_dict[field_name] = _leaf_value_to_dict(field_value, cc_types[field_name], self.binary_values)  # pylint: disable=unsubscriptable-object
+
+        if self.versioned:
+            resulting_dict['_ccvt'] = plan.versioned_type_str
+        return resulting_dict
 
+    def _nested_value_to_dict(self, v, expected_type, owner, container, key, stack):
+        # Stores the converted value in container[key]. Case classes are pushed to the work stack, and get converted later
+        if v is None:
+            container[key] = None
+            return
+        if type(expected_type) is CaseClassListType:
+            element_type = expected_type.element_type
+            converted_list = container[key] = [None] * len(v)
+            for i, e in enumerate(v):
+                self._nested_value_to_dict(e, element_type, owner, converted_list, i, stack)
+        elif type(expected_type) is CaseClassDictType:
+            key_type = expected_type.key_type
+            value_type = expected_type.value_type
+            converted_dict = container[key] = {}
+            for k, e in v.iteritems():
+                self._nested_value_to_dict(e, value_type, owner, converted_dict, _leaf_value_to_dict(k, key_type, self.binary_values), stack)
+        elif type(expected_type) is CaseClassSubTypeValue:
+            # Only verifies that the subtype exists. The value itself is converted according to its own type
+            subtype_key = owner.__dict__[expected_type.subtype_key_field_name]
+            subtype = _find_subtype(owner.__class__, subtype_key, expected_type.subtype_key_field_name)
+            if self.metrics_sink is not None:
+                self.metrics_sink.increment(SUBTYPE_RESOLUTION, (owner.__class__.__name__, subtype.__name__))
+            stack.append((v, container, key))
+        elif type(expected_type) is CaseClassSelfType or _is_nested_type(expected_type):
+            if not isinstance(v, CaseClass):
+                raise CaseClassUnexpectedTypeException("Expected CaseClass of type {} and got instead value of type {}. Value is {}".format(expected_type, type(v), bounded_repr(v)))
+            stack.append((v, container, key))
+        else:
+            container[key] = _leaf_value_to_dict(v, expected_type, self.binary_values)
+
+
+# Keys of the dicts of reference-preserving serialization (see CaseClassSerializationContext.preserve_references). The
+# root dict holds the number of shared instances, the first occurrence of each shared instance holds its id, and the
+# other occurrences are replaced with a dict which holds only the id
+_REFERENCE_COUNT_KEY = '_ccrefs'
+_REFERENCE_ID_KEY = '_ccid'
+_REFERENCE_KEY = '_ccref'
+
+
+def _resolve_references(d):
+    """
+    Replaces the reference dicts inside d with the dicts of the instances they refer to, so each shared dict appears in
+    all the places which reference it. Removes the reference keys, and returns the ids of the shared dicts
+    """
+    del d[_REFERENCE_COUNT_KEY]
+    dicts_by_reference_id = {}
+    # (container, key, reference id) of each reference
+    references = []
+    values = [d]
+    while values:
+        v = values.pop()
+        if type(v) is dict:
+            reference_id = v.pop(_REFERENCE_ID_KEY, None)
+            if reference_id is not None:
+                dicts_by_reference_id[reference_id] = v
+            items = v.iteritems()
+        elif type(v) is list:
+            items = enumerate(v)
+        else:
+            continue
+        for k, e in items:
+            if type(e) is dict and _REFERENCE_KEY in e and len(e) == 1:
+                references.append((v, k, e[_REFERENCE_KEY]))
+            else:
+                values.append(e)
+    for container, key, reference_id in references:
+        try:
+            container[key] = dicts_by_reference_id[reference_id]
+        except (KeyError, TypeError):
+            raise CaseClassInvalidParameterException('Reference to an unknown instance id {}'.format(bounded_repr(reference_id)))
+    return [id(shared_dict) for shared_dict in dicts_by_reference_id.itervalues()]
+
+
+# Work stack item kinds of _FromDictConverter
+_EXPAND = 0
+_BUILD = 1
+
+# Pseudo field names under which the profiler gets the costs that are not specific to a field
+_PROFILE_DEVERSIONIZE = '<deversionize>'
+_PROFILE_CONSTRUCTION = '<init>'
+
+# The profiler which deserialization costs are reported to, if any. See serium.profiling.profile()
+_active_profiler = None
+
+
+def set_active_profiler(profiler):
+    """
+    Sets the profiler which gets the per-field deserialization costs, or None in order to stop profiling. Returns the previously active profiler
+    """
+    global _active_profiler
+    previous_profiler = _active_profiler
+    _active_profiler = profiler
+    return previous_profiler
+
+
+def _count_allocations(original_value, converted_value):
+    # Counts the objects which have been created in order to convert a value
+    if converted_value is original_value:
+        return 0
+    if type(converted_value) is list:
+        return 1 + sum(_count_allocations(o, c) for o, c in itertools.izip(original_value, converted_value))
+    if type(converted_value) is dict and isinstance(original_value, dict):
+        return 1 + sum(_count_allocations(original_value.get(k), c) for k, c in converted_value.iteritems())
+    return 1
+
+
+class _FromDictConverter(object):
+    """
+    Converts a dict into a case class instance.
+
+    Nested case classes are converted using an explicit work stack instead of recursion, so the depth of nested
+    structures (e.g. trees defined using cc_self_type) is not limited by the interpreter's recursion limit. Each case class
+    dict is first expanded - Its non-nested fields are converted directly, and its nested case classes are pushed to the
+    stack above a build item for the instance itself. Since the stack is LIFO, all the nested instances are built before
+    the build item is popped, and the instance can then be created.
+
+    When owns_input is true, the input has been created for this conversion only (e.g. by parsing json), so its lists and
+    dicts of primitive values can become part of the instances as is, instead of being copied.
+    """
+
+    def __init__(self, deserialization_ctx, cc_from_dict_func, cc_to_dict_func, metrics_sink=None, owns_input=False, binary_values=False):
+        self.deserialization_ctx = deserialization_ctx
+        self.cc_from_dict_func = cc_from_dict_func
+        self.cc_to_dict_func = cc_to_dict_func
+        self.metrics_sink = metrics_sink
+        self.owns_input = owns_input
+        self.binary_values = binary_values
+        self.str_from_unicode = _STRING_POLICY_CONVERTERS[deserialization_ctx.string_policy]
+        self.profiler = _active_profiler
+        # When the input contains references (see _resolve_references), maps the ids of the shared dicts to their instances
+        self.shared_instances = None
+
+    def convert(self, d, cls):
+        if type(d) is dict and _REFERENCE_COUNT_KEY in d:
+            self.shared_instances = dict.fromkeys(_resolve_references(d))
+        result = [None]
+        # Work items are either (_EXPAND, dict, case class type, container, key) or (_BUILD, case class type, kwargs, container, key, migration cache key,
+        # shared dict id). Both mean that the resulting instance should be stored in container[key]
+        self._run([(_EXPAND, d, cls, result, 0)])
+        return result[0]
+
+    def convert_value(self, v, expected_type, owner_cls, subtype_keys_dict):
+        """
+        Converts the value of a field of expected_type in case class owner_cls. subtype_keys_dict holds the values of
+        the subtype key fields of the instance, which determine the types of its subtype value fields
+        """
+        result = [None]
+        stack = []
+        self._nested_value_from_dict(v, expected_type, owner_cls, subtype_keys_dict, result, 0, stack)
+        self._run(stack)
+        return result[0]
+
+    def _run(self, stack):
+        profiler = self.profiler
+        while stack:
+            item = stack.pop()
+            if item[0] is _EXPAND:
+                self._expand(item[1], item[2], item[3], item[4], stack)
+            else:
+                _, cc_type, kwargs, container, key, migration_cache_key, shared_dict_id = item
+                if profiler is None:
+                    instance = container[key] = cc_type(**kwargs)
+                else:
+                    start_time = time.time()
+                    instance = container[key] = cc_type(**kwargs)
+                    profiler.record(cc_type, _PROFILE_CONSTRUCTION, None, time.time() - start_time, 1)
+                if migration_cache_key is not None:
+                    self.deserialization_ctx.migration_cache.put(migration_cache_key, instance)
+                if shared_dict_id is not None:
+                    self.shared_instances[shared_dict_id] = instance
+
+    def _expand(self, d, cls, container, key, stack):
+        shared_dict_id = None
+        if self.shared_instances is not None and id(d) in self.shared_instances:
+            # A dict which is referenced from several places. The traversal is depth-first, so once it's expanded, its
+            # instance is built before any other place which references it is reached
+            shared_dict_id = id(d)
+            shared_instance = self.shared_instances[shared_dict_id]
+            if shared_instance is not None:
+                container[key] = shared_instance
+                return
         cls.check_expected_types_metadata()
+        deserialization_ctx = self.deserialization_ctx
+
+        migration_cache = deserialization_ctx.migration_cache
+        migration_cache_key = None
+        if migration_cache is not None:
+            # The key needs to be computed before deversionize_dict() modifies the dict
+            migration_cache_key = migration_cache.key_for(cls, d)
+            if migration_cache_key is not None:
+                cached_instance = migration_cache.get(migration_cache_key)
+                if cached_instance is not None:
+                    container[key] = cached_instance
+                    return
 
-        deversionied_d = cls.deversionize_dict(d, deserialization_ctx, cc_from_dict_func, cc_to_dict_func)
+        # The shared dicts inside old version records must be converted by this converter as well, so each of them is
+        # converted only once (conversion removes their version info), and their instances are shared with the rest of the input
+        cc_from_dict_func = self.cc_from_dict_func if self.shared_instances is None else self._old_version_from_dict
+        profiler = self.profiler
+        if profiler is None:
+            deversionied_d = cls.deversionize_dict(d, deserialization_ctx, cc_from_dict_func, self.cc_to_dict_func, self.metrics_sink)
+        else:
+            start_time = time.time()
+            deversionied_d = cls.deversionize_dict(d, deserialization_ctx, cc_from_dict_func, self.cc_to_dict_func, self.metrics_sink)
+            profiler.record(cls, _PROFILE_DEVERSIONIZE, None, time.time() - start_time, 0 if deversionied_d is d else 1)
         cls.check_data(deversionied_d)
-        kwargs = {field_name: value_with_cc_support(deversionied_d[field_name], cls.CC_TYPES[field_name])  # pylint: disable=unsubscriptable-object
-                  for field_name, field_type in deversionied_d.iteritems()}
+
+        cc_types = cls.CC_TYPES
+        plan = _get_plan(cls)
+        nested_fields = plan.nested_fields
+        subtype_keys_dict = {field_name: deversionied_d.get(field_name) for field_name in plan.subtype_key_fields}
+
+        kwargs = {}
+        stack.append((_BUILD, cls, kwargs, container, key, migration_cache_key, shared_dict_id))
+        if profiler is not None:
+            self._profiled_expand_fields(deversionied_d, cls, cc_types, nested_fields, subtype_keys_dict, kwargs, stack, profiler)
+            return
+        for field_name, field_value in deversionied_d.iteritems():
+            if field_name in nested_fields:
+                self._nested_value_from_dict(field_value, cc_types[field_name], cls, subtype_keys_dict, kwargs, field_name, stack)
+            else:
+                kwargs[field_name] = self._leaf_value_from_dict(field_value, cc_types[field_name])  # pylint: disable=unsubscriptable-object
+
+    def _old_version_from_dict(self, d, old_version_cc):
+        # When d is itself shared, its old version instance is stored as its shared instance until the migrated instance
+        # is built. Only the fresh dicts of the migrated instance are converted in between, so nothing else can see it
+        result = [None]
+        self._run([(_EXPAND, d, old_version_cc, result, 0)])
+        return result[0]
+
+    def _profiled_expand_fields(self, deversionied_d, cls, cc_types, nested_fields, subtype_keys_dict, kwargs, stack, profiler):
+        # Same as the field loop of _expand(), but reports the cost of each field to the profiler. The cost of nested case
+        # classes is reported separately, under the fields of their own class, once they are expanded and built
+        for field_name, field_value in deversionied_d.iteritems():
+            field_type = cc_types[field_name]  # pylint: disable=unsubscriptable-object
+            start_time = time.time()
+            if field_name in nested_fields:
+                self._nested_value_from_dict(field_value, field_type, cls, subtype_keys_dict, kwargs, field_name, stack)
+                # Only the containers are created at this point. Case classes are stored in kwargs once they are built
+                allocations = 1 if type(kwargs.get(field_name)) in (list, dict) else 0
+            else:
+                converted_value = kwargs[field_name] = self._leaf_value_from_dict(field_value, field_type)
+                allocations = _count_allocations(field_value, converted_value)
+            profiler.record(cls, field_name, field_type, time.time() - start_time, allocations)
+
+    def _nested_value_from_dict(self, v, expected_type, owner_cls, subtype_keys_dict, container, key, stack):
+        # Stores the converted value in container[key]. Case classes are pushed to the work stack, and get built later
+        if v is None:
+            if self.deserialization_ctx.fail_on_null_subtypes:
+                if type(expected_type) is CaseClassSubTypeValue:
+                    raise CaseClassSubTypeCannotBeNullException('Subtype value cannot be null')
+            container[key] = None
+            return
+        if type(expected_type) is CaseClassListType:
+            element_type = expected_type.element_type
+            converted_list = container[key] = [None] * len(v)
+            for i, e in enumerate(v):
+                self._nested_value_from_dict(e, element_type, owner_cls, subtype_keys_dict, converted_list, i, stack)
+        elif type(expected_type) is CaseClassDictType:
+            key_type = expected_type.key_type
+            value_type = expected_type.value_type
+            converted_dict = container[key] = {}
+            for k, e in v.iteritems():
+                self._nested_value_from_dict(e, value_type, owner_cls, subtype_keys_dict, converted_dict, self._leaf_value_from_dict(k, key_type), stack)
+        elif type(expected_type) is CaseClassSelfType:
+            self._push_case_class(v, owner_cls, container, key, stack)
+        elif type(expected_type) is CaseClassSubTypeValue:
+            subtype_key = subtype_keys_dict[expected_type.subtype_key_field_name]
+            expected_subtype = _find_subtype(owner_cls, subtype_key, expected_type.subtype_key_field_name)
+            if self.metrics_sink is not None:
+                self.metrics_sink.increment(SUBTYPE_RESOLUTION, (owner_cls.__name__, expected_subtype.__name__))
+            self._push_case_class(v, expected_subtype, container, key, stack)
+        elif _is_nested_type(expected_type):
+            self._push_case_class(v, expected_type, container, key, stack)
+        else:
+            container[key] = self._leaf_value_from_dict(v, expected_type)
+
+    def _push_case_class(self, v, cc_type, container, key, stack):
+        if isinstance(v, CaseClass):
+            # Already built while the json was parsed (see _OnePassDecoder). An instance of another type is converted
+            # back to a dict, so it gets the same treatment as any other data
+            if type(v) is cc_type:
+                container[key] = v
+                return
+            v = _ToDictConverter(CaseClassSerializationContext()).convert(v)
+        stack.append((_EXPAND, v, cc_type, container, key))
+
+    def _bulk_convert(self, element_type):
+        return self.str_from_unicode if element_type is str else None
+
+    def _leaf_value_from_dict(self, v, expected_type):
+        # Converts values of non-nested types (see _is_nested_type)
+        if expected_type is str:
+            # The most common case - The unicode strings of json are converted according to the string policy
+            value_type = type(v)
+            if value_type is unicode:
+                try:
+                    return self.str_from_unicode(v)
+                except Exception as ee:
+                    raise CaseClassFieldTypeException('Value is of type {} while expected type is {}. Original Error: {}. Actual Value: {}'.format(type(v), expected_type, str(ee), bounded_repr(v)))
+            if value_type is str:
+                return v
+        if v is None:
+            return None
+        if type(expected_type) is CaseClassListType:
+            element_type = expected_type.element_type
+            if element_type in _PRIMITIVE_TYPES:
+                return _primitive_list(v, element_type, self.owns_input, self._leaf_value_from_dict, self._bulk_convert(element_type))
+            if isinstance(element_type, CaseClassCustomType) and element_type.are_deserialized_values(v, self.binary_values):
+                return v if self.owns_input and type(v) is list else list(v)
+            if type(element_type) is CaseClassTypeAsString and not (self.binary_values and element_type.from_binary is not None) and \
+                    set(map(type, v)) <= _STRING_TYPES:
+                try:
+                    return map(element_type.from_string, v)
+                except Exception:
+                    # Converted one by one below, in order to raise the appropriate exception
+                    pass
+            return [self._leaf_value_from_dict(e, element_type) for e in v]
+        if type(expected_type) is CaseClassDictType:
+            key_type = expected_type.key_type
+            value_type = expected_type.value_type
+            if key_type in _PRIMITIVE_TYPES and value_type in _PRIMITIVE_TYPES:
+                return _primitive_dict(v, key_type, value_type, self.owns_input, self._leaf_value_from_dict,
+                                       self._bulk_convert(key_type), self._bulk_convert(value_type))
+            return {self._leaf_value_from_dict(k, key_type): self._leaf_value_from_dict(v, value_type) for k, v in v.iteritems()}
+        if type(expected_type) is CaseClassTypeAsString:
+            if isinstance(v, expected_type.real_type):
+                return v
+            try:
+                if self.binary_values and expected_type.from_binary is not None:
+                    return expected_type.from_binary(v)
+                return expected_type.from_string(v)
+            except Exception as ee:
+                raise CaseClassTypeAsStringException('Could not convert the value {} to the expected type {}. Low-level error:{}'.format(bounded_repr(v), expected_type, str(ee)))
+        if type(expected_type) is CaseClassSubTypeKey:
+            expected_type = str
+        if isinstance(expected_type, CaseClassCustomType):
+            if expected_type.is_deserialized_value(v, self.binary_values):
+                return v
+            try:
+                return expected_type.from_binary_value(v) if self.binary_values else expected_type.from_json_value(v)
+            except Exception as ee:
+                raise CaseClassFieldTypeException('Could not convert the value {} to the expected type {}. Low-level error:{}'.format(bounded_repr(v), expected_type, str(ee)))
+        if isinstance(v, expected_type):
+            return v
+        else:
+            try:
+                return expected_type(v)
+            except Exception as ee:
+                raise CaseClassFieldTypeException('Value is of type {} while expected type is {}. Original Error: {}. Actual Value: {}'.format(type(v), expected_type, str(ee), bounded_repr(v)))
+
+
+class _OnePassRegistry(object):
+    """
+    The case classes which _OnePassDecoder can build while parsing json into a specific root case class - All the case
+    classes which are reachable from the root through CC_TYPES, keyed by their current versioned type string. Subtypes
+    are not included, since they are known only from the data.
+
+    If any reachable field can hold arbitrary json objects (e.g. a plain dict field, or any other non-primitive type),
+    the registry is disabled, since an object inside such a field could be mistaken for a case class.
+    """
+
+    def __init__(self, root_cls):
+        # versioned type string -> (case class, frozenset of the expected keys, including _ccvt)
+        self.classes_by_ccvt = {}
+        self.enabled = True
+        ambiguous_ccvts = set()
+        visited = set()
+        types_to_visit = [root_cls]
+        while types_to_visit:
+            t = types_to_visit.pop()
+            tt = type(t)
+            if tt is CaseClassListType:
+                types_to_visit.append(t.element_type)
+            elif tt is CaseClassDictType:
+                types_to_visit.extend([t.key_type, t.value_type])
+            elif tt in (CaseClassSelfType, CaseClassSubTypeValue, CaseClassSubTypeKey, CaseClassTypeAsString):
+                pass
+            elif isinstance(t, type) and issubclass(t, CaseClass):
+                if t in visited:
+                    continue
+                visited.add(t)
+                if not isinstance(t.CC_TYPES, OrderedDict):
+                    self.enabled = False
+                    return
+                ccvt = _get_plan(t).versioned_type_str
+                if ccvt in self.classes_by_ccvt and self.classes_by_ccvt[ccvt][0] is not t:
+                    ambiguous_ccvts.add(ccvt)
+                self.classes_by_ccvt[ccvt] = t, frozenset(t.CC_TYPES.keys() + ['_ccvt'])
+                types_to_visit.extend(t.CC_TYPES.values())
+            elif t not in _PRIMITIVE_TYPES:
+                self.enabled = False
+                return
+        for ccvt in ambiguous_ccvts:
+            del self.classes_by_ccvt[ccvt]
+
+
+_one_pass_registries = {}
+
+
+def _get_one_pass_registry(cls):
+    try:
+        return _one_pass_registries[cls]
+    except KeyError:
+        return _one_pass_registries.setdefault(cls, _OnePassRegistry(cls))
+
+
+class _OnePassDecoder(object):
+    """
+    Builds case classes while json is being parsed, using an object_pairs_hook, so the dicts of the case classes are
+    not kept around, and are not traversed again after parsing.
+
+    Only objects which are certainly case classes of the current version are built - Their _ccvt is in the registry
+    of the root type, their keys are exactly the fields of the case class, and all their nested case class values have
+    already been built. All other objects are returned as dicts, and get converted by _FromDictConverter afterwards
+    (which accepts the instances that have already been built inside them). This keeps the semantics of old-version
+    data, subtypes and unversioned data unchanged.
+    """
+
+    def __init__(self, deserialization_ctx, registry):
+        self.classes_by_ccvt = registry.classes_by_ccvt
+        # The lists and dicts which the hook gets have just been parsed
+        self.converter = _FromDictConverter(deserialization_ctx, None, None, owns_input=True)
+
+    def object_pairs_hook(self, pairs):
+        d = dict(pairs)
+        entry = self.classes_by_ccvt.get(d.get('_ccvt'))
+        if entry is None:
+            return d
+        cls, expected_keys = entry
+        if d.viewkeys() != expected_keys:
+            return d
+        cc_types = cls.CC_TYPES
+        nested_fields = _get_plan(cls).nested_fields
+        leaf_value_from_dict = self.converter._leaf_value_from_dict
+        kwargs = {}
+        for field_name, v in d.iteritems():
+            if field_name == '_ccvt':
+                continue
+            field_type = cc_types[field_name]
+            if field_name in nested_fields:
+                if not self._is_built(v, field_type, cls):
+                    return d
+                if type(field_type) is CaseClassDictType and v is not None:
+                    key_type = field_type.key_type
+                    v = {leaf_value_from_dict(k, key_type): e for k, e in v.iteritems()}
+                kwargs[field_name] = v
+            else:
+                kwargs[field_name] = leaf_value_from_dict(v, field_type)
         return cls(**kwargs)
 
+    def _is_built(self, v, expected_type, owner_cls):
+        tt = type(expected_type)
+        if tt is CaseClassSubTypeValue:
+            return False
+        if v is None:
+            return True
+        if tt is CaseClassListType:
+            return type(v) is list and all(self._is_built(e, expected_type.element_type, owner_cls) for e in v)
+        if tt is CaseClassDictType:
+            return type(v) is dict and all(self._is_built(e, expected_type.value_type, owner_cls) for e in v.itervalues())
+        if tt is CaseClassSelfType:
+            return type(v) is owner_cls
+        return type(v) is expected_type
+
 
 def default_to_version_1_func(cc_type, d):
     return 1
 
 
 class CaseClassJsonSerialization(object):
+    # Serializations which can store raw bytes set this to True, and get the values of binary field types (e.g. cc_array)
+    # as bytes instead of their json representation
+    binary_values = False
+
     def __init__(self, encoding='utf-8', **json_kwargs):
         self.encoding = encoding
         self.json_kwargs = json_kwargs
@@ -488,8 +1342,8 @@ class CaseClassJsonSerialization(object):
             effective_kwargs = self.json_kwargs
         return json.dumps(d, **effective_kwargs)
 
-    def deserialize(self, s):
-        return json.loads(s, encoding=self.encoding)
+    def deserialize(self, s, **kwargs):
+        return json.loads(s, encoding=self.encoding, **kwargs)
 
 
 cc_compact_json_serialization = CaseClassJsonSerialization(indent=None, separators=(',', ':'), sort_keys=False)
@@ -498,30 +1352,65 @@ cc_pretty_json_serialization = CaseClassJsonSerialization(indent=2, separators=(
 
 
 class CaseClassSerializationContext(object):
-    def __init__(self, force_unversioned_serialization=False):
+    def __init__(self, force_unversioned_serialization=False, preserve_references=False):
         self.force_unversioned_serialization = force_unversioned_serialization
+        # When true, a case class instance which is referenced from several places is serialized once, and the other
+        # places hold a reference to it. Deserialization recreates a single shared instance
+        self.preserve_references = preserve_references
 
 
 class CaseClassDeserializationContext(object):
-    def __init__(self, fail_on_unversioned_data=True, fail_on_incompatible_types=True, external_version_provider_func=None, fail_on_null_subtypes=False):
+    def __init__(self, fail_on_unversioned_data=True, fail_on_incompatible_types=True, external_version_provider_func=None, fail_on_null_subtypes=False,
+                 migration_cache=None, one_pass_decoding=False, string_policy=STRING_POLICY_ASCII):
+        if string_policy not in _STRING_POLICY_CONVERTERS:
+            raise CaseClassInvalidParameterException('string_policy must be one of {}. Got {}'.format(', '.join(sorted(_STRING_POLICY_CONVERTERS)), repr(string_policy)))
         self.fail_on_unversioned_data = fail_on_unversioned_data
         self.fail_on_incompatible_types = fail_on_incompatible_types
         self.external_version_provider_func = external_version_provider_func
         self.fail_on_null_subtypes = fail_on_null_subtypes
+        # Optional serium.caches.CaseClassMigrationCache instance, holding the results of migrating old-version data
+        self.migration_cache = migration_cache
+        # When true, cc_from_json_str() builds current-version case classes while parsing the json (see _OnePassDecoder)
+        self.one_pass_decoding = one_pass_decoding
+        # How the unicode strings of deserialized data are converted into the values of str fields (see STRING_POLICY_ASCII)
+        self.string_policy = string_policy
+
+
+# The serialization context of the dicts of migrated instances (see SeriumEnv._migrated_instance_to_dict)
+_MIGRATION_SERIALIZATION_CTX = CaseClassSerializationContext()
 
 
 class SeriumEnv(object):
-    def __init__(self, serialization_ctx, deserialization_ctx, serialization):
+    def __init__(self, serialization_ctx, deserialization_ctx, serialization, deserialization_cache=None, metrics_sink=None):
         self.serialization_ctx = serialization_ctx
         self.deserialization_ctx = deserialization_ctx
         self.serialization = serialization
+        # Optional serium.caches.CaseClassDeserializationCache instance, holding the results of cc_from_json_str() by payload
+        self.deserialization_cache = deserialization_cache
+        # Optional serium.metrics.MetricsSink instance, which gets counters and timings of conversions and migrations
+        self.metrics_sink = metrics_sink
 
     def cc_to_dict(self, cc):
         if isinstance(cc, list):
             return [self.cc_to_dict(e) for e in cc]
         if not isinstance(cc, CaseClass):
-            raise CaseClassInvalidParameterException('Must provide a case class ({})'.format(cc))
-        return cc._to_dict(self.serialization_ctx)
+            raise CaseClassInvalidParameterException('Must provide a case class ({})'.format(bounded_repr(cc)))
+        return self._to_dict(cc, self.serialization_ctx)
+
+    def _migrated_instance_to_dict(self, cc):
+        # Migrated instances are converted back to dicts, which are then read as the current version (see deversionize_dict()).
+        # These dicts are never serialized, so they are versioned and hold no references, whatever the serialization context is
+        return self._to_dict(cc, _MIGRATION_SERIALIZATION_CTX)
+
+    def _to_dict(self, cc, serialization_ctx):
+        metrics_sink = self.metrics_sink
+        binary_values = getattr(self.serialization, 'binary_values', False)
+        if metrics_sink is None:
+            return cc._to_dict(serialization_ctx, binary_values=binary_values)
+        start_time = time.time()
+        d = cc._to_dict(serialization_ctx, metrics_sink, binary_values)
+        metrics_sink.timing(CC_TO_DICT, (cc.__class__.__name__,), time.time() - start_time)
+        return d
 
     # Experimental - One way conversion only
     def dict_with_cc_to_dict(self, d):
@@ -543,22 +1432,115 @@ class SeriumEnv(object):
     def cc_from_json_str(self, s, cc_type):
         if isinstance(cc_type, CaseClass):
             raise CaseClassInvalidParameterException('Must provide a case class type (actual type is {})'.format(type(cc_type)))
-        d = self.serialization.deserialize(s)
-        return self.cc_from_dict(d, cc_type)
+        deserialization_cache = self.deserialization_cache
+        if deserialization_cache is not None:
+            cache_key = deserialization_cache.key_for(s, cc_type)
+            cached_instance = deserialization_cache.get(cache_key)
+            if cached_instance is not None:
+                return cached_instance
+
+        if self._can_decode_in_one_pass(cc_type):
+            instance = self._decode_in_one_pass(s, cc_type)
+        else:
+            d = self.serialization.deserialize(s)
+            instance = self._cc_from_dict(d, cc_type, owns_input=True)
+
+        if deserialization_cache is not None:
+            deserialization_cache.put(cache_key, instance)
+        return instance
+
+    def _can_decode_in_one_pass(self, cc_type):
+        # The field profiler attributes costs to the fields of _FromDictConverter, so it gets the regular path
+        return self.deserialization_ctx.one_pass_decoding and isinstance(self.serialization, CaseClassJsonSerialization) and \
+            _active_profiler is None and isinstance(cc_type, type) and issubclass(cc_type, CaseClass) and \
+            _get_one_pass_registry(cc_type).enabled
+
+    def _decode_in_one_pass(self, s, cc_type):
+        metrics_sink = self.metrics_sink
+        start_time = time.time()
+        decoder = _OnePassDecoder(self.deserialization_ctx, _get_one_pass_registry(cc_type))
+        d = self.serialization.deserialize(s, object_pairs_hook=decoder.object_pairs_hook)
+        if type(d) is not cc_type:
+            if isinstance(d, CaseClass):
+                d = _ToDictConverter(CaseClassSerializationContext()).convert(d)
+            return self._cc_from_dict(d, cc_type, owns_input=True)
+        if metrics_sink is not None:
+            metrics_sink.timing(CC_FROM_DICT, (cc_type.__name__,), time.time() - start_time)
+        return d
 
     def cc_from_dict(self, d, cc_type, raise_on_empty=True):
+        return self._cc_from_dict(d, cc_type, raise_on_empty)
+
+    def _cc_from_dict(self, d, cc_type, raise_on_empty=True, owns_input=False):
+        # The lists and dicts of d are copied into the instance, unless d is owned by the caller (see _FromDictConverter)
         if d is None:
             if raise_on_empty:
                 raise CaseClassInvalidParameterException('Could not create case class {} - Empty input'.format(cc_type))
             else:
                 return None
         if not isinstance(d, dict):
-            raise CaseClassInvalidParameterException('Must provide a dict to convert to a case class. Provided object of type {}. value {}'.format(type(d), d))
-        return cc_type._from_dict(d, self.deserialization_ctx, self.cc_from_dict, self.cc_to_dict)
+            raise CaseClassInvalidParameterException('Must provide a dict to convert to a case class. Provided object of type {}. value {}'.format(type(d), bounded_repr(d)))
+        metrics_sink = self.metrics_sink
+        binary_values = getattr(self.serialization, 'binary_values', False)
+        if metrics_sink is None:
+            return cc_type._from_dict(d, self.deserialization_ctx, self.cc_from_dict, self._migrated_instance_to_dict, owns_input=owns_input, binary_values=binary_values)
+        start_time = time.time()
+        instance = cc_type._from_dict(d, self.deserialization_ctx, self.cc_from_dict, self._migrated_instance_to_dict, metrics_sink, owns_input, binary_values)
+        metrics_sink.timing(CC_FROM_DICT, (cc_type.__name__,), time.time() - start_time)
+        return instance
+
+    def cc_from_dict_batch(self, ds, cc_type, owns_input=False):
+        """
+        Converts a list of dicts into a list of cc_type instances, in the same order. Records of old versions of cc_type
+        are grouped by their source version, and each group is migrated using migrate_batch(), so batch migrations (see
+        CC_BATCH_MIGRATIONS) get whole groups at once. Other records (current version, unversioned, etc.) and nested case
+        classes are converted the same way as in cc_from_dict().
+
+        Pass owns_input=True when the dicts have been created for this call only (e.g. by parsing json), so their lists
+        and dicts of primitive values are used by the instances without being copied
+        """
+        if isinstance(cc_type, CaseClass):
+            raise CaseClassInvalidParameterException('Must provide a case class type (actual type is {})'.format(type(cc_type)))
+        migration_cache = self.deserialization_ctx.migration_cache
+        results = [None] * len(ds)
+        # source version -> (source versioned type, indexes of the records, old version instances, migration cache keys)
+        groups = OrderedDict()
+        for i, d in enumerate(ds):
+            ccvt = _old_version_of(d, cc_type)
+            if ccvt is None:
+                results[i] = self._cc_from_dict(d, cc_type, owns_input=owns_input)
+                continue
+            migration_cache_key = migration_cache.key_for(cc_type, d) if migration_cache is not None else None
+            if migration_cache_key is not None:
+                cached_instance = migration_cache.get(migration_cache_key)
+                if cached_instance is not None:
+                    results[i] = cached_instance
+                    continue
+            group = groups.get(ccvt.version)
+            if group is None:
+                group = groups[ccvt.version] = ccvt, [], [], []
+            group[1].append(i)
+            group[2].append(self._cc_from_dict(d, find_versioned_cc(cc_type, ccvt), owns_input=owns_input))
+            group[3].append(migration_cache_key)
+        for ccvt, indexes, old_instances, migration_cache_keys in groups.itervalues():
+            migrated_instances = cc_type.migrate_batch(old_instances, ccvt, self.metrics_sink)
+            for i, migrated_instance, migration_cache_key in itertools.izip(indexes, migrated_instances, migration_cache_keys):
+                # Same as in deversionize_dict() - The migrated instance is read back as cc_type, so the results are the
+                # same as those of cc_from_dict() (e.g. old versions of nested instances are migrated as well)
+                instance = results[i] = self._cc_from_dict(self._migrated_instance_to_dict(migrated_instance), cc_type, owns_input=True)
+                if migration_cache_key is not None:
+                    migration_cache.put(migration_cache_key, instance)
+        return results
+
+    def cc_from_json_str_batch(self, strs, cc_type):
+        """
+        Same as cc_from_dict_batch(), for a list of serialized records. The deserialization cache is not used
+        """
+        return self.cc_from_dict_batch([self.serialization.deserialize(s) for s in strs], cc_type, owns_input=True)
 
     def cc_check(self, o, cc_type):
         if not isinstance(o, cc_type):
-            raise CaseClassTypeCheckException('Object is not of type {}. Object: {}'.format(cc_type, repr(o)))
+            raise CaseClassTypeCheckException('Object is not of type {}. Object: {}'.format(cc_type, bounded_repr(o)))
 
 
 def create_default_env():
@@ -588,5 +1570,53 @@ def cc_from_dict(d, cc_type, raise_on_empty=True):
     return default_env.cc_from_dict(d, cc_type, raise_on_empty)
 
 
+def cc_from_dict_batch(ds, cc_type, owns_input=False):
+    return default_env.cc_from_dict_batch(ds, cc_type, owns_input)
+
+
+def cc_from_json_str_batch(strs, cc_type):
+    return default_env.cc_from_json_str_batch(strs, cc_type)
+
+
 def cc_check(o, cc_type):
     return default_env.cc_check(o, cc_type)
+
+
+# Objects which are shared by the whole program, and are not counted as part of the size of values - Classes, modules,
+# functions and methods. The stdlib types module is shadowed by serium.types in here
+_SIZEOF_EXCLUDED_TYPES = (type, type(sys), type(normalize_type_name), type(len), type(CaseClass.copy))
+
+
+def cc_sizeof(o, seen=None):
+    """
+    Returns the deep memory footprint of o in bytes, as reported by sys.getsizeof() for o and everything it references -
+    Nested case classes, containers and field values. Objects which are referenced more than once are counted once.
+    In order to measure the total size of several objects, pass the same set as seen to all the calls
+    """
+    if seen is None:
+        seen = set()
+    total = 0
+    stack = [o]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _SIZEOF_EXCLUDED_TYPES):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.iterkeys())
+            stack.extend(obj.itervalues())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        else:
+            obj_dict = getattr(obj, '__dict__', None)
+            if type(obj_dict) is dict:
+                stack.append(obj_dict)
+            for t in type(obj).__mro__:
+                slot_names = t.__dict__.get('__slots__', ())
+                if isinstance(slot_names, basestring):
+                    slot_names = (slot_names,)
+                for slot_name in slot_names:
+                    if slot_name not in ('__dict__', '__weakref__') and hasattr(obj, slot_name):
+                        stack.append(getattr(obj, slot_name))
+    return total
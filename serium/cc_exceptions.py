@@ -1,4 +1,5 @@
 #!/usr/bin/env python
+from serium.utils import bounded_repr
 
 
 class CaseClassException(StandardError):
@@ -37,7 +38,7 @@ class MigrationFunctionCaseClassException(CaseClassException):
         self.e = e
         super(MigrationFunctionCaseClassException, self).__init__(
             'Exception while applying migration function on instance {} from version {} to version {}. Original exception is {}'.format(
-                intermediate_instance, from_version, to_version, e))
+                bounded_repr(intermediate_instance), from_version, to_version, e))
 
 
 class MigrationPathNotFoundCaseClassException(CaseClassException):
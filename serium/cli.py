@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+import argparse
+import importlib
+import logging
+import sys
+
+from serium.cc_exceptions import CaseClassCannotBeFoundException
+from serium.migration import migrate_file, DEFAULT_CHUNK_SIZE, DEFAULT_CHECKPOINT_INTERVAL
+
+
+def import_cc_type(type_path):
+    """
+    Get a case class type from its full path, e.g. 'mypackage.mymodule.MyClass' or 'mypackage.mymodule:MyClass'
+    """
+    if ':' in type_path:
+        module_name, type_name = type_path.split(':', 1)
+    else:
+        module_name, _, type_name = type_path.rpartition('.')
+    try:
+        return getattr(importlib.import_module(module_name), type_name)
+    except (ImportError, AttributeError, ValueError) as e:
+        raise CaseClassCannotBeFoundException('Could not find case class {}. {}'.format(type_path, e))
+
+
+def run_migrate(args):
+    cc_type = import_cc_type(args.cc_type)
+    report = migrate_file(args.input, args.output, cc_type, processes=args.processes, chunk_size=args.chunk_size,
+                          checkpoint_interval=args.checkpoint_interval, resume=not args.no_resume)
+    print "Migrated {} records into {} ({} of them in a previous run)".format(report.total, args.output, report.resumed_from)
+    for version, count in sorted(report.version_counts.iteritems()):
+        print "  {}: {}".format(version, count)
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(prog='serium')
+    subparsers = parser.add_subparsers(title='commands')
+
+    migrate_parser = subparsers.add_parser('migrate', help='Migrate a json-lines file of serialized case classes to the current version of the case class')
+    migrate_parser.add_argument('input', help='Input json-lines file')
+    migrate_parser.add_argument('output', help='Output json-lines file. Written atomically once all records have been migrated')
+    migrate_parser.add_argument('-t', '--type', dest='cc_type', required=True, help='Full path of the case class type, e.g. mypackage.mymodule.MyClass')
+    migrate_parser.add_argument('-p', '--processes', type=int, default=1, help='Number of worker processes. Defaults to 1')
+    migrate_parser.add_argument('-c', '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Number of records per work unit. Defaults to %(default)s')
+    migrate_parser.add_argument('--checkpoint-interval', type=int, default=DEFAULT_CHECKPOINT_INTERVAL,
+                                help='Number of chunks between checkpoints. Defaults to %(default)s')
+    migrate_parser.add_argument('--no-resume', action='store_true', help="Start from scratch, even if there's a checkpoint of a previous run")
+    migrate_parser.set_defaults(func=run_migrate)
+
+    return parser
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.WARNING)
+    args = create_parser().parse_args(argv)
+    args.func(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
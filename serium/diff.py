@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+from serium.caseclasses import CaseClass, default_env, _ToDictConverter, _FromDictConverter, _get_plan, _is_nested_type, \
+    _leaf_value_to_dict, _values_equal, _EXPAND, _BUILD
+from serium.cc_exceptions import CaseClassInvalidParameterException, CaseClassUnknownFieldException
+from serium.digest import _cached_digest
+from serium.types import CaseClassListType, CaseClassDictType
+from serium.utils import bounded_repr
+
+__all__ = ['cc_diff', 'cc_apply_patch', 'cc_patch_to_json_str', 'cc_patch_from_json_str', 'PATCH_FORMAT_VERSION']
+
+# Version of the patch format, stored in each patch under _ccpatch
+PATCH_FORMAT_VERSION = 1
+
+# A patch is a dict of {'_ccpatch': format version, '_ccvt': versioned type of the instances, 'fields': field changes},
+# where field changes is a dict from field name to the change of that field. Unchanged fields are omitted. A change is one of:
+#   {'v': value} - The field has a new value, converted the same way as in cc_to_dict()
+#   {'f': field changes} - The field holds an instance of the same type, which has the given field changes
+#   {'l': [[index, change], ...]} - The field holds a list of the same length, whose elements at the given indexes have changed
+#   {'d': [[key, change], ...], 'r': [key, ...]} - The field holds a dict, whose values at the given keys have changed (or
+#                                                   have been added), and whose 'r' keys have been removed
+_VALUE = 'v'
+_FIELDS = 'f'
+_LIST = 'l'
+_DICT = 'd'
+_REMOVED = 'r'
+
+
+def _check_instance(cc):
+    if not isinstance(cc, CaseClass):
+        raise CaseClassInvalidParameterException('Expected a case class instance. Got {}'.format(bounded_repr(cc)))
+
+
+class _Differ(object):
+    def __init__(self, env):
+        self.converter = _ToDictConverter(env.serialization_ctx, binary_values=getattr(env.serialization, 'binary_values', False))
+        self.binary_values = self.converter.binary_values
+
+    def diff(self, old, new):
+        """
+        Returns the field changes between old and new, which are instances of the same type.
+
+        Nested instances are compared using a work stack, so deep structures do not hit the recursion limit. Changes of
+        nested containers and instances are created before their contents are compared, and the empty ones are removed
+        at the end
+        """
+        root_changes = {}
+        # Work items are (old instance, new instance, field changes), meaning that the changes between the instances should be stored in field changes
+        stack = [(old, new, root_changes)]
+        # (container, key, change) of the changes of nested containers and instances, in creation order
+        nested_changes = []
+        while stack:
+            old_cc, new_cc, changes = stack.pop()
+            cls = new_cc.__class__
+            cc_types = cls.CC_TYPES
+            nested_fields = _get_plan(cls).nested_fields
+            old_dict = old_cc.__dict__
+            for field_name, new_v in new_cc.__dict__.iteritems():
+                old_v = old_dict[field_name]
+                if old_v is new_v:
+                    continue
+                if field_name in nested_fields:
+                    self._diff_nested_value(old_v, new_v, cc_types[field_name], new_cc, changes, field_name, stack, nested_changes)
+                elif not _values_equal(old_v, new_v):
+                    changes[field_name] = {_VALUE: _leaf_value_to_dict(new_v, cc_types[field_name], self.binary_values)}
+        # Children are created after their parents, so they are handled first
+        for container, key, change in reversed(nested_changes):
+            if not any(change.itervalues()):
+                del container[key]
+            elif _LIST in change:
+                change[_LIST] = sorted(change[_LIST].iteritems())
+            elif _DICT in change:
+                change[_DICT] = change[_DICT].items()
+                if not change[_REMOVED]:
+                    del change[_REMOVED]
+        return root_changes
+
+    def _diff_nested_value(self, old_v, new_v, expected_type, new_owner, container, key, stack, nested_changes):
+        if old_v is new_v:
+            return
+        tt = type(expected_type)
+        if old_v is None or new_v is None:
+            pass
+        elif tt is CaseClassListType:
+            if len(old_v) == len(new_v):
+                element_type = expected_type.element_type
+                change = container[key] = {_LIST: {}}
+                nested_changes.append((container, key, change))
+                for i, (old_e, new_e) in enumerate(zip(old_v, new_v)):
+                    self._diff_nested_value(old_e, new_e, element_type, new_owner, change[_LIST], i, stack, nested_changes)
+                return
+        elif tt is CaseClassDictType:
+            key_type = expected_type.key_type
+            value_type = expected_type.value_type
+            change = container[key] = {_DICT: {}, _REMOVED: [_leaf_value_to_dict(k, key_type, self.binary_values) for k in old_v if k not in new_v]}
+            nested_changes.append((container, key, change))
+            for k, new_e in new_v.iteritems():
+                converted_key = _leaf_value_to_dict(k, key_type, self.binary_values)
+                if k in old_v:
+                    self._diff_nested_value(old_v[k], new_e, value_type, new_owner, change[_DICT], converted_key, stack, nested_changes)
+                else:
+                    change[_DICT][converted_key] = {_VALUE: self.converter.convert_value(new_e, value_type, new_owner)}
+            return
+        elif isinstance(new_v, CaseClass) and type(old_v) is type(new_v):
+            old_digest = _cached_digest(old_v)
+            if old_digest is not None and old_digest == _cached_digest(new_v):
+                return
+            change = container[key] = {_FIELDS: {}}
+            nested_changes.append((container, key, change))
+            stack.append((old_v, new_v, change[_FIELDS]))
+            return
+        elif not _is_nested_type(expected_type):
+            # An element of a list or dict of leaf values
+            if not _values_equal(old_v, new_v):
+                container[key] = {_VALUE: _leaf_value_to_dict(new_v, expected_type, self.binary_values)}
+            return
+        container[key] = {_VALUE: self.converter.convert_value(new_v, expected_type, new_owner)}
+
+
+def cc_diff(old, new, env=None):
+    """
+    Returns a patch which turns old into new, which are instances of the same case class. Only the changed fields are
+    included in the patch, and nested instances which are identical (or have the same cached digest, see cc_digest())
+    are not compared at all. The patch is a dict, and its values are converted the same way as in env.cc_to_dict(), so
+    it can be serialized using env.serialization (see cc_patch_to_json_str())
+    """
+    _check_instance(old)
+    _check_instance(new)
+    if type(old) is not type(new):
+        raise CaseClassInvalidParameterException('Cannot diff instances of different types {} and {}'.format(type(old), type(new)))
+    env = env if env is not None else default_env
+    return {'_ccpatch': PATCH_FORMAT_VERSION, '_ccvt': _get_plan(type(new)).versioned_type_str, 'fields': _Differ(env).diff(old, new)}
+
+
+class _Patcher(object):
+    def __init__(self, env):
+        self.converter = _FromDictConverter(env.deserialization_ctx, env.cc_from_dict, env._migrated_instance_to_dict,
+                                            binary_values=getattr(env.serialization, 'binary_values', False))
+
+    def apply(self, base, field_changes):
+        """
+        Applies field changes to base, and returns the resulting instance.
+
+        Like the converters, patched nested instances are handled using a work stack, so the depth of the patch is not
+        limited by the recursion limit. Each patched instance is first expanded - Its changes are applied to a copy of
+        its fields, and its patched nested instances are pushed to the stack above a build item for the instance itself
+        """
+        result = [None]
+        # Work items are either (_EXPAND, base instance, field changes, container, key) or (_BUILD, case class type,
+        # kwargs, container, key). Both mean that the resulting instance should be stored in container[key]
+        stack = [(_EXPAND, base, field_changes, result, 0)]
+        while stack:
+            item = stack.pop()
+            if item[0] is _EXPAND:
+                self._expand(item[1], item[2], item[3], item[4], stack)
+            else:
+                _, cls, kwargs, container, key = item
+                container[key] = cls(**kwargs)
+        return result[0]
+
+    def _expand(self, base, field_changes, container, key, stack):
+        if not isinstance(field_changes, dict):
+            raise CaseClassInvalidParameterException('Invalid patch field changes {}'.format(bounded_repr(field_changes)))
+        cls = base.__class__
+        cc_types = cls.CC_TYPES
+        plan = _get_plan(cls)
+        kwargs = dict(base.__dict__)
+        stack.append((_BUILD, cls, kwargs, container, key))
+        # Leaf fields are patched first, since the subtype keys determine the types of the subtype values
+        for field_name, change in field_changes.iteritems():
+            if field_name not in cc_types:
+                raise CaseClassUnknownFieldException('Field {} is not part of case class {}'.format(field_name, cls))
+            if field_name not in plan.nested_fields:
+                kwargs[field_name] = self.converter._leaf_value_from_dict(self._value(change), cc_types[field_name])
+        subtype_keys_dict = {field_name: kwargs[field_name] for field_name in plan.subtype_key_fields}
+        for field_name, change in field_changes.iteritems():
+            if field_name in plan.nested_fields:
+                self._apply_change(base.__dict__[field_name], change, cc_types[field_name], cls, subtype_keys_dict, kwargs, field_name, stack)
+
+    def _value(self, change):
+        try:
+            return change[_VALUE]
+        except (KeyError, TypeError):
+            raise CaseClassInvalidParameterException('Invalid patch change {}'.format(bounded_repr(change)))
+
+    def _apply_change(self, base_v, change, expected_type, owner_cls, subtype_keys_dict, container, key, stack):
+        # Stores the patched value in container[key]. Patched instances are pushed to the work stack, and get built later
+        if not isinstance(change, dict):
+            raise CaseClassInvalidParameterException('Invalid patch change {}'.format(bounded_repr(change)))
+        try:
+            if _VALUE in change:
+                container[key] = self.converter.convert_value(change[_VALUE], expected_type, owner_cls, subtype_keys_dict)
+                return
+            if _FIELDS in change and isinstance(base_v, CaseClass):
+                stack.append((_EXPAND, base_v, change[_FIELDS], container, key))
+                return
+            if _LIST in change and type(expected_type) is CaseClassListType:
+                element_type = expected_type.element_type
+                new_list = container[key] = list(base_v)
+                for i, element_change in change[_LIST]:
+                    self._apply_change(base_v[i], element_change, element_type, owner_cls, subtype_keys_dict, new_list, i, stack)
+                return
+            if _DICT in change and type(expected_type) is CaseClassDictType:
+                key_type = expected_type.key_type
+                value_type = expected_type.value_type
+                new_dict = container[key] = dict(base_v)
+                for k in change.get(_REMOVED, []):
+                    del new_dict[self.converter._leaf_value_from_dict(k, key_type)]
+                for k, value_change in change[_DICT]:
+                    k = self.converter._leaf_value_from_dict(k, key_type)
+                    self._apply_change(base_v.get(k), value_change, value_type, owner_cls, subtype_keys_dict, new_dict, k, stack)
+                return
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            raise CaseClassInvalidParameterException('Patch does not match the patched instance. Change {}. Low-level error:{}'.format(bounded_repr(change), str(e)))
+        raise CaseClassInvalidParameterException('Patch does not match the patched instance. Change {}'.format(bounded_repr(change)))
+
+
+def cc_apply_patch(base, patch, env=None):
+    """
+    Applies a patch created by cc_diff() to base, and returns the resulting instance. The parts of base which are not
+    changed by the patch are shared with the resulting instance, and are not copied
+    """
+    _check_instance(base)
+    if not isinstance(patch, dict) or patch.get('_ccpatch') != PATCH_FORMAT_VERSION or not isinstance(patch.get('fields'), dict):
+        raise CaseClassInvalidParameterException('Invalid patch {}'.format(bounded_repr(patch)))
+    versioned_type_str = _get_plan(type(base)).versioned_type_str
+    if patch.get('_ccvt') != versioned_type_str:
+        raise CaseClassInvalidParameterException('Patch of {} cannot be applied to an instance of {}'.format(patch.get('_ccvt'), versioned_type_str))
+    env = env if env is not None else default_env
+    return _Patcher(env).apply(base, patch['fields'])
+
+
+def cc_patch_to_json_str(patch, env=None, **kwargs):
+    env = env if env is not None else default_env
+    return env.serialization.serialize(patch, **kwargs)
+
+
+def cc_patch_from_json_str(s, env=None):
+    env = env if env is not None else default_env
+    return env.serialization.deserialize(s)
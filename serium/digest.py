@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+import hashlib
+import json
+import weakref
+
+from serium.caseclasses import CaseClass, CaseClassSerializationContext, _ToDictConverter, _get_plan, _leaf_value_to_dict
+from serium.cc_exceptions import CaseClassInvalidParameterException, CaseClassUnexpectedTypeException
+from serium.types import CaseClassListType, CaseClassDictType
+from serium.utils import bounded_repr
+
+__all__ = ['cc_digest', 'cc_to_canonical_json']
+
+# The canonical encoding is json with sorted keys, no whitespace and escaped non-ASCII characters, so it's deterministic
+CANONICAL_JSON_KWARGS = dict(sort_keys=True, separators=(',', ':'), ensure_ascii=True)
+# json.dumps() creates a new encoder on each call when it gets non-default parameters
+_canonical_encoder = json.JSONEncoder(**CANONICAL_JSON_KWARGS)
+
+# id of instance -> (weak reference to the instance, hex digest of the instance). Entries are removed when their
+# instances are garbage collected
+_digests = {}
+
+
+def cc_to_canonical_json(cc):
+    """
+    Returns the canonical json encoding of a case class instance - Its versioned dict, encoded with sorted keys and no
+    whitespace. Equal instances always have the same encoding, regardless of the order of their dict fields
+    """
+    if not isinstance(cc, CaseClass):
+        raise CaseClassInvalidParameterException('Expected a case class instance. Got {}'.format(bounded_repr(cc)))
+    return _canonical_encoder.encode(_ToDictConverter(CaseClassSerializationContext()).convert(cc))
+
+
+def _cached_digest(cc):
+    entry = _digests.get(id(cc))
+    if entry is not None and entry[0]() is cc:
+        return entry[1]
+    return None
+
+
+def _cache_digest(cc, digest):
+    cc_id = id(cc)
+    _digests[cc_id] = weakref.ref(cc, lambda _, cc_id=cc_id: _digests.pop(cc_id, None)), digest
+
+
+def _nested_instances(v, expected_type):
+    # Returns the case class instances inside v, which is the value of a nested field (see _is_nested_type)
+    if v is None:
+        return []
+    if type(expected_type) is CaseClassListType:
+        return [i for e in v for i in _nested_instances(e, expected_type.element_type)]
+    if type(expected_type) is CaseClassDictType:
+        return [i for e in v.itervalues() for i in _nested_instances(e, expected_type.value_type)]
+    if not isinstance(v, CaseClass):
+        raise CaseClassUnexpectedTypeException("Expected CaseClass of type {} and got instead value of type {}. Value is {}".format(expected_type, type(v), bounded_repr(v)))
+    return [v]
+
+
+def _nested_value_digests(v, expected_type):
+    # Same structure as v, with the digests of the case class instances (which are already computed) instead of the instances
+    if v is None:
+        return None
+    if type(expected_type) is CaseClassListType:
+        element_type = expected_type.element_type
+        return [_nested_value_digests(e, element_type) for e in v]
+    if type(expected_type) is CaseClassDictType:
+        key_type = expected_type.key_type
+        value_type = expected_type.value_type
+        return {_leaf_value_to_dict(k, key_type): _nested_value_digests(e, value_type) for k, e in v.iteritems()}
+    return _cached_digest(v)
+
+
+def _instance_digest(cc):
+    # The digests of the nested instances of cc must already be cached
+    cls = cc.__class__
+    cc_types = cls.CC_TYPES
+    plan = _get_plan(cls)
+    nested_fields = plan.nested_fields
+    encoded_fields = {}
+    for field_name, field_value in cc.__dict__.iteritems():
+        if field_name in nested_fields:
+            encoded_fields[field_name] = _nested_value_digests(field_value, cc_types[field_name])
+        else:
+            encoded_fields[field_name] = _leaf_value_to_dict(field_value, cc_types[field_name])
+    # The fields of each version of each class have fixed types, so a digest in a nested field cannot be confused with a leaf value
+    return hashlib.sha1(_canonical_encoder.encode([plan.versioned_type_str, encoded_fields])).hexdigest()
+
+
+def cc_digest(cc):
+    """
+    Returns a hex digest of a case class instance, which is the same for all equal instances of the same version.
+
+    The digest is a Merkle hash - The digest of an instance is computed from its leaf values and the digests of its
+    nested instances. Digests are computed once and cached for each instance, so after copy() changes a field, only
+    the new instances along the changed path are hashed again.
+
+    Since the digest is cached, the mutable values of an instance (lists, dicts) must not be modified after it has
+    been computed.
+    """
+    digest = _cached_digest(cc)
+    if digest is not None:
+        return digest
+    if not isinstance(cc, CaseClass):
+        raise CaseClassInvalidParameterException('Expected a case class instance. Got {}'.format(bounded_repr(cc)))
+    # Post-order traversal using a work stack, so deep structures do not hit the recursion limit. Work items are
+    # (instance, whether its nested instances have already been pushed)
+    stack = [(cc, False)]
+    while stack:
+        instance, expanded = stack.pop()
+        if _cached_digest(instance) is not None:
+            continue
+        if expanded:
+            _cache_digest(instance, _instance_digest(instance))
+            continue
+        stack.append((instance, True))
+        cc_types = instance.__class__.CC_TYPES
+        for field_name in _get_plan(instance.__class__).nested_fields:
+            for nested_instance in _nested_instances(instance.__dict__[field_name], cc_types[field_name]):
+                if _cached_digest(nested_instance) is None:
+                    stack.append((nested_instance, False))
+    return _cached_digest(cc)
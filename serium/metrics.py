@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+import bisect
+import threading
+
+__all__ = ['MetricsSink', 'InMemoryMetricsSink', 'TimingHistogram']
+
+# Metric names
+CC_TO_DICT = 'cc_to_dict'
+CC_FROM_DICT = 'cc_from_dict'
+MIGRATE = 'migrate'
+EXTERNAL_VERSION_PROVIDER = 'external_version_provider'
+SUBTYPE_RESOLUTION = 'subtype_resolution'
+
+
+class MetricsSink(object):
+    """
+    Base class for metrics sinks, which can be set as the metrics_sink of a SeriumEnv.
+
+    Metrics are identified by a name and a tuple of tags:
+
+    * cc_to_dict (class name) - timing of each cc_to_dict() call
+    * cc_from_dict (class name) - timing of each cc_from_dict() call. This includes calls which are done internally in
+      order to read old versions of migrated data
+    * migrate (class name, from version, to version) - timing of each migration step
+    * external_version_provider (class name) - timing of each call to the external version provider function
+    * subtype_resolution (supertype class name, subtype class name) - count of subtype values which have been converted
+
+    Implementations must be thread-safe, and should be cheap, since they are called on the serialization hot paths.
+    """
+
+    def increment(self, name, tags, count=1):
+        pass
+
+    def timing(self, name, tags, seconds):
+        pass
+
+
+class TimingHistogram(object):
+    # Upper bounds of the histogram buckets, in seconds. The last bucket holds all larger values
+    BUCKET_BOUNDS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * (len(self.BUCKET_BOUNDS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect.bisect_left(self.BUCKET_BOUNDS, seconds)] += 1
+
+    def as_dict(self):
+        return {'count': self.count, 'total': self.total, 'min': self.min, 'max': self.max,
+                'mean': self.total / self.count if self.count > 0 else None,
+                'buckets': list(self.buckets)}
+
+
+class InMemoryMetricsSink(MetricsSink):
+    """
+    A metrics sink which aggregates counters and timing histograms in memory. Use snapshot() in order to read them,
+    and reset() in order to start over
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._timings = {}
+
+    def increment(self, name, tags, count=1):
+        key = (name,) + tags
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + count
+
+    def timing(self, name, tags, seconds):
+        key = (name,) + tags
+        with self._lock:
+            histogram = self._timings.get(key)
+            if histogram is None:
+                histogram = self._timings[key] = TimingHistogram()
+            histogram.add(seconds)
+
+    def snapshot(self):
+        """
+        Returns a dict with 'counters' and 'timings' dicts, both keyed by (name,) + tags tuples, e.g. ('migrate', 'MyClass', 1, 2).
+        Counter values are counts, and timing values are dicts containing count, total, min, max, mean and bucket counts
+        (see TimingHistogram.BUCKET_BOUNDS) of the durations, in seconds
+        """
+        with self._lock:
+            return {'counters': dict(self._counters),
+                    'timings': {key: histogram.as_dict() for key, histogram in self._timings.iteritems()}}
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._timings = {}
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+import itertools
+import json
+import logging
+import os
+from collections import deque
+
+from serium.caseclasses import SeriumEnv, CaseClassSerializationContext, CaseClassDeserializationContext, \
+    cc_compact_json_serialization
+from serium.cc_exceptions import CaseClassInvalidParameterException
+
+__all__ = ['migrate_record', 'migrate_records', 'migrate_file', 'create_migration_env', 'MigrationReport']
+
+LOG = logging.getLogger('serium')
+
+UNVERSIONED = 'unversioned'
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHECKPOINT_INTERVAL = 10
+
+
+class MigrationReport(object):
+    def __init__(self, version_counts=None, resumed_from=0):
+        # Number of records read, per source versioned type (e.g. "MyClass/2"). Records without version info are counted under 'unversioned'
+        self.version_counts = dict(version_counts or {})
+        # Number of records which had already been migrated by a previous (interrupted) run when this run started
+        self.resumed_from = resumed_from
+
+    @property
+    def total(self):
+        return sum(self.version_counts.itervalues())
+
+    def add(self, version_counts):
+        for version, count in version_counts.iteritems():
+            self.version_counts[version] = self.version_counts.get(version, 0) + count
+
+    def __str__(self):
+        counts_str = ",".join(["{}={}".format(version, count) for version, count in sorted(self.version_counts.iteritems())])
+        return "MigrationReport(total={},resumed_from={},version_counts={{{}}})".format(self.total, self.resumed_from, counts_str)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def create_migration_env():
+    # Records without version info are read as the current version, so they get version info when they are written back
+    return SeriumEnv(CaseClassSerializationContext(), CaseClassDeserializationContext(fail_on_unversioned_data=False), cc_compact_json_serialization)
+
+
+def migrate_record(s, cc_type, env=None):
+    """
+    Read one serialized record, migrating it to the current version of cc_type if needed, and serialize it back.
+
+    Returns a tuple of (source versioned type string, serialized current version record)
+    """
+    if env is None:
+        env = create_migration_env()
+    d = _deserialize_record(s, env)
+    source_version = d.get('_ccvt', UNVERSIONED)
+    instance = env.cc_from_dict(d, cc_type)
+    return source_version, env.cc_to_json_str(instance)
+
+
+def _deserialize_record(s, env):
+    d = env.serialization.deserialize(s)
+    if not isinstance(d, dict):
+        raise CaseClassInvalidParameterException('Each record must contain a single serialized case class. Got value of type {}'.format(type(d)))
+    return d
+
+
+def _migrate_chunk(lines, cc_type, env):
+    # The records of each chunk are migrated as a batch, so batch migrations (see CaseClass.CC_BATCH_MIGRATIONS) get
+    # all the records of the same source version in the chunk at once
+    records = [_deserialize_record(line, env) for line in lines if line.strip()]
+    version_counts = {}
+    for d in records:
+        source_version = d.get('_ccvt', UNVERSIONED)
+        version_counts[source_version] = version_counts.get(source_version, 0) + 1
+    instances = env.cc_from_dict_batch(records, cc_type, owns_input=True)
+    return [env.cc_to_json_str(instance) for instance in instances], version_counts
+
+
+def _migrate_chunks(tagged_chunks, cc_type, env, processes):
+    # Gets an iterable of (tag, lines) pairs and yields (tag, (migrated lines, version counts)) pairs in the same order
+    if processes == 1:
+        for tag, chunk in tagged_chunks:
+            yield tag, _migrate_chunk(chunk, cc_type, env)
+        return
+
+    pool = _create_pool(processes, cc_type, env)
+    try:
+        # Only a bounded number of chunks is sent to the workers at any time, so huge inputs are not read into memory at once
+        pending = deque()
+        for tag, chunk in tagged_chunks:
+            pending.append((tag, pool.apply_async(_migrate_chunk_in_worker, (chunk,))))
+            if len(pending) >= processes * 2:
+                tag, async_result = pending.popleft()
+                yield tag, async_result.get()
+        while pending:
+            tag, async_result = pending.popleft()
+            yield tag, async_result.get()
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def migrate_records(lines, cc_type, env=None, chunk_size=DEFAULT_CHUNK_SIZE, processes=1):
+    """
+    Migrate an iterable of serialized records (e.g. the lines of a json-lines file) to the current version of cc_type.
+
+    Yields tuples of (list of migrated records, dict of source version counts), one per chunk of chunk_size input lines,
+    in input order. Empty lines are skipped. When processes > 1, chunks are migrated in parallel worker processes.
+    """
+    if env is None:
+        env = create_migration_env()
+    tagged_chunks = ((None, chunk) for chunk in _chunked(lines, chunk_size))
+    for _, result in _migrate_chunks(tagged_chunks, cc_type, env, processes):
+        yield result
+
+
+def migrate_file(input_path, output_path, cc_type, env=None, processes=1, chunk_size=DEFAULT_CHUNK_SIZE,
+                 checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL, resume=True):
+    """
+    Migrate a json-lines file of serialized case classes to the current version of cc_type, writing the compacted
+    records to output_path.
+
+    The output is written to a temporary file which is atomically renamed to output_path once all records have been
+    migrated. Progress is checkpointed every checkpoint_interval chunks, so an interrupted run can be resumed by running
+    the same migration again (unless resume=False).
+
+    Returns a MigrationReport containing per-version counts of the input records.
+    """
+    if env is None:
+        env = create_migration_env()
+
+    tmp_path = output_path + '.tmp'
+    checkpoint_path = output_path + '.checkpoint'
+
+    checkpoint = _load_checkpoint(checkpoint_path, input_path, cc_type) if resume else None
+    if checkpoint is not None and os.path.exists(tmp_path):
+        LOG.info("Resuming migration of %s from record %s", input_path, checkpoint['records'])
+        report = MigrationReport(checkpoint['version_counts'], resumed_from=checkpoint['records'])
+        input_offset = checkpoint['input_offset']
+        output_f = open(tmp_path, 'r+b')
+        output_f.truncate(checkpoint['output_offset'])
+        output_f.seek(0, os.SEEK_END)
+    else:
+        report = MigrationReport()
+        input_offset = 0
+        output_f = open(tmp_path, 'wb')
+
+    input_f = open(input_path, 'rb')
+    try:
+        input_f.seek(input_offset)
+
+        def read_lines():
+            while True:
+                line = input_f.readline()
+                if not line:
+                    return
+                yield line
+
+        # Each chunk is tagged with the input offset of its end, which is where a resumed migration would continue from
+        tagged_chunks = ((input_f.tell(), chunk) for chunk in _chunked(read_lines(), chunk_size))
+        results = _migrate_chunks(tagged_chunks, cc_type, env, processes)
+        for chunk_count, (chunk_end_offset, (migrated_lines, version_counts)) in enumerate(results, 1):
+            for migrated in migrated_lines:
+                output_f.write(migrated)
+                output_f.write('\n')
+            report.add(version_counts)
+            if chunk_count % checkpoint_interval == 0:
+                _sync(output_f)
+                _save_checkpoint(checkpoint_path, input_path, cc_type, chunk_end_offset, output_f.tell(), report)
+
+        _sync(output_f)
+    finally:
+        input_f.close()
+        output_f.close()
+
+    os.rename(tmp_path, output_path)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    LOG.info("Migrated %s into %s - %s", input_path, output_path, report)
+    return report
+
+
+def _chunked(iterable, chunk_size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# State of worker processes. Worker processes are forked, so the case class type and env don't need to be pickled
+_worker_cc_type = None
+_worker_env = None
+
+
+def _init_worker(cc_type, env):
+    global _worker_cc_type, _worker_env
+    _worker_cc_type = cc_type
+    _worker_env = env
+
+
+def _migrate_chunk_in_worker(lines):
+    return _migrate_chunk(lines, _worker_cc_type, _worker_env)
+
+
+def _create_pool(processes, cc_type, env):
+    import multiprocessing
+    return multiprocessing.Pool(processes, initializer=_init_worker, initargs=(cc_type, env))
+
+
+def _sync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _type_path(cc_type):
+    return '{}.{}'.format(cc_type.__module__, cc_type.__name__)
+
+
+def _load_checkpoint(checkpoint_path, input_path, cc_type):
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, 'rb') as f:
+        checkpoint = json.load(f)
+    if checkpoint['input_path'] != os.path.abspath(input_path) or checkpoint['cc_type'] != _type_path(cc_type):
+        LOG.warning("Ignoring checkpoint %s which belongs to a different migration", checkpoint_path)
+        return None
+    return checkpoint
+
+
+def _save_checkpoint(checkpoint_path, input_path, cc_type, input_offset, output_offset, report):
+    checkpoint = {
+        'input_path': os.path.abspath(input_path),
+        'cc_type': _type_path(cc_type),
+        'input_offset': input_offset,
+        'output_offset': output_offset,
+        'records': report.total,
+        'version_counts': report.version_counts
+    }
+    tmp_checkpoint_path = checkpoint_path + '.tmp'
+    with open(tmp_checkpoint_path, 'wb') as f:
+        json.dump(checkpoint, f)
+        _sync(f)
+    os.rename(tmp_checkpoint_path, checkpoint_path)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+import sys
+import threading
+from contextlib import contextmanager
+
+from serium.caseclasses import set_active_profiler
+from serium.types import CaseClassListType, CaseClassDictType, CaseClassTypeAsString, CaseClassSelfType, \
+    CaseClassSubTypeKey, CaseClassSubTypeValue, CaseClassArrayType, CaseClassNdArrayType, \
+    CaseClassTimestampType, CaseClassEnumType, CaseClassBytesType
+
+__all__ = ['profile', 'FieldProfiler']
+
+
+def describe_type(t):
+    """
+    Returns a short description of a CC_TYPES field type, e.g. cc_list(UUID)
+    """
+    if t is None:
+        return ''
+    if type(t) is CaseClassListType:
+        return 'cc_list({})'.format(describe_type(t.element_type))
+    if type(t) is CaseClassDictType:
+        return 'cc_dict({},{})'.format(describe_type(t.key_type), describe_type(t.value_type))
+    if type(t) is CaseClassTypeAsString:
+        return 'type_as_string({})'.format(t.real_type.__name__)
+    if type(t) is CaseClassSelfType:
+        return 'cc_self_type'
+    if type(t) is CaseClassSubTypeKey:
+        return 'subtype_key'
+    if type(t) is CaseClassSubTypeValue:
+        return 'subtype_value({})'.format(t.subtype_key_field_name)
+    if type(t) is CaseClassArrayType:
+        return 'cc_array({})'.format(t.typecode)
+    if type(t) is CaseClassNdArrayType:
+        return 'cc_ndarray({})'.format(t.dtype.name)
+    if type(t) is CaseClassBytesType:
+        return 'cc_bytes'
+    if type(t) is CaseClassTimestampType:
+        return 'cc_timestamp({})'.format(t.unit)
+    if type(t) is CaseClassEnumType:
+        return 'cc_enum({} values)'.format(len(t.values))
+    return getattr(t, '__name__', str(t))
+
+
+class FieldStats(object):
+    __slots__ = ['field_type', 'calls', 'total_time', 'allocations']
+
+    def __init__(self, field_type):
+        self.field_type = field_type
+        self.calls = 0
+        self.total_time = 0.0
+        self.allocations = 0
+
+    def as_dict(self):
+        return {'type': describe_type(self.field_type), 'calls': self.calls, 'total_time': self.total_time,
+                'allocations': self.allocations}
+
+
+class FieldProfiler(object):
+    """
+    Aggregates deserialization costs per Class.field path. Created and activated by profile().
+
+    Each field of each deserialized case class gets the time it took to convert its value, and the number of objects
+    which have been created by the conversion (values which could be used as-is are not counted). Nested case classes
+    are attributed to the fields of their own class, and subtype values to the fields of the actual subtype. In addition,
+    Class.<deversionize> holds the cost of checking the version of the data and migrating it, and Class.<init> holds the
+    cost of creating the instances, including the type checks of the constructor.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (class name, field name) -> FieldStats
+        self._stats = {}
+
+    def record(self, cls, field_name, field_type, seconds, allocations):
+        key = (cls.__name__, field_name)
+        with self._lock:
+            field_stats = self._stats.get(key)
+            if field_stats is None:
+                field_stats = self._stats[key] = FieldStats(field_type)
+            field_stats.calls += 1
+            field_stats.total_time += seconds
+            field_stats.allocations += allocations
+
+    def stats(self):
+        """
+        Returns a dict from 'Class.field' paths to dicts containing the type, calls, total_time (in seconds) and allocations of the field
+        """
+        with self._lock:
+            return {'{}.{}'.format(cls_name, field_name): field_stats.as_dict()
+                    for (cls_name, field_name), field_stats in self._stats.iteritems()}
+
+    def report(self, limit=None):
+        """
+        Returns the report as a string. Fields are sorted by their total time, most expensive first
+        """
+        stats = sorted(self.stats().iteritems(), key=lambda (path, s): (-s['total_time'], path))
+        total_time = sum(s['total_time'] for _, s in stats)
+        if limit is not None:
+            stats = stats[:limit]
+        path_width = max([len('path')] + [len(path) for path, _ in stats])
+        type_width = max([len('type')] + [len(s['type']) for _, s in stats])
+        line_format = '{:<%d}  {:<%d}  {:>10}  {:>12}  {:>8}  {:>10}  {:>12}' % (path_width, type_width)
+        lines = [line_format.format('path', 'type', 'calls', 'total (ms)', '%', 'avg (us)', 'allocations')]
+        for path, s in stats:
+            lines.append(line_format.format(path, s['type'], s['calls'],
+                                            '{:.3f}'.format(s['total_time'] * 1000),
+                                            '{:.1f}'.format(100.0 * s['total_time'] / total_time if total_time > 0 else 0.0),
+                                            '{:.2f}'.format(s['total_time'] * 1000000 / s['calls']),
+                                            s['allocations']))
+        return '\n'.join(lines)
+
+    def print_report(self, out=None, limit=None):
+        out = out if out is not None else sys.stdout
+        out.write(self.report(limit) + '\n')
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+
+@contextmanager
+def profile(print_report=True, out=None, limit=None):
+    """
+    Profiles the deserializations which are done inside the with block, attributing their costs to Class.field paths.
+    Prints a report sorted by total time when the block ends, unless print_report is False. The FieldProfiler is
+    returned by the context manager, so the stats can be read directly as well:
+
+        with serium.profile() as profiler:
+            env.cc_from_json_str(s, MyClass)
+
+    Profiling is process-wide - Deserializations done by other threads during the block are profiled as well.
+    """
+    profiler = FieldProfiler()
+    previous_profiler = set_active_profiler(profiler)
+    try:
+        yield profiler
+    finally:
+        set_active_profiler(previous_profiler)
+        if print_report:
+            profiler.print_report(out, limit)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+from collections import OrderedDict
+
+from serium.caseclasses import CaseClass
+from serium.cc_exceptions import CaseClassInvalidParameterException, CaseClassDefinitionException, CaseClassFieldTypeException
+from serium.types import CaseClassTimestampType, _import_numpy
+
+__all__ = ['cc_to_records', 'cc_from_records', 'records_dtype']
+
+# Field type -> numpy dtype of its column. Fields of other types (strings, lists, dicts, etc.) get object columns,
+# which hold the field values as is
+NUMERIC_FIELD_DTYPES = {int: 'i8', long: 'i8', float: 'f8', bool: '?'}
+OBJECT_DTYPE = 'O'
+# The integer value of NaT (not-a-time) in datetime64 columns
+NAT_INTEGER = -2 ** 63
+
+
+class _RecordLayout(object):
+    """
+    The columns of a case class type - One column per field, where the fields of nested case classes are flattened
+    into columns named parent.child
+    """
+
+    def __init__(self, cc_type, prefix=''):
+        if not isinstance(cc_type.CC_TYPES, OrderedDict):
+            raise CaseClassDefinitionException('Converting {} to records requires CC_TYPES to be an OrderedDict, so the columns have a stable order'.format(cc_type))
+        self.cc_type = cc_type
+        # (field name, column name, column dtype, layout of the nested case class or None), in CC_TYPES order
+        self.fields = []
+        for field_name, field_type in cc_type.CC_TYPES.iteritems():
+            column_name = prefix + field_name
+            if isinstance(field_type, type) and issubclass(field_type, CaseClass):
+                self.fields.append((field_name, column_name, None, _RecordLayout(field_type, column_name + '.')))
+            elif type(field_type) is CaseClassTimestampType:
+                self.fields.append((field_name, column_name, 'M8[{}]'.format(field_type.unit), None))
+            else:
+                self.fields.append((field_name, column_name, NUMERIC_FIELD_DTYPES.get(field_type, OBJECT_DTYPE), None))
+
+    def columns(self):
+        """
+        Returns a list of (column name, dtype) tuples
+        """
+        result = []
+        for _, column_name, dtype, nested_layout in self.fields:
+            if nested_layout is not None:
+                result.extend(nested_layout.columns())
+            else:
+                result.append((column_name, dtype))
+        return result
+
+
+_layouts = {}
+
+
+def _get_layout(cc_type):
+    try:
+        return _layouts[cc_type]
+    except KeyError:
+        return _layouts.setdefault(cc_type, _RecordLayout(cc_type))
+
+
+def records_dtype(cc_type):
+    """
+    Returns the numpy structured dtype of the records of cc_type
+    """
+    numpy = _import_numpy()
+    return numpy.dtype(_get_layout(cc_type).columns())
+
+
+def _to_columns(numpy, layout, instances, columns):
+    count = len(instances)
+    for field_name, column_name, dtype, nested_layout in layout.fields:
+        values = [getattr(instance, field_name) for instance in instances]
+        if nested_layout is not None:
+            if None in values:
+                raise CaseClassFieldTypeException('Field {} of {} is None in some instances, so it cannot be converted to columns'.format(field_name, layout.cc_type.__name__))
+            _to_columns(numpy, nested_layout, values, columns)
+        elif dtype is OBJECT_DTYPE:
+            # Assigned into an empty array, so that values such as lists don't become additional dimensions
+            column = numpy.empty(count, dtype=object)
+            column[:] = values
+            columns[column_name] = column
+        else:
+            try:
+                columns[column_name] = numpy.array(values, dtype=dtype)
+            except (TypeError, ValueError) as e:
+                raise CaseClassFieldTypeException('Field {} of {} has values which cannot be stored in a {} column. Low-level error:{}'.format(field_name, layout.cc_type.__name__, dtype, str(e)))
+
+
+def cc_to_records(instances, cc_type=None, as_columns=False):
+    """
+    Converts a list of case class instances of the same type to a numpy structured array, with one record per instance.
+    int, long, float and bool fields become int64, float64 and bool columns, and timestamp fields become datetime64
+    columns of the same unit (None becomes NaT). Fields of other types become object columns, and fields holding
+    nested case classes are flattened into parent.child columns.
+
+    When as_columns is True, returns an OrderedDict from column names to one-dimensional arrays instead.
+
+    cc_type is needed only when instances may be empty. Requires numpy.
+    """
+    numpy = _import_numpy()
+    instances = list(instances)
+    if cc_type is None:
+        if len(instances) == 0:
+            raise CaseClassInvalidParameterException('cc_type must be provided when converting an empty list to records')
+        cc_type = type(instances[0])
+    for instance in instances:
+        if type(instance) is not cc_type:
+            raise CaseClassInvalidParameterException('All instances must be of type {}. Got {}'.format(cc_type, type(instance)))
+    layout = _get_layout(cc_type)
+    columns = OrderedDict()
+    _to_columns(numpy, layout, instances, columns)
+    if as_columns:
+        return columns
+    records = numpy.empty(len(instances), dtype=numpy.dtype(layout.columns()))
+    for column_name, column in columns.iteritems():
+        records[column_name] = column
+    return records
+
+
+def _column_values(column, dtype):
+    # tolist() converts a whole numpy column to python values at once
+    if dtype is not OBJECT_DTYPE and hasattr(column, 'astype'):
+        column = column.astype(dtype, copy=False)
+        if column.dtype.kind == 'M':
+            # Timestamp fields hold the integers of datetime64 columns
+            values = column.view('i8').tolist()
+            if NAT_INTEGER in values:
+                values = [None if v == NAT_INTEGER else v for v in values]
+            return values
+    if hasattr(column, 'tolist'):
+        return column.tolist()
+    return list(column)
+
+
+def _from_columns(layout, records, count):
+    cc_type = layout.cc_type
+    columns = OrderedDict()
+    for field_name, column_name, dtype, nested_layout in layout.fields:
+        if nested_layout is not None:
+            columns[field_name] = _from_columns(nested_layout, records, count)
+            continue
+        try:
+            column = records[column_name]
+        except (KeyError, ValueError):
+            raise CaseClassInvalidParameterException('Column {} is missing from the records of {}'.format(column_name, cc_type.__name__))
+        values = _column_values(column, dtype)
+        if len(values) != count:
+            raise CaseClassInvalidParameterException('Column {} has {} values. Expected {}'.format(column_name, len(values), count))
+        field_type = cc_type.CC_TYPES[field_name]
+        if field_type in NUMERIC_FIELD_DTYPES:
+            # e.g. int64 columns of long fields, or columns which are given as lists
+            if set(map(type, values)) - {field_type}:
+                values = map(field_type, values)
+        columns[field_name] = values
+    return cc_type.from_columns(columns)
+
+
+def cc_from_records(records, cc_type):
+    """
+    Converts records created by cc_to_records() back into a list of cc_type instances. records can be a numpy
+    structured array, or a dict from column names to sequences (numpy arrays or lists) of the same length
+    """
+    if getattr(getattr(records, 'dtype', None), 'names', None) is not None:
+        count = len(records)
+    elif isinstance(records, dict):
+        lengths = set(len(column) for column in records.itervalues())
+        if len(lengths) > 1:
+            raise CaseClassInvalidParameterException('All columns must have the same length. Got lengths {}'.format(sorted(lengths)))
+        count = lengths.pop() if lengths else 0
+    else:
+        raise CaseClassInvalidParameterException('Records must be a numpy structured array or a dict of columns. Got {}'.format(type(records)))
+    return _from_columns(_get_layout(cc_type), records, count)
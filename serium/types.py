@@ -1,9 +1,16 @@
 #!/usr/bin/env python
 
+import array
+import base64
+import sys
+from datetime import datetime, timedelta
 from uuid import UUID
 from decimal import Decimal
 
-__all__ = ['cc_uuid', 'cc_decimal', 'cc_self_type', 'cc_list', 'cc_dict', 'cc_subtype_key', 'cc_subtype_value', 'cc_type_as_string']
+from serium.cc_exceptions import CaseClassDefinitionException
+
+__all__ = ['cc_uuid', 'cc_decimal', 'cc_self_type', 'cc_list', 'cc_dict', 'cc_subtype_key', 'cc_subtype_value', 'cc_type_as_string',
+           'cc_array', 'cc_ndarray', 'cc_timestamp', 'cc_timestamp_us', 'cc_enum', 'cc_bytes']
 
 
 class CaseClassListType(object):
@@ -41,8 +48,13 @@ class CaseClassSelfType(object):
 
 
 class CaseClassTypeAsString(object):
-    def __init__(self, real_type):
+    def __init__(self, real_type, from_string=None, to_binary=None, from_binary=None):
         self.real_type = real_type
+        # Converts serialized strings to real_type values. Defaults to the one-parameter constructor of real_type
+        self.from_string = from_string if from_string is not None else real_type
+        # Optional compact encoding of the values, used by serializations which can hold raw bytes (see CaseClassBinaryType)
+        self.to_binary = to_binary
+        self.from_binary = from_binary
 
     def __str__(self):
         return "CaseClassTypeAsString(real_type={})".format(repr(self.real_type))
@@ -73,9 +85,350 @@ class CaseClassSubTypeValue(object):
         return self.__str__()
 
 
-cc_uuid = CaseClassTypeAsString(UUID)
+def _to_bytes(b):
+    # Raw values can be given as str, bytearray, buffer or memoryview objects
+    if isinstance(b, memoryview):
+        return b.tobytes()
+    return str(b)
+
+
+class CaseClassCustomType(object):
+    """
+    Base class of field types which validate and convert their values themselves.
+
+    Values are converted to json values using to_json_value() and back using from_json_value(). Serialization backends
+    which can hold raw bytes (and declare it using a binary_values = True attribute) use to_binary_value() and
+    from_binary_value() instead, which default to the json conversions.
+    """
+
+    # True when the valid values are json values as well, so they can be serialized without conversion
+    json_compatible_values = False
+
+    def check_value(self, v):
+        """
+        Returns whether v is a valid value for a field of this type
+        """
+        raise NotImplementedError()
+
+    def check_values(self, values):
+        """
+        Returns whether all of the values are valid values of this type. Subclasses can override it with a bulk check
+        """
+        return all(self.check_value(v) for v in values)
+
+    def is_deserialized_value(self, v, binary_values):
+        """
+        Returns whether v, which is a value read from a dict, is already a valid value that must not be converted. The
+        values of binary serializations are raw values when binary_values is True, and json values otherwise
+        """
+        return self.check_value(v)
+
+    def are_deserialized_values(self, values, binary_values):
+        """
+        Same as is_deserialized_value(), for all of the values at once
+        """
+        return self.check_values(values)
+
+    def to_json_value(self, v):
+        raise NotImplementedError()
+
+    def from_json_value(self, s):
+        raise NotImplementedError()
+
+    def to_binary_value(self, v):
+        return self.to_json_value(v)
+
+    def from_binary_value(self, b):
+        return self.from_json_value(b)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class CaseClassBinaryType(CaseClassCustomType):
+    """
+    Base class of field types whose values are binary data.
+
+    Values are encoded as base64 strings in json, and binary serialization backends get the raw bytes.
+    """
+
+    def to_binary_value(self, v):
+        raise NotImplementedError()
+
+    def from_binary_value(self, b):
+        raise NotImplementedError()
+
+    def to_json_value(self, v):
+        return base64.b64encode(self.to_binary_value(v))
+
+    def from_json_value(self, s):
+        return self.from_binary_value(base64.b64decode(s))
+
+
+class CaseClassBytesType(CaseClassBinaryType):
+    """
+    A binary data field, holding str, bytearray or memoryview values. Values are never copied by serium - They are
+    given to binary serializations as is, and the values which binary serializations return (e.g. memoryview slices of
+    their input buffer) are kept as is as well. json serializations encode the values as base64.
+    """
+
+    VALUE_TYPES = (str, bytearray, memoryview)
+    # The json value of binary data is a base64 string, so only these types are known to hold decoded data in json dicts
+    DECODED_VALUE_TYPES = (bytearray, memoryview)
+
+    def check_value(self, v):
+        return type(v) in self.VALUE_TYPES
+
+    def is_deserialized_value(self, v, binary_values):
+        return type(v) in (self.VALUE_TYPES if binary_values else self.DECODED_VALUE_TYPES)
+
+    def are_deserialized_values(self, values, binary_values):
+        return all(self.is_deserialized_value(v, binary_values) for v in values)
+
+    def to_binary_value(self, v):
+        return v
+
+    def to_json_value(self, v):
+        return base64.b64encode(v)
+
+    def from_binary_value(self, b):
+        if type(b) in self.VALUE_TYPES:
+            return b
+        return _to_bytes(b)
+
+    def __str__(self):
+        return "CaseClassBytesType()"
+
+
+# array typecodes whose item sizes are the same on all platforms, so their bytes can be read anywhere
+ARRAY_TYPECODES = 'bBhHiIfd'
+
+
+class CaseClassArrayType(CaseClassBinaryType):
+    """
+    A numeric array field, holding array.array values of a specific typecode. The values are stored in a contiguous
+    buffer, and are encoded as their little-endian bytes. Lists of numbers are accepted when deserializing as well, so
+    cc_list fields can be changed to arrays without migrating the data.
+    """
+
+    def __init__(self, typecode):
+        if typecode not in ARRAY_TYPECODES:
+            raise CaseClassDefinitionException('Array typecode must be one of {}. Got {}'.format(', '.join(ARRAY_TYPECODES), repr(typecode)))
+        self.typecode = typecode
+
+    def check_value(self, v):
+        return type(v) is array.array and v.typecode == self.typecode
+
+    def to_binary_value(self, v):
+        if sys.byteorder != 'little':
+            v = array.array(self.typecode, v)
+            v.byteswap()
+        return v.tostring()
+
+    def from_binary_value(self, b):
+        a = array.array(self.typecode)
+        a.fromstring(_to_bytes(b))
+        if sys.byteorder != 'little':
+            a.byteswap()
+        return a
+
+    def from_json_value(self, s):
+        if isinstance(s, (list, tuple)):
+            return array.array(self.typecode, s)
+        return CaseClassBinaryType.from_json_value(self, s)
+
+    def __str__(self):
+        return "CaseClassArrayType(typecode={})".format(repr(self.typecode))
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise CaseClassDefinitionException('numpy is required for cc_ndarray fields')
+    return numpy
+
+
+class CaseClassNdArrayType(CaseClassBinaryType):
+    """
+    A numeric array field, holding one-dimensional numpy arrays of a specific dtype. The values are encoded as their
+    little-endian bytes. Lists of numbers are accepted when deserializing as well. Requires numpy.
+    """
+
+    def __init__(self, dtype):
+        self.numpy = _import_numpy()
+        self.dtype = self.numpy.dtype(dtype)
+        if self.dtype.hasobject or self.dtype.kind not in 'biuf':
+            raise CaseClassDefinitionException('ndarray dtype must be a numeric or bool dtype. Got {}'.format(self.dtype))
+        self.little_endian_dtype = self.dtype.newbyteorder('<')
+
+    def check_value(self, v):
+        return type(v) is self.numpy.ndarray and v.dtype == self.dtype and v.ndim == 1
+
+    def to_binary_value(self, v):
+        return v.astype(self.little_endian_dtype, copy=False).tobytes()
+
+    def from_binary_value(self, b):
+        # frombuffer() returns a read-only view of the bytes, so the result is copied into a regular array
+        return self.numpy.frombuffer(_to_bytes(b), dtype=self.little_endian_dtype).astype(self.dtype)
+
+    def from_json_value(self, s):
+        if isinstance(s, (list, tuple)):
+            return self.numpy.array(s, dtype=self.dtype)
+        return CaseClassBinaryType.from_json_value(self, s)
+
+    def __str__(self):
+        return "CaseClassNdArrayType(dtype={})".format(repr(self.dtype.name))
+
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECONDS_PER_UNIT = {'ms': 1000, 'us': 1}
+
+
+class CaseClassTimestampType(CaseClassCustomType):
+    """
+    A timestamp field, holding an integer number of milliseconds (unit='ms') or microseconds (unit='us') since the
+    epoch, in UTC. The integers are serialized as is, so values are validated with a single type check and are never
+    converted. Use to_datetime() to get a datetime when it's needed, and from_datetime() or now() to create values.
+    """
+
+    json_compatible_values = True
+
+    def __init__(self, unit):
+        if unit not in MICROSECONDS_PER_UNIT:
+            raise CaseClassDefinitionException('Timestamp unit must be one of {}. Got {}'.format(', '.join(sorted(MICROSECONDS_PER_UNIT)), repr(unit)))
+        self.unit = unit
+        self.microseconds_per_unit = MICROSECONDS_PER_UNIT[unit]
+
+    def check_value(self, v):
+        return type(v) is int or type(v) is long
+
+    def check_values(self, values):
+        return len(set(map(type, values)).difference((int, long))) == 0
+
+    def to_json_value(self, v):
+        return v
+
+    def from_json_value(self, v):
+        if isinstance(v, datetime):
+            return self.from_datetime(v)
+        if isinstance(v, float) and not v.is_integer():
+            raise ValueError('Timestamp must be an integer number of {} since the epoch. Got {}'.format(self.unit, v))
+        return int(v)
+
+    def to_datetime(self, v):
+        """
+        Returns the naive UTC datetime of the timestamp v
+        """
+        return EPOCH + timedelta(microseconds=v * self.microseconds_per_unit)
+
+    def to_datetimes(self, values):
+        microseconds_per_unit = self.microseconds_per_unit
+        return [None if v is None else EPOCH + timedelta(microseconds=v * microseconds_per_unit) for v in values]
+
+    def from_datetime(self, dt):
+        """
+        Returns the timestamp of dt, which is either timezone-aware or naive UTC, rounded down to the unit
+        """
+        if dt.tzinfo is not None:
+            dt = dt.replace(tzinfo=None) - dt.utcoffset()
+        delta = dt - EPOCH
+        return ((delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds) // self.microseconds_per_unit
+
+    def now(self):
+        return self.from_datetime(datetime.utcnow())
+
+    def __str__(self):
+        return "CaseClassTimestampType(unit={})".format(repr(self.unit))
+
+
+class CaseClassEnumType(CaseClassCustomType):
+    """
+    An enum field, holding one of a fixed set of str values. Values are validated using a precomputed set, and
+    deserialized values are the interned strings of the definition, so all the records share them.
+
+    When compact is True, values are serialized as small integers - The position of the value in the values list, or
+    the code given for it when values is a dict from values to codes. Both encodings are accepted when deserializing,
+    so compact can be turned on without migrating the data. Since old data is always read using the case class
+    version which wrote it, the codes of a version must never change. Add values in a new version of the case class.
+
+    Compact enums which are used as dict keys are serialized as the string form of their codes (e.g. "2"), since json
+    object keys are strings, so the values of compact enums cannot be strings of digits.
+    """
+
+    def __init__(self, values, compact=False):
+        if isinstance(values, dict):
+            codes = dict(values)
+        else:
+            codes = {value: code for code, value in enumerate(values)}
+            if len(codes) != len(values):
+                raise CaseClassDefinitionException('Enum values must be unique. Got {}'.format(values))
+        for value, code in codes.iteritems():
+            if type(value) is not str or len(value) == 0:
+                raise CaseClassDefinitionException('Enum values must be non-empty strings. Got {}'.format(repr(value)))
+            if type(code) is not int or code < 0:
+                raise CaseClassDefinitionException('Enum codes must be non-negative integers. Got {} for {}'.format(repr(code), value))
+        if len(set(codes.itervalues())) != len(codes):
+            raise CaseClassDefinitionException('Enum codes must be unique. Got {}'.format(codes))
+        if compact and any(value.isdigit() for value in codes):
+            raise CaseClassDefinitionException('Values of compact enums cannot be strings of digits, since they would be mistaken for codes. Got {}'.format(sorted(codes)))
+        self.compact = compact
+        self.json_compatible_values = not compact
+        # value -> code, value -> the interned value, and code -> the interned value
+        self.codes = {intern(value): code for value, code in codes.iteritems()}
+        self.canonical_values = {value: value for value in self.codes}
+        self.values_by_code = {code: value for value, code in self.codes.iteritems()}
+        self.values = tuple(sorted(self.codes, key=self.codes.get))
+
+    def check_value(self, v):
+        return type(v) is str and v in self.codes
+
+    def check_values(self, values):
+        return set(map(type, values)) <= set([str]) and self.codes.viewkeys() >= set(values)
+
+    def to_json_value(self, v):
+        return self.codes[v] if self.compact else v
+
+    def from_json_value(self, v):
+        try:
+            if type(v) is int or type(v) is long:
+                return self.values_by_code[v]
+            if self.compact and v.isdigit():
+                # The code of a dict key, which json turns into a string
+                return self.values_by_code[int(v)]
+            return self.canonical_values[v]
+        except (KeyError, TypeError, AttributeError):
+            raise ValueError('{} is not one of the enum values {}'.format(repr(v), ', '.join(self.values)))
+
+    def __str__(self):
+        return "CaseClassEnumType(values={},compact={})".format(repr(self.values), self.compact)
+
+
+def _uuid_from_string(s):
+    # Same as UUID(s). Strings in the canonical 36 character format skip the normalization of the other formats
+    if len(s) == 36 and s[8] == '-' and s[13] == '-' and s[18] == '-' and s[23] == '-':
+        hex_digits = s.replace('-', '')
+        if len(hex_digits) == 32:
+            u = object.__new__(UUID)
+            u.__dict__['int'] = int(hex_digits, 16)
+            return u
+    return UUID(s)
+
+
+def _uuid_to_binary(u):
+    return u.bytes
+
+
+def _uuid_from_binary(b):
+    return UUID(bytes=_to_bytes(b))
+
+
+cc_uuid = CaseClassTypeAsString(UUID, _uuid_from_string, _uuid_to_binary, _uuid_from_binary)
 cc_decimal = CaseClassTypeAsString(Decimal)
 cc_self_type = CaseClassSelfType()
+cc_bytes = CaseClassBytesType()
+cc_timestamp = CaseClassTimestampType('ms')
+cc_timestamp_us = CaseClassTimestampType('us')
 
 
 def cc_list(t):
@@ -96,3 +449,15 @@ def cc_subtype_value(key_field_name):
 
 def cc_type_as_string(t):
     return CaseClassTypeAsString(t)
+
+
+def cc_array(typecode):
+    return CaseClassArrayType(typecode)
+
+
+def cc_ndarray(dtype):
+    return CaseClassNdArrayType(dtype)
+
+
+def cc_enum(values, compact=False):
+    return CaseClassEnumType(values, compact)
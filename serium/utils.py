@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+try:
+    import repr as reprlib
+except ImportError:
+    import reprlib
+
+__all__ = ['bounded_repr']
+
+# Maximum length of a bounded repr
+MAX_REPR_LENGTH = 200
+
+
+class _BoundedRepr(reprlib.Repr):
+    """
+    A reprlib.Repr which limits the size of case class reprs as well, by rendering them field by field. This way,
+    only the displayed part of a huge instance is ever rendered, and not its full __repr__
+    """
+
+    def __init__(self):
+        reprlib.Repr.__init__(self)
+        self.maxlevel = 3
+        self.maxstring = 60
+        self.maxlong = 40
+        self.maxother = 60
+        self.maxfields = 8
+
+    def repr1(self, x, level):
+        cc_types = getattr(type(x), 'CC_TYPES', None)
+        if cc_types is None or not hasattr(x, '__dict__'):
+            return reprlib.Repr.repr1(self, x, level)
+        type_name = type(x).__name__
+        if level <= 0:
+            return '{}(...)'.format(type_name)
+        field_names = list(cc_types.keys())
+        fields_str = ','.join(['{}={}'.format(field_name, self.repr1(x.__dict__.get(field_name), level - 1))
+                               for field_name in field_names[:self.maxfields]])
+        if len(field_names) > self.maxfields:
+            fields_str += ',...'
+        return '{}({})'.format(type_name, fields_str)
+
+
+_bounded_repr = _BoundedRepr()
+
+
+def bounded_repr(o, max_length=MAX_REPR_LENGTH):
+    """
+    Returns a repr of o which is truncated to max_length characters. Nested values (including case class fields)
+    are truncated as well, so rendering the repr of a huge object is cheap
+    """
+    try:
+        s = _bounded_repr.repr(o)
+    except Exception as e:
+        s = '<{} instance - repr failed: {}>'.format(type(o).__name__, e)
+    if len(s) > max_length:
+        s = s[:max_length - 3] + '...'
+    return s
+
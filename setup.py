@@ -52,6 +52,12 @@ setup(
     install_requires=[],
     python_requires='>=2.6,<3',
 
+    entry_points={
+        'console_scripts': [
+            'serium=serium.cli:main',
+        ],
+    },
+
     # List additional groups of dependencies here (e.g. development
     # dependencies). You can install these using the following syntax,
     # for example:
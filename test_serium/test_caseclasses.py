@@ -1,20 +1,36 @@
 #!/usr/bin/env python
+import array
+import base64
+import datetime
 import json
+import pickle
+import threading
 import uuid
 from collections import OrderedDict
 import pytest
 
 import sys,os
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # This needs to come first, before any serium imports
 sys.path.insert(0, os.path.join(sys.path[0], '..'))
 
-from serium.caseclasses import CaseClass, CaseClassDeserializationContext, create_default_env
-from serium.types import cc_list, cc_dict, cc_self_type, cc_type_as_string, cc_subtype_key, cc_subtype_value
+from serium.caseclasses import CaseClass, CaseClassDeserializationContext, CaseClassSerializationContext, SeriumEnv, cc_compact_json_serialization, \
+    create_default_env, cc_sizeof
+from serium.caches import CaseClassDeserializationCache
+from serium.metrics import InMemoryMetricsSink, CC_FROM_DICT
+from serium import caseclasses, profile
+from serium.types import cc_list, cc_dict, cc_self_type, cc_type_as_string, cc_uuid, cc_subtype_key, cc_subtype_value, \
+    cc_array, cc_ndarray, cc_timestamp, cc_timestamp_us, cc_enum, cc_bytes
 from serium.cc_exceptions import CaseClassImmutabilityException, CaseClassUnexpectedFieldException, \
     CaseClassDefinitionException, CaseClassUnexpectedFieldTypeException, CaseClassUnknownFieldException, \
     IncompatibleTypesCaseClassException, CaseClassTypeAsStringException, CaseClassCannotBeFoundException, \
-    CaseClassCreationException, MissingVersionDataCaseClassException, CaseClassSubTypeCannotBeNullException
+    CaseClassCreationException, MissingVersionDataCaseClassException, CaseClassSubTypeCannotBeNullException, CaseClassFieldTypeException, \
+    CaseClassFieldMismatchException, CaseClassInvalidParameterException
 
 
 class A(CaseClass):
@@ -618,6 +634,40 @@ class TestBasicTests:
         assert [child.value for child in new_r1.children] == range(10)
         assert [len(child.children) for child in new_r1.children] == [3] * 10
 
+    def test_deep_recursive_type(self, env):
+        depth = sys.getrecursionlimit() * 5
+        r1 = None
+        for i in range(depth):
+            r1 = CaseClassWithRecursiveReference(i, 'node', r1)
+
+        d = env.cc_to_dict(r1)
+        new_r1 = env.cc_from_dict(d, CaseClassWithRecursiveReference)
+
+        # Comparing the structures directly would be recursive, so they are compared level by level
+        values = []
+        while new_r1 is not None:
+            assert type(new_r1) is CaseClassWithRecursiveReference
+            values.append(new_r1.myint)
+            new_r1 = new_r1.child
+        assert values == range(depth - 1, -1, -1)
+
+    def test_deep_recursive_type_in_list(self, env):
+        depth = sys.getrecursionlimit() * 5
+        r1 = CaseClassWithRecursiveRefInList(-1, [])
+        for i in range(depth):
+            r1 = CaseClassWithRecursiveRefInList(i, [r1, CaseClassWithRecursiveRefInList(-2, None)])
+
+        d = env.cc_to_dict(r1)
+        new_r1 = env.cc_from_dict(d, CaseClassWithRecursiveRefInList)
+
+        values = []
+        while new_r1.children:
+            assert new_r1.children[1] == CaseClassWithRecursiveRefInList(-2, None)
+            values.append(new_r1.value)
+            new_r1 = new_r1.children[0]
+        assert new_r1 == CaseClassWithRecursiveRefInList(-1, [])
+        assert values == range(depth - 1, -1, -1)
+
     def test_deserialization_into_a_different_class(self):
         env = create_default_env()
         env.deserialization_ctx = CaseClassDeserializationContext(fail_on_incompatible_types=False)
@@ -794,3 +844,858 @@ class TestSubTypingTests:
         }
         with pytest.raises(CaseClassSubTypeCannotBeNullException):
             st = env.cc_from_json_str(json.dumps(j), CaseClassSuperType)
+
+
+class TestDeserializationCacheTests:
+    def create_env(self, max_size=100, ttl=None):
+        env = create_default_env()
+        env.deserialization_cache = CaseClassDeserializationCache(max_size, ttl)
+        return env
+
+    def test_identical_payload_is_cached(self):
+        env = self.create_env()
+        s = env.cc_to_json_str(S(42, A(1, 2, 3), B('4', '5')))
+
+        s1 = env.cc_from_json_str(s, S)
+        s2 = env.cc_from_json_str(s, S)
+        s3 = env.cc_from_json_str(unicode(s), S)
+
+        assert s1 == S(42, A(1, 2, 3), B('4', '5'))
+        assert s2 is s1
+        assert s3 is s1
+        assert env.deserialization_cache.hits == 2
+        assert env.deserialization_cache.misses == 1
+
+    def test_cache_is_keyed_by_type(self):
+        env = self.create_env()
+        env.deserialization_ctx = CaseClassDeserializationContext(fail_on_incompatible_types=False)
+        s = env.cc_to_json_str(A(10, 20, 30))
+
+        a = env.cc_from_json_str(s, A)
+        a2 = env.cc_from_json_str(s, A2)
+
+        assert a == A(10, 20, 30)
+        assert a2 == A2(10, 20, 30, 'my_new_field_default_value')
+        assert env.deserialization_cache.hits == 0
+
+    def test_different_payloads_are_not_shared(self):
+        env = self.create_env()
+
+        b1 = env.cc_from_json_str(env.cc_to_json_str(B('1', '2')), B)
+        b2 = env.cc_from_json_str(env.cc_to_json_str(B('1', '3')), B)
+
+        assert b1 == B('1', '2')
+        assert b2 == B('1', '3')
+
+    def test_ttl(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr('serium.caches.time.time', lambda: now[0])
+        env = self.create_env(ttl=10)
+        s = env.cc_to_json_str(B('1', '2'))
+
+        b1 = env.cc_from_json_str(s, B)
+        now[0] += 5
+        assert env.cc_from_json_str(s, B) is b1
+        now[0] += 10
+        b2 = env.cc_from_json_str(s, B)
+
+        assert b2 is not b1
+        assert b2 == b1
+        assert env.deserialization_cache.stats() == {'size': 1, 'max_size': 100, 'hits': 1, 'misses': 2, 'evictions': 0, 'expirations': 1}
+
+    def test_size_limit(self):
+        env = self.create_env(max_size=1)
+
+        for s in ['1', '2', '1']:
+            env.cc_from_json_str(env.cc_to_json_str(B(s, s)), B)
+
+        assert len(env.deserialization_cache) == 1
+        assert env.deserialization_cache.evictions == 2
+        assert env.deserialization_cache.hits == 0
+
+
+class TestProfilerTests:
+    def test_costs_are_attributed_to_fields(self, env):
+        s = env.cc_to_json_str(CaseClassWithLists(1, [1, 2, 3], [S(1, A(1, 2, 3), B('4', '5')), S(2, A(4, 5, 6), B('7', '8'))]))
+
+        with profile(print_report=False) as profiler:
+            env.cc_from_json_str(s, CaseClassWithLists)
+        stats = profiler.stats()
+
+        assert stats['CaseClassWithLists.list_of_Ss']['type'] == 'cc_list(S)'
+        assert stats['CaseClassWithLists.list_of_Ss']['calls'] == 1
+        assert stats['CaseClassWithLists.list_of_Ss']['allocations'] == 1
+        # The parsed list of ints is used as is
+        assert stats['CaseClassWithLists.list_of_ints']['allocations'] == 0
+        assert stats['S.myint']['calls'] == 2
+        assert stats['S.<init>']['calls'] == 2
+        assert stats['A.a']['calls'] == 2
+        # json strings are decoded as unicode, so each str field value gets converted
+        assert stats['B.a']['allocations'] == 2
+        assert stats['CaseClassWithLists.<init>']['calls'] == 1
+        assert stats['CaseClassWithLists.<deversionize>']['calls'] == 1
+
+    def test_type_as_string_and_subtype_fields(self, env):
+        u = env.cc_to_json_str(CaseClassWithUUID(uuid.UUID('cedcb73b-2ca6-45e4-93e5-5c0b42dad3fd')))
+        st = env.cc_to_json_str(CaseClassSuperType('CaseClassSubType1', CaseClassSubType1(100, 200)))
+
+        with profile(print_report=False) as profiler:
+            env.cc_from_json_str(u, CaseClassWithUUID)
+            env.cc_from_json_str(st, CaseClassSuperType)
+        stats = profiler.stats()
+
+        assert stats['CaseClassWithUUID.u']['type'] == 'type_as_string(UUID)'
+        assert stats['CaseClassWithUUID.u']['allocations'] == 1
+        assert stats['CaseClassSuperType.details']['type'] == 'subtype_value(submessage_type)'
+        assert stats['CaseClassSubType1.subtype1_field1']['calls'] == 1
+
+    def test_report(self, env, capsys):
+        s = env.cc_to_json_str(S(1, A(1, 2, 3), B('4', '5')))
+
+        with profile() as profiler:
+            env.cc_from_json_str(s, S)
+
+        out = capsys.readouterr()[0]
+        lines = out.splitlines()
+        assert lines[0].split() == ['path', 'type', 'calls', 'total', '(ms)', '%', 'avg', '(us)', 'allocations']
+        assert len(lines) == len(profiler.stats()) + 1
+        total_times = [profiler.stats()[line.split()[0]]['total_time'] for line in lines[1:]]
+        assert total_times == sorted(total_times, reverse=True)
+        assert caseclasses._active_profiler is None
+
+    def test_no_profiling_outside_of_block(self, env):
+        with profile(print_report=False) as profiler:
+            pass
+        env.cc_from_json_str(env.cc_to_json_str(B('1', '2')), B)
+
+        assert profiler.stats() == {}
+
+
+class TestSizeofTests:
+    def test_nested_values_are_included(self):
+        b = B('x' * 1000, 'y')
+
+        assert cc_sizeof(b) > 1000
+        assert cc_sizeof(S(1, A(1, 2, 3), b)) > cc_sizeof(b) + cc_sizeof(A(1, 2, 3))
+
+    def test_shared_objects_are_counted_once(self):
+        b = B('x' * 1000, 'y' * 1000)
+        shared = CaseClassWithDict(1, {'a': b, 'b': b})
+        not_shared = CaseClassWithDict(1, {'a': b, 'b': B('x' * 1000, 'y' * 1000)})
+
+        assert cc_sizeof(shared) - cc_sizeof(b) < 1000
+        assert cc_sizeof(not_shared) - cc_sizeof(shared) > 2000
+
+    def test_seen_objects_are_not_counted_again(self):
+        b = B('x' * 1000, 'y')
+        seen = set()
+
+        first = cc_sizeof(S(1, A(1, 2, 3), b), seen)
+        second = cc_sizeof(S(1, A(1, 2, 3), b), seen)
+
+        assert second < first - 1000
+
+    def test_type_as_string_values(self):
+        u = CaseClassWithUUID(uuid.UUID('cedcb73b-2ca6-45e4-93e5-5c0b42dad3fd'))
+
+        assert cc_sizeof(u) > sys.getsizeof(u) + sys.getsizeof(u.u)
+
+
+# Used only by TestConcurrencyTests, so their per-class caches are first populated concurrently
+class ConcurrentLeaf(CaseClass):
+    CC_TYPES = OrderedDict([('u', cc_type_as_string(uuid.UUID)), ('s', str)])
+
+    def __init__(self, u, s):
+        self.u = u
+        self.s = s
+
+
+class ConcurrentRoot(CaseClass):
+    CC_TYPES = OrderedDict([('i', int), ('leaves', cc_list(ConcurrentLeaf)), ('by_name', cc_dict(str, ConcurrentLeaf))])
+
+    def __init__(self, i, leaves, by_name):
+        self.i = i
+        self.leaves = leaves
+        self.by_name = by_name
+
+
+class TestConcurrencyTests:
+    def test_concurrent_serde_with_shared_state(self):
+        env = create_default_env()
+        env.metrics_sink = InMemoryMetricsSink()
+        roots = [ConcurrentRoot(i, [ConcurrentLeaf(uuid.UUID(int=j), str(j)) for j in range(5)], {str(i): ConcurrentLeaf(uuid.UUID(int=i), 'x')})
+                 for i in range(20)]
+        strs = [env.cc_to_json_str(root) for root in roots]
+        thread_count = 8
+        iterations = 50
+        start_event = threading.Event()
+        errors = []
+
+        def target(offset):
+            start_event.wait()
+            try:
+                for i in range(iterations):
+                    index = (offset + i) % len(roots)
+                    assert env.cc_from_json_str(strs[index], ConcurrentRoot) == roots[index]
+                    assert env.cc_to_json_str(roots[index]) == strs[index]
+            except Exception as e:
+                errors.append(e)
+
+        old_check_interval = sys.getcheckinterval()
+        # Switch threads as often as possible, in order to expose races
+        sys.setcheckinterval(1)
+        try:
+            threads = [threading.Thread(target=target, args=(offset,)) for offset in range(thread_count)]
+            for thread in threads:
+                thread.start()
+            start_event.set()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setcheckinterval(old_check_interval)
+
+        assert errors == []
+        assert caseclasses._get_plan(ConcurrentRoot) is caseclasses._get_plan(ConcurrentRoot)
+        assert caseclasses._get_plan(ConcurrentRoot).nested_fields == frozenset(['leaves', 'by_name'])
+        assert env.metrics_sink.snapshot()['timings'][(CC_FROM_DICT, 'ConcurrentRoot')]['count'] == thread_count * iterations
+
+
+class CaseClassWithRawDict(CaseClass):
+    CC_TYPES = OrderedDict([('b', B), ('raw', dict)])
+
+    def __init__(self, b, raw):
+        self.b = b
+        self.raw = raw
+
+
+class TestOnePassDecodingTests:
+    def create_env(self, **kwargs):
+        env = create_default_env()
+        env.deserialization_ctx = CaseClassDeserializationContext(one_pass_decoding=True, **kwargs)
+        return env
+
+    def test_current_version_data_is_built_while_parsing(self, monkeypatch):
+        env = self.create_env()
+        cc = CaseClassWithLists(1, [1, 2], [S(1, A(1, 2, 3), B('4', '5')), None])
+        s = env.cc_to_json_str(cc)
+
+        def fail(*args):
+            raise AssertionError('Should not be called')
+        monkeypatch.setattr(caseclasses._FromDictConverter, '_expand', fail)
+
+        assert env.cc_from_json_str(s, CaseClassWithLists) == cc
+
+    def test_dicts_and_self_types(self):
+        env = self.create_env()
+        with_dict = CaseClassWithDict(1, {'x': B('1', '2'), 'y': None})
+        tree = CaseClassWithRecursiveRefInList(1, [CaseClassWithRecursiveRefInList(2, []), CaseClassWithRecursiveRefInList(3, [])])
+
+        assert env.cc_from_json_str(env.cc_to_json_str(with_dict), CaseClassWithDict) == with_dict
+        assert env.cc_from_json_str(env.cc_to_json_str(tree), CaseClassWithRecursiveRefInList) == tree
+
+    def test_other_data_falls_back_to_regular_conversion(self):
+        env = self.create_env(fail_on_unversioned_data=False)
+        supertype = CaseClassSuperType('CaseClassSubType1', CaseClassSubType1(100, 200))
+        unversioned_inner = {'myint': 1, 'a_type': {'a': 1, 'b': 2, 'c': 3}, 'b_type': {'a': 'x', 'b': 'y', '_ccvt': 'B/1'}, '_ccvt': 'S/1'}
+
+        assert env.cc_from_json_str(env.cc_to_json_str(supertype), CaseClassSuperType) == supertype
+        assert env.cc_from_json_str(json.dumps(unversioned_inner), S) == S(1, A(1, 2, 3), B('x', 'y'))
+
+    def test_unexpected_type_behaves_like_regular_conversion(self):
+        s = json.dumps({'myint': 1, 'a_type': {'a': 'x', 'b': 'y', '_ccvt': 'B/1'}, 'b_type': {'a': 'x', 'b': 'y', '_ccvt': 'B/1'}, '_ccvt': 'S/1'})
+
+        with pytest.raises(IncompatibleTypesCaseClassException):
+            create_default_env().cc_from_json_str(s, S)
+        with pytest.raises(IncompatibleTypesCaseClassException):
+            self.create_env().cc_from_json_str(s, S)
+
+    def test_raw_dict_fields_disable_one_pass_decoding(self):
+        env = self.create_env()
+        raw = {'inner': {'a': 'x', 'b': 'y', '_ccvt': 'B/1'}}
+        cc = CaseClassWithRawDict(B('1', '2'), raw)
+
+        result = env.cc_from_json_str(env.cc_to_json_str(cc), CaseClassWithRawDict)
+
+        assert not caseclasses._get_one_pass_registry(CaseClassWithRawDict).enabled
+        assert result.raw == raw
+
+
+class CaseClassWithPrimitiveContainers(CaseClass):
+    CC_TYPES = OrderedDict([
+        ('ints', cc_list(int)),
+        ('strs', cc_list(str)),
+        ('floats_by_name', cc_dict(str, float))
+    ])
+
+    def __init__(self, ints, strs, floats_by_name):
+        self.ints = ints
+        self.strs = strs
+        self.floats_by_name = floats_by_name
+
+
+class TestPrimitiveContainersTests:
+    def test_round_trip(self, env):
+        cc = CaseClassWithPrimitiveContainers(range(1000) + [2 ** 70, True], ['a', 'b'], {'x': 1.5, 'y': 2.5})
+
+        new_cc = env.cc_from_json_str(env.cc_to_json_str(cc), CaseClassWithPrimitiveContainers)
+
+        assert new_cc == cc
+        assert all(type(s) is str for s in new_cc.strs)
+        assert all(type(k) is str for k in new_cc.floats_by_name)
+
+    def test_mismatching_elements_are_converted(self, env):
+        d = {'ints': [1, 2, '3', None], 'strs': [u'a', 'b'], 'floats_by_name': {u'x': 1, 'y': 2.5}, '_ccvt': 'CaseClassWithPrimitiveContainers/1'}
+
+        cc = env.cc_from_dict(d, CaseClassWithPrimitiveContainers)
+
+        assert cc.ints == [1, 2, 3, None]
+        assert [type(s) for s in cc.strs] == [str, str]
+        assert cc.floats_by_name == {'x': 1.0, 'y': 2.5}
+        assert type(cc.floats_by_name['x']) is float
+
+    def test_conversion_errors(self, env):
+        d = {'ints': [1, 'x'], 'strs': [], 'floats_by_name': {}, '_ccvt': 'CaseClassWithPrimitiveContainers/1'}
+
+        with pytest.raises(CaseClassFieldTypeException):
+            env.cc_from_dict(d, CaseClassWithPrimitiveContainers)
+        with pytest.raises(CaseClassFieldTypeException):
+            env.cc_from_dict({'ints': [], 'strs': [u'a', u'\u05d0'], 'floats_by_name': {}, '_ccvt': 'CaseClassWithPrimitiveContainers/1'}, CaseClassWithPrimitiveContainers)
+
+    def test_subclasses_are_kept(self, env):
+        d = {'ints': [1, True, 2L], 'strs': [], 'floats_by_name': {u'x': 1}, '_ccvt': 'CaseClassWithPrimitiveContainers/1'}
+
+        cc = env.cc_from_dict(d, CaseClassWithPrimitiveContainers)
+
+        assert [type(i) for i in cc.ints] == [int, bool, int]
+        assert type(cc.floats_by_name['x']) is float
+
+    def test_caller_containers_are_not_shared(self, env):
+        ints = [1, 2, 3]
+        floats_by_name = {'x': 1.5}
+        d = {'ints': ints, 'strs': [], 'floats_by_name': floats_by_name, '_ccvt': 'CaseClassWithPrimitiveContainers/1'}
+
+        cc = env.cc_from_dict(d, CaseClassWithPrimitiveContainers)
+        d2 = env.cc_to_dict(cc)
+
+        assert cc.ints == ints and cc.ints is not ints
+        assert cc.floats_by_name == floats_by_name and cc.floats_by_name is not floats_by_name
+        assert d2['ints'] == ints and d2['ints'] is not cc.ints
+
+
+class CaseClassWithArrays(CaseClass):
+    CC_TYPES = OrderedDict([('name', str), ('samples', cc_array('d')), ('counts', cc_array('H'))])
+
+    def __init__(self, name, samples, counts):
+        self.name = name
+        self.samples = samples
+        self.counts = counts
+
+
+if numpy is not None:
+    class CaseClassWithNdArray(CaseClass):
+        CC_TYPES = OrderedDict([('values', cc_ndarray('float32'))])
+
+        def __init__(self, values):
+            self.values = values
+
+
+class PickleSerialization(object):
+    # A serialization which can hold raw bytes, so binary field values are not base64 encoded
+    binary_values = True
+
+    def serialize(self, d, **kwargs):
+        return pickle.dumps(d, pickle.HIGHEST_PROTOCOL)
+
+    def deserialize(self, s, **kwargs):
+        return pickle.loads(s)
+
+
+class TestArrayTypesTests:
+    def test_json_round_trip(self, env):
+        cc = CaseClassWithArrays('x', array.array('d', [1.5, -2.25, 1e300]), array.array('H', [0, 1, 65535]))
+
+        s = env.cc_to_json_str(cc)
+        new_cc = env.cc_from_json_str(s, CaseClassWithArrays)
+
+        assert new_cc == cc
+        assert new_cc.samples.typecode == 'd'
+        # The values are stored as the base64 of their little-endian bytes
+        assert base64.b64decode(json.loads(s)['counts']) == '\x00\x00\x01\x00\xff\xff'
+
+    def test_values_must_be_arrays_of_the_same_typecode(self):
+        with pytest.raises(CaseClassUnexpectedFieldTypeException):
+            CaseClassWithArrays('x', array.array('f', [1.5]), array.array('H'))
+        with pytest.raises(CaseClassUnexpectedFieldTypeException):
+            CaseClassWithArrays('x', [1.5], array.array('H'))
+        with pytest.raises(CaseClassDefinitionException):
+            cc_array('l')
+
+    def test_lists_are_accepted_when_deserializing(self, env):
+        d = {'name': 'x', 'samples': [1, 2.5], 'counts': [3], '_ccvt': 'CaseClassWithArrays/1'}
+
+        cc = env.cc_from_dict(d, CaseClassWithArrays)
+
+        assert cc.samples == array.array('d', [1.0, 2.5])
+        assert cc.counts == array.array('H', [3])
+
+    def test_invalid_data(self, env):
+        d = {'name': 'x', 'samples': 'not base64!', 'counts': [], '_ccvt': 'CaseClassWithArrays/1'}
+
+        with pytest.raises(CaseClassFieldTypeException):
+            env.cc_from_dict(d, CaseClassWithArrays)
+
+    def test_binary_serialization(self):
+        env = SeriumEnv(CaseClassSerializationContext(), CaseClassDeserializationContext(), PickleSerialization())
+        cc = CaseClassWithArrays('x', array.array('d', [1.5, 2.5]), array.array('H', [7]))
+
+        d = env.cc_to_dict(cc)
+        new_cc = env.cc_from_json_str(env.cc_to_json_str(cc), CaseClassWithArrays)
+
+        assert d['counts'] == '\x07\x00'
+        assert new_cc == cc
+
+    @pytest.mark.skipif(numpy is None, reason='numpy is not installed')
+    def test_ndarray_round_trip(self, env):
+        cc = CaseClassWithNdArray(numpy.array([1.5, 2.5, -3], dtype='float32'))
+
+        new_cc = env.cc_from_json_str(env.cc_to_json_str(cc), CaseClassWithNdArray)
+
+        assert new_cc == cc
+        assert new_cc != CaseClassWithNdArray(numpy.array([1.5, 2.5, 3], dtype='float32'))
+        assert new_cc.values.dtype == numpy.float32
+        assert new_cc.values.flags.writeable
+        with pytest.raises(CaseClassUnexpectedFieldTypeException):
+            CaseClassWithNdArray(numpy.array([1.5], dtype='float64'))
+
+
+class TestBulkConstructionTests:
+    def test_from_columns(self):
+        instances = A.from_columns({'a': [1, 2, 3], 'b': [4, 5, 6], 'c': [7, 8, 9]})
+
+        assert instances == [A(1, 4, 7), A(2, 5, 8), A(3, 6, 9)]
+        assert instances[0].__dict__ == A(1, 4, 7).__dict__
+        with pytest.raises(CaseClassImmutabilityException):
+            instances[0].a = 5
+
+    def test_from_rows(self):
+        assert A.from_rows([(1, 2, 3), (4, None, 6)]) == [A(1, 2, 3), A(4, None, 6)]
+        assert A.from_rows([]) == []
+        with pytest.raises(CaseClassFieldMismatchException):
+            A.from_rows([(1, 2)])
+
+    def test_columns_are_type_checked(self):
+        with pytest.raises(CaseClassUnexpectedFieldTypeException):
+            A.from_columns({'a': [1, 2, '3'], 'b': [1, 2, 3], 'c': [1, 2, 3]})
+        with pytest.raises(CaseClassFieldMismatchException):
+            A.from_columns({'a': [1], 'b': [1]})
+        with pytest.raises(CaseClassInvalidParameterException):
+            A.from_columns({'a': [1, 2], 'b': [1], 'c': [1]})
+
+    def test_subtype_columns(self):
+        supers = CaseClassSuperType.from_columns({'submessage_type': ['CaseClassSubType1', 'CaseClassSubType2'],
+                                                  'details': [CaseClassSubType1(1, 2), CaseClassSubType2(3, 4)]})
+
+        assert supers[1] == CaseClassSuperType('CaseClassSubType2', CaseClassSubType2(3, 4))
+        with pytest.raises(CaseClassUnexpectedFieldTypeException):
+            CaseClassSuperType.from_columns({'submessage_type': ['CaseClassSubType1'], 'details': [CaseClassSubType2(3, 4)]})
+
+    def test_lazy(self):
+        instances = A.from_columns({'a': range(1000), 'b': [0] * 1000, 'c': [1] * 1000}, lazy=True)
+
+        assert len(instances) == 1000
+        assert instances[10] is instances[10]
+        assert instances[-1] == A(999, 0, 1)
+        assert instances[1:3] == [A(1, 0, 1), A(2, 0, 1)]
+        assert list(instances)[5] == A(5, 0, 1)
+
+
+class CaseClassWithTimestamps(CaseClass):
+    CC_TYPES = OrderedDict([('created', cc_timestamp), ('updated', cc_timestamp_us), ('history', cc_list(cc_timestamp))])
+
+    def __init__(self, created, updated, history):
+        self.created = created
+        self.updated = updated
+        self.history = history
+
+
+class TestTimestampTests:
+    def test_round_trip(self, env):
+        cc = CaseClassWithTimestamps(1500000000123, 1500000000123456L, [1, 2, 1500000000000])
+
+        s = env.cc_to_json_str(cc)
+        new_cc = env.cc_from_json_str(s, CaseClassWithTimestamps)
+
+        assert json.loads(s)['created'] == 1500000000123
+        assert new_cc == cc
+
+    def test_datetime_conversions(self):
+        dt = datetime.datetime(2017, 7, 14, 2, 40, 0, 123456)
+
+        assert cc_timestamp.from_datetime(dt) == 1500000000123
+        assert cc_timestamp_us.from_datetime(dt) == 1500000000123456
+        assert cc_timestamp.to_datetime(1500000000123) == dt.replace(microsecond=123000)
+        assert cc_timestamp_us.to_datetime(cc_timestamp_us.from_datetime(dt)) == dt
+        assert cc_timestamp.to_datetimes([0, None]) == [datetime.datetime(1970, 1, 1), None]
+        assert abs(cc_timestamp.to_datetime(cc_timestamp.now()) - datetime.datetime.utcnow()) < datetime.timedelta(seconds=10)
+
+    def test_values_must_be_integers(self, env):
+        with pytest.raises(CaseClassUnexpectedFieldTypeException):
+            CaseClassWithTimestamps(datetime.datetime.utcnow(), 1, [])
+        with pytest.raises(CaseClassUnexpectedFieldTypeException):
+            CaseClassWithTimestamps(1.5, 1, [])
+        with pytest.raises(CaseClassFieldTypeException):
+            env.cc_from_dict({'created': 1.5, 'updated': 1, 'history': [], '_ccvt': 'CaseClassWithTimestamps/1'}, CaseClassWithTimestamps)
+
+    def test_lists_are_converted_in_bulk(self, env):
+        d = {'created': 1.0, 'updated': 1, 'history': [1, 2L, 3.0, None], '_ccvt': 'CaseClassWithTimestamps/1'}
+
+        cc = env.cc_from_dict(d, CaseClassWithTimestamps)
+
+        assert cc.created == 1 and type(cc.created) is int
+        assert cc.history == [1, 2, 3, None]
+        assert all(type(v) in (int, long) for v in cc.history[:3])
+
+
+class CaseClassWithEnums(CaseClass):
+    CC_TYPES = OrderedDict([
+        ('status', cc_enum(['AUTHORIZED', 'CAPTURED', 'REFUNDED'])),
+        ('compact_status', cc_enum({'AUTHORIZED': 10, 'CAPTURED': 20}, compact=True)),
+        ('history', cc_list(cc_enum(['AUTHORIZED', 'CAPTURED'], compact=True)))
+    ])
+
+    def __init__(self, status, compact_status, history):
+        self.status = status
+        self.compact_status = compact_status
+        self.history = history
+
+
+class CaseClassWithEnumKeys(CaseClass):
+    CC_TYPES = OrderedDict([('counts', cc_dict(cc_enum(['AUTHORIZED', 'CAPTURED'], compact=True), int))])
+
+    def __init__(self, counts):
+        self.counts = counts
+
+
+class TestEnumTests:
+    def test_round_trip(self, env):
+        cc = CaseClassWithEnums('CAPTURED', 'CAPTURED', ['AUTHORIZED', 'CAPTURED'])
+
+        s = env.cc_to_json_str(cc)
+        new_cc = env.cc_from_json_str(s, CaseClassWithEnums)
+
+        assert json.loads(s) == {'status': 'CAPTURED', 'compact_status': 20, 'history': [0, 1], '_ccvt': 'CaseClassWithEnums/1'}
+        assert new_cc == cc
+        # Deserialized values are the interned strings of the definition, and not the unicode strings of the json
+        assert type(new_cc.status) is str
+        assert new_cc.status is new_cc.compact_status is new_cc.history[1]
+
+    def test_both_encodings_are_accepted(self, env):
+        d = {'status': 1, 'compact_status': u'AUTHORIZED', 'history': [u'CAPTURED', 0], '_ccvt': 'CaseClassWithEnums/1'}
+
+        assert env.cc_from_dict(d, CaseClassWithEnums) == CaseClassWithEnums('CAPTURED', 'AUTHORIZED', ['CAPTURED', 'AUTHORIZED'])
+
+    def test_invalid_values(self, env):
+        with pytest.raises(CaseClassUnexpectedFieldTypeException):
+            CaseClassWithEnums('SHIPPED', 'CAPTURED', [])
+        with pytest.raises(CaseClassFieldTypeException):
+            env.cc_from_dict({'status': 'SHIPPED', 'compact_status': 10, 'history': [], '_ccvt': 'CaseClassWithEnums/1'}, CaseClassWithEnums)
+        with pytest.raises(CaseClassFieldTypeException):
+            env.cc_from_dict({'status': 'CAPTURED', 'compact_status': 11, 'history': [], '_ccvt': 'CaseClassWithEnums/1'}, CaseClassWithEnums)
+
+    def test_invalid_definitions(self):
+        with pytest.raises(CaseClassDefinitionException):
+            cc_enum(['A', 'A'])
+        with pytest.raises(CaseClassDefinitionException):
+            cc_enum({'A': 1, 'B': 1})
+        with pytest.raises(CaseClassDefinitionException):
+            cc_enum([1, 2])
+        with pytest.raises(CaseClassDefinitionException):
+            cc_enum(['0', '1'], compact=True)
+
+    def test_compact_dict_keys(self, env):
+        cc = CaseClassWithEnumKeys({'AUTHORIZED': 1, 'CAPTURED': 2})
+
+        s = env.cc_to_json_str(cc)
+        new_cc = env.cc_from_json_str(s, CaseClassWithEnumKeys)
+
+        assert json.loads(s)['counts'] == {'0': 1, '1': 2}
+        assert new_cc == cc
+        assert all(type(k) is str for k in new_cc.counts)
+        with pytest.raises(CaseClassFieldTypeException):
+            env.cc_from_json_str('{"counts": {"2": 1}, "_ccvt": "CaseClassWithEnumKeys/1"}', CaseClassWithEnumKeys)
+
+
+class CaseClassWithBytes(CaseClass):
+    CC_TYPES = OrderedDict([('name', str), ('data', cc_bytes)])
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+
+
+class TestBytesTests:
+    def test_json_round_trip(self, env):
+        cc = CaseClassWithBytes('x', '\x00\x01\xff')
+
+        s = env.cc_to_json_str(cc)
+        new_cc = env.cc_from_json_str(s, CaseClassWithBytes)
+
+        assert json.loads(s)['data'] == base64.b64encode('\x00\x01\xff')
+        assert new_cc == cc
+
+    def test_dict_round_trip(self, env):
+        cc = CaseClassWithBytes('x', '\x00\x01hello')
+
+        d = env.cc_to_dict(cc)
+
+        assert d['data'] == 'AAFoZWxsbw=='
+        assert env.cc_from_dict(d, CaseClassWithBytes) == cc
+
+    def test_buffer_values(self, env):
+        buf = bytearray('header:payload')
+        cc = CaseClassWithBytes('x', memoryview(buf)[7:])
+
+        new_cc = env.cc_from_json_str(env.cc_to_json_str(cc), CaseClassWithBytes)
+
+        assert new_cc.data == 'payload'
+        assert CaseClassWithBytes('x', buf).data is buf
+        with pytest.raises(CaseClassUnexpectedFieldTypeException):
+            CaseClassWithBytes('x', u'text')
+
+    def test_values_are_not_copied_by_binary_serializations(self):
+        env = SeriumEnv(CaseClassSerializationContext(), CaseClassDeserializationContext(), PickleSerialization())
+        data = 'x' * 100000
+        view = memoryview(data)[10:20]
+
+        d = env.cc_to_dict(CaseClassWithBytes('x', data))
+        new_cc = env.cc_from_dict({'name': 'x', 'data': view, '_ccvt': 'CaseClassWithBytes/1'}, CaseClassWithBytes)
+
+        assert d['data'] is data
+        assert new_cc.data is view
+        assert env.cc_from_json_str(env.cc_to_json_str(CaseClassWithBytes('x', data)), CaseClassWithBytes).data == data
+
+
+class CaseClassWithIds(CaseClass):
+    CC_TYPES = OrderedDict([('id', cc_uuid), ('related_ids', cc_list(cc_uuid))])
+
+    def __init__(self, id, related_ids):
+        self.id = id
+        self.related_ids = related_ids
+
+
+class TestUUIDTests:
+    def test_string_formats(self, env):
+        u = uuid.UUID('12345678-1234-5678-1234-567812345678')
+        for s in ['12345678-1234-5678-1234-567812345678', '12345678-1234-5678-1234-567812345678'.upper(),
+                  '{12345678-1234-5678-1234-567812345678}', 'urn:uuid:12345678-1234-5678-1234-567812345678',
+                  '12345678123456781234567812345678']:
+            cc = env.cc_from_dict({'id': s, 'related_ids': [s, unicode(s)], '_ccvt': 'CaseClassWithIds/1'}, CaseClassWithIds)
+            assert cc == CaseClassWithIds(u, [u, u])
+            assert cc.id.version == u.version and hash(cc.id) == hash(u)
+
+    def test_invalid_strings(self, env):
+        for s in ['12345678-1234-5678-1234-56781234567x', '12345678-1234-5678-1234-5678-2345678', '1234']:
+            with pytest.raises(CaseClassTypeAsStringException):
+                env.cc_from_dict({'id': s, 'related_ids': [], '_ccvt': 'CaseClassWithIds/1'}, CaseClassWithIds)
+            with pytest.raises(CaseClassTypeAsStringException):
+                env.cc_from_dict({'id': None, 'related_ids': [str(uuid.uuid4()), s], '_ccvt': 'CaseClassWithIds/1'}, CaseClassWithIds)
+
+    def test_lists(self, env):
+        cc = CaseClassWithIds(uuid.uuid4(), [uuid.uuid4() for _ in range(100)] + [None])
+
+        assert env.cc_from_json_str(env.cc_to_json_str(cc), CaseClassWithIds) == cc
+
+    def test_binary_serialization(self):
+        env = SeriumEnv(CaseClassSerializationContext(), CaseClassDeserializationContext(), PickleSerialization())
+        cc = CaseClassWithIds(uuid.uuid4(), [uuid.uuid4(), None])
+
+        d = env.cc_to_dict(cc)
+
+        assert d['id'] == cc.id.bytes and len(d['id']) == 16
+        assert d['related_ids'] == [cc.related_ids[0].bytes, None]
+        assert env.cc_from_json_str(env.cc_to_json_str(cc), CaseClassWithIds) == cc
+
+
+class TestStringPolicyTests:
+    def env_with_policy(self, string_policy):
+        return SeriumEnv(CaseClassSerializationContext(), CaseClassDeserializationContext(string_policy=string_policy), cc_compact_json_serialization)
+
+    def test_ascii_policy(self, env):
+        cc = env.cc_from_json_str('{"a": "x", "b": "y", "_ccvt": "B/1"}', B)
+
+        assert type(cc.a) is str and type(cc.b) is str
+        with pytest.raises(CaseClassFieldTypeException):
+            env.cc_from_json_str(u'{"a": "\u05d0", "b": "y", "_ccvt": "B/1"}', B)
+
+    def test_utf8_policy(self):
+        env = self.env_with_policy(caseclasses.STRING_POLICY_UTF8)
+
+        cc = env.cc_from_json_str(u'{"a": "\u05d0", "b": "y", "_ccvt": "B/1"}', B)
+        lists_cc = env.cc_from_dict({'ints': [], 'strs': [u'\u05d0', u'b'], 'floats_by_name': {u'\u05d1': 1.0}, '_ccvt': 'CaseClassWithPrimitiveContainers/1'},
+                                    CaseClassWithPrimitiveContainers)
+
+        assert cc.a == u'\u05d0'.encode('utf-8')
+        assert env.cc_from_json_str(env.cc_to_json_str(cc), B) == cc
+        assert lists_cc.strs == [u'\u05d0'.encode('utf-8'), 'b']
+        assert lists_cc.floats_by_name.keys() == [u'\u05d1'.encode('utf-8')]
+
+    def test_intern_policy(self):
+        env = self.env_with_policy(caseclasses.STRING_POLICY_INTERN)
+        s = '{"ints": [], "strs": ["country-%s", "country-%s"], "floats_by_name": {}, "_ccvt": "CaseClassWithPrimitiveContainers/1"}' % (id(self), id(self))
+
+        first = env.cc_from_json_str(s, CaseClassWithPrimitiveContainers)
+        second = env.cc_from_json_str(s, CaseClassWithPrimitiveContainers)
+
+        assert first.strs[0] is first.strs[1] is second.strs[0]
+
+    def test_invalid_policy(self):
+        with pytest.raises(CaseClassInvalidParameterException):
+            CaseClassDeserializationContext(string_policy='latin1')
+
+
+class SharedB(CaseClass):
+    CC_TYPES = OrderedDict([('first', B), ('others', cc_list(B)), ('by_name', cc_dict(str, B))])
+
+    def __init__(self, first, others, by_name):
+        self.first = first
+        self.others = others
+        self.by_name = by_name
+
+
+class Customer(CaseClass):
+    CC_TYPES = OrderedDict([('name', str)])
+
+    def __init__(self, name):
+        self.name = name
+
+
+class Order__v1(CaseClass):
+    CC_TYPES = OrderedDict([('customer', Customer)])
+    CC_V = 1
+
+    def __init__(self, customer):
+        self.customer = customer
+
+
+class Order(CaseClass):
+    CC_TYPES = OrderedDict([('customer', Customer), ('quantity', int)])
+    CC_V = 2
+    CC_MIGRATIONS = {
+        1: lambda old: Order(old.customer, 1)
+    }
+
+    def __init__(self, customer, quantity):
+        self.customer = customer
+        self.quantity = quantity
+
+
+class Orders(CaseClass):
+    CC_TYPES = OrderedDict([('orders', cc_list(Order))])
+
+    def __init__(self, orders):
+        self.orders = orders
+
+
+class Cart__v1(CaseClass):
+    CC_TYPES = OrderedDict([('customer_name', str)])
+    CC_V = 1
+
+    def __init__(self, customer_name):
+        self.customer_name = customer_name
+
+
+def migrate_cart_v1(old):
+    customer = Customer(old.customer_name)
+    return Cart(customer, [Order(customer, 1)])
+
+
+class Cart(CaseClass):
+    CC_TYPES = OrderedDict([('customer', Customer), ('orders', cc_list(Order))])
+    CC_V = 2
+    CC_MIGRATIONS = {
+        1: migrate_cart_v1
+    }
+
+    def __init__(self, customer, orders):
+        self.customer = customer
+        self.orders = orders
+
+
+class TestPreserveReferencesTests:
+    def env_preserving_references(self, one_pass_decoding=False):
+        return SeriumEnv(CaseClassSerializationContext(preserve_references=True), CaseClassDeserializationContext(one_pass_decoding=one_pass_decoding),
+                         cc_compact_json_serialization)
+
+    def test_shared_instances(self):
+        env = self.env_preserving_references()
+        shared = B('x', 'y')
+        cc = SharedB(shared, [shared, B('x', 'y'), shared], {'s': shared})
+
+        d = env.cc_to_dict(cc)
+        new_cc = env.cc_from_json_str(json.dumps(d), SharedB)
+
+        assert d['_ccrefs'] == 1
+        assert d['first'] == {'a': 'x', 'b': 'y', '_ccvt': 'B/1', '_ccid': 0}
+        assert d['others'] == [{'_ccref': 0}, {'a': 'x', 'b': 'y', '_ccvt': 'B/1'}, {'_ccref': 0}]
+        assert d['by_name'] == {'s': {'_ccref': 0}}
+        assert new_cc == cc
+        assert new_cc.first is new_cc.others[0] is new_cc.others[2] is new_cc.by_name['s']
+        assert new_cc.others[1] is not new_cc.first
+
+    def test_shared_subtrees(self):
+        env = self.env_preserving_references(one_pass_decoding=True)
+        leaf = CaseClassWithRecursiveRefInList(0, [])
+        middle = CaseClassWithRecursiveRefInList(1, [leaf, leaf])
+        root = CaseClassWithRecursiveRefInList(2, [middle, middle, leaf])
+
+        new_root = env.cc_from_json_str(env.cc_to_json_str(root), CaseClassWithRecursiveRefInList)
+
+        assert new_root == root
+        assert new_root.children[0] is new_root.children[1]
+        assert new_root.children[2] is new_root.children[0].children[0] is new_root.children[0].children[1]
+
+    def test_off_by_default(self, env):
+        shared = B('x', 'y')
+
+        d = env.cc_to_dict(SharedB(shared, [shared], {}))
+
+        assert '_ccrefs' not in d
+        assert d['others'] == [{'a': 'x', 'b': 'y', '_ccvt': 'B/1'}]
+
+    def test_without_shared_instances(self):
+        env = self.env_preserving_references()
+        cc = SharedB(B('x', 'y'), [B('x', 'y')], {})
+
+        assert env.cc_to_dict(cc) == create_default_env().cc_to_dict(cc)
+
+    def test_unversioned(self):
+        env = SeriumEnv(CaseClassSerializationContext(force_unversioned_serialization=True, preserve_references=True),
+                        CaseClassDeserializationContext(fail_on_unversioned_data=False), cc_compact_json_serialization)
+        shared = B('x', 'y')
+
+        new_cc = env.cc_from_json_str(env.cc_to_json_str(SharedB(shared, [shared], {})), SharedB)
+
+        assert new_cc.first is new_cc.others[0]
+
+    def test_migrated_result_with_shared_instances(self):
+        env = self.env_preserving_references()
+
+        cart = env.cc_from_json_str(env.cc_to_json_str(Cart__v1('x')), Cart)
+
+        assert cart == Cart(Customer('x'), [Order(Customer('x'), 1)])
+
+    def test_old_versions_with_shared_instances(self):
+        env = self.env_preserving_references()
+        customer = Customer('x')
+        shared_order = Order__v1(Customer('y'))
+        s = env.cc_to_json_str(Orders([Order__v1(customer), Order__v1(customer), Order(customer, 2), shared_order, shared_order]))
+        assert json.loads(s)['_ccrefs'] == 2
+
+        orders = env.cc_from_json_str(s, Orders).orders
+
+        assert orders == [Order(customer, 1), Order(customer, 1), Order(customer, 2), Order(Customer('y'), 1), Order(Customer('y'), 1)]
+        assert orders[3] is orders[4]
+
+    def test_unknown_reference(self, env):
+        with pytest.raises(CaseClassInvalidParameterException):
+            env.cc_from_json_str('{"first": {"_ccref": 3}, "others": [], "by_name": {}, "_ccrefs": 1, "_ccvt": "SharedB/1"}', SharedB)
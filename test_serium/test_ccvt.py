@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import json
+import logging
 from collections import OrderedDict
 
 import pytest
@@ -11,10 +12,13 @@ import sys, os
 sys.path.insert(0, os.path.join(sys.path[0], '..'))
 
 from serium.caseclasses import CaseClass, default_to_version_1_func, CaseClassVersionedType, create_default_env, CaseClassSerializationContext, CaseClassDeserializationContext
-from serium.types import cc_subtype_key, cc_subtype_value, cc_list, cc_self_type
+from serium.types import cc_subtype_key, cc_subtype_value, cc_list, cc_self_type, cc_enum, cc_bytes
 from serium.cc_exceptions import CaseClassInvalidVersionedTypeException, MissingVersionDataCaseClassException, \
     IncompatibleTypesCaseClassException, CaseClassCannotBeFoundException, VersionNotFoundCaseClassException, \
-    MigrationPathNotFoundCaseClassException
+    MigrationPathNotFoundCaseClassException, MigrationFunctionCaseClassException, CaseClassCreationException
+from serium.utils import bounded_repr
+from serium.metrics import InMemoryMetricsSink
+from serium.caches import CaseClassMigrationCache
 
 
 @pytest.fixture
@@ -737,3 +741,488 @@ class TestMigrationOfCaseClassWithDict:
         assert c2.val == c1.val
         assert c2.x == c1.d['x']
         assert c2.d == c1.d
+
+
+class TestMigrationCache:
+    def create_env(self, max_size=100):
+        env = create_default_env()
+        env.deserialization_ctx = CaseClassDeserializationContext(migration_cache=CaseClassMigrationCache(max_size))
+        return env
+
+    def test_migration_result_is_cached(self):
+        env = self.create_env()
+        cache = env.deserialization_ctx.migration_cache
+
+        a1 = env.cc_from_json_str("""{ "x": 100, "y": 2001 , "_ccvt": "A/1" }""", A)
+        a2 = env.cc_from_json_str("""{ "_ccvt": "A/1", "y": 2001, "x": 100 }""", A)
+
+        assert a1 == A(a=100L, doubled=4002L)
+        assert a2 is a1
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    def test_current_version_is_not_cached(self):
+        env = self.create_env()
+        cache = env.deserialization_ctx.migration_cache
+
+        env.cc_from_json_str("""{ "a": 500, "doubled": 5000 , "_ccvt": "A/3" }""", A)
+
+        assert len(cache) == 0
+        assert cache.hits == 0
+        assert cache.misses == 0
+
+    def test_different_data_is_not_shared(self):
+        env = self.create_env()
+
+        a1 = env.cc_from_json_str("""{ "x": 100, "y": 2001 , "_ccvt": "A/1" }""", A)
+        a2 = env.cc_from_json_str("""{ "x": 100, "y": 2001 , "_ccvt": "A/2" }""", A)
+        a3 = env.cc_from_json_str("""{ "x": 100, "y": 2002 , "_ccvt": "A/1" }""", A)
+
+        assert a1 == A(100L, 4002L)
+        assert a2 == A(100L, 4002L)
+        assert a3 == A(100L, 4004L)
+        assert env.deserialization_ctx.migration_cache.hits == 0
+
+    def test_nested_migrations_are_cached(self):
+        env = self.create_env()
+        cache = env.deserialization_ctx.migration_cache
+
+        s = """
+        { "l": [
+            {"x": 1,"y": 10,"_ccvt": "A/2"},
+            {"x": 1,"y": 10,"_ccvt": "A/2"},
+            {"x": 3,"y": 30,"_ccvt": "A/2"}
+          ],
+            "_ccvt": "MyCaseClassWithList/1"
+        }"""
+        c = env.cc_from_json_str(s, MyCaseClassWithList)
+
+        assert c == MyCaseClassWithList([A(1L, 20L), A(1L, 20L), A(3L, 60L)])
+        assert c.l[0] is c.l[1]
+        assert cache.hits == 1
+        assert cache.misses == 2
+
+    def test_eviction(self):
+        env = self.create_env(max_size=2)
+        cache = env.deserialization_ctx.migration_cache
+
+        for x in [1, 2, 3, 1]:
+            env.cc_from_json_str("""{ "x": %d, "y": 1 , "_ccvt": "A/1" }""" % x, A)
+
+        assert len(cache) == 2
+        assert cache.evictions == 2
+        assert cache.hits == 0
+        assert cache.stats() == {'size': 2, 'max_size': 2, 'hits': 0, 'misses': 4, 'evictions': 2, 'expirations': 0}
+
+
+class Huge__v1(CaseClass):
+    CC_TYPES = OrderedDict([('values', cc_list(int))])
+    CC_V = 1
+    REPR_CALLS = [0]
+
+    def __init__(self, values):
+        self.values = values
+
+    def __repr__(self):
+        Huge__v1.REPR_CALLS[0] += 1
+        return super(Huge__v1, self).__repr__()
+
+
+def migrate_huge_v1(old):
+    if old.values[0] < 0:
+        raise ValueError('negative')
+    return Huge(old.values, len(old.values))
+
+
+class Huge(CaseClass):
+    CC_TYPES = OrderedDict([('values', cc_list(int)), ('count', int)])
+    CC_V = 2
+    CC_MIGRATIONS = {
+        1: migrate_huge_v1
+    }
+
+    def __init__(self, values, count):
+        self.values = values
+        self.count = count
+
+
+class TestBoundedReprs:
+    def test_migration_does_not_render_instances_when_not_logging(self, env):
+        Huge__v1.REPR_CALLS[0] = 0
+        s = env.cc_to_json_str(Huge__v1(range(100000)))
+
+        h = env.cc_from_json_str(s, Huge)
+
+        assert h.count == 100000
+        assert Huge__v1.REPR_CALLS[0] == 0
+
+    def test_migration_debug_logging_is_bounded(self, env, caplog):
+        s = env.cc_to_json_str(Huge__v1(range(100000)))
+
+        with caplog.at_level(logging.DEBUG, logger='serium'):
+            h = env.cc_from_json_str(s, Huge)
+
+        assert h.count == 100000
+        assert 'Gonna migrate instance Huge__v1(values=[0, 1, 2, 3, 4, 5, ...]) from version 1 to version 2' in caplog.text
+        assert max(len(record.getMessage()) for record in caplog.records) < 1000
+
+    def test_migration_exception_message_is_bounded(self, env):
+        s = env.cc_to_json_str(Huge__v1([-1] * 100000))
+
+        with pytest.raises(MigrationFunctionCaseClassException) as e:
+            env.cc_from_json_str(s, Huge)
+        assert len(str(e.value)) < 1000
+        assert e.value.intermediate_instance.values == [-1] * 100000
+
+    def test_bounded_repr(self):
+        assert bounded_repr(MyClass(1, 'a')) == "MyClass(x=1,y='a')"
+        assert bounded_repr(ParentClass(1, MyClass(2, 'x' * 1000))) == "ParentClass(some_int=1,nested=MyClass(x=2,y='" + 'x' * 27 + "..." + 'x' * 28 + "'))"
+        assert len(bounded_repr('x' * 10000, max_length=50)) == 50
+
+
+class TestMetrics:
+    def create_env(self, **deserialization_ctx_kwargs):
+        env = create_default_env()
+        env.deserialization_ctx = CaseClassDeserializationContext(**deserialization_ctx_kwargs)
+        env.metrics_sink = InMemoryMetricsSink()
+        return env
+
+    def test_conversion_timings(self):
+        env = self.create_env()
+
+        s = env.cc_to_json_str(B(300, A(12L, 500L)))
+        env.cc_from_json_str(s, B)
+        env.cc_from_json_str(s, B)
+
+        timings = env.metrics_sink.snapshot()['timings']
+        assert sorted(timings.keys()) == [('cc_from_dict', 'B'), ('cc_to_dict', 'B')]
+        assert timings[('cc_to_dict', 'B')]['count'] == 1
+        assert timings[('cc_from_dict', 'B')]['count'] == 2
+        assert sum(timings[('cc_from_dict', 'B')]['buckets']) == 2
+        assert timings[('cc_from_dict', 'B')]['min'] <= timings[('cc_from_dict', 'B')]['mean'] <= timings[('cc_from_dict', 'B')]['max']
+
+    def test_migration_timings(self):
+        env = self.create_env()
+
+        env.cc_from_json_str("""{ "x": 100, "y": 2001 , "_ccvt": "A/1" }""", A)
+        env.cc_from_json_str("""{ "x": 100, "y": 2001 , "_ccvt": "A/2" }""", A)
+
+        timings = env.metrics_sink.snapshot()['timings']
+        assert timings[('migrate', 'A', 1, 2)]['count'] == 1
+        assert timings[('migrate', 'A', 2, 3)]['count'] == 2
+        # Reading the old versions is done through cc_from_dict as well
+        assert timings[('cc_from_dict', 'A__v1')]['count'] == 1
+        assert timings[('cc_from_dict', 'A__v2')]['count'] == 1
+        assert timings[('cc_from_dict', 'A')]['count'] == 2
+
+    def test_external_version_provider_timings(self):
+        env = self.create_env(external_version_provider_func=default_to_version_1_func)
+
+        env.cc_from_json_str("""{ "a" : 111, "b": 222 }""", T)
+
+        timings = env.metrics_sink.snapshot()['timings']
+        assert timings[('external_version_provider', 'T')]['count'] == 1
+        assert timings[('migrate', 'T', 1, 2)]['count'] == 1
+
+    def test_subtype_resolution_counters(self):
+        env = self.create_env()
+
+        s = env.cc_to_json_str(SuperType(1000, "SubType", SubType(200, 300)))
+        env.cc_from_json_str(s, SuperType)
+
+        assert env.metrics_sink.snapshot()['counters'] == {('subtype_resolution', 'SuperType', 'SubType'): 2}
+
+    def test_reset(self):
+        env = self.create_env()
+
+        env.cc_to_dict(AnotherClass(1))
+        env.metrics_sink.reset()
+
+        assert env.metrics_sink.snapshot() == {'counters': {}, 'timings': {}}
+
+
+class Payment__v1(CaseClass):
+    CC_TYPES = OrderedDict([('status', cc_enum(['AUTHORIZED', 'CAPTURED'], compact=True))])
+    CC_V = 1
+
+    def __init__(self, status):
+        self.status = status
+
+
+# A new value is added in a new version, so old data is still decoded using the codes of version 1
+class Payment(CaseClass):
+    CC_TYPES = OrderedDict([('status', cc_enum(['PENDING', 'AUTHORIZED', 'CAPTURED'], compact=True))])
+    CC_V = 2
+    CC_MIGRATIONS = {
+        1: lambda old: Payment(status=old.status)
+    }
+
+    def __init__(self, status):
+        self.status = status
+
+
+class TestEnumMigrationTests:
+    def test_codes_of_old_versions(self, env):
+        old_s = env.cc_to_json_str(Payment__v1('CAPTURED'))
+
+        payment = env.cc_from_json_str(old_s, Payment)
+
+        assert json.loads(old_s)['status'] == 1
+        assert payment == Payment('CAPTURED')
+        assert json.loads(env.cc_to_json_str(payment))['status'] == 2
+
+
+COUNTRY_CODES = {'France': 'FR', 'Israel': 'IL', 'Japan': 'JP'}
+country_batches = []
+
+
+def migrate_countries_v1(old_instances):
+    country_batches.append(len(old_instances))
+    # Stands for a lookup table which is expensive to load, and is loaded once per batch
+    codes = dict(COUNTRY_CODES)
+    return [Country__v2(codes[old.name]) for old in old_instances]
+
+
+class Country__v1(CaseClass):
+    CC_TYPES = OrderedDict([('name', str)])
+    CC_V = 1
+
+    def __init__(self, name):
+        self.name = name
+
+
+class Country__v2(CaseClass):
+    CC_TYPES = OrderedDict([('code', str)])
+    CC_V = 2
+    CC_BATCH_MIGRATIONS = {
+        1: migrate_countries_v1
+    }
+
+    def __init__(self, code):
+        self.code = code
+
+
+class Country(CaseClass):
+    CC_TYPES = OrderedDict([('code', str), ('population', long)])
+    CC_V = 3
+    CC_MIGRATIONS = {
+        2: lambda old: Country(old.code, None)
+    }
+
+    def __init__(self, code, population):
+        self.code = code
+        self.population = population
+
+
+class BrokenCountry__v1(CaseClass):
+    CC_TYPES = OrderedDict([('name', str)])
+    CC_V = 1
+
+    def __init__(self, name):
+        self.name = name
+
+
+class BrokenCountry(CaseClass):
+    CC_TYPES = OrderedDict([('name', str)])
+    CC_V = 2
+    CC_BATCH_MIGRATIONS = {
+        1: lambda old_instances: old_instances[1:]
+    }
+
+    def __init__(self, name):
+        self.name = name
+
+
+class UnmigratedCountry__v1(CaseClass):
+    CC_TYPES = OrderedDict([('name', str)])
+    CC_V = 1
+
+    def __init__(self, name):
+        self.name = name
+
+
+class UnmigratedCountry(CaseClass):
+    CC_TYPES = OrderedDict([('name', str), ('code', str)])
+    CC_V = 2
+    CC_MIGRATIONS = {
+        1: lambda old: old
+    }
+
+    def __init__(self, name, code):
+        self.name = name
+        self.code = code
+
+
+class UnmigratedBatchCountry__v1(CaseClass):
+    CC_TYPES = OrderedDict([('name', str)])
+    CC_V = 1
+
+    def __init__(self, name):
+        self.name = name
+
+
+class UnmigratedBatchCountry(CaseClass):
+    CC_TYPES = OrderedDict([('name', str), ('code', str)])
+    CC_V = 2
+    CC_BATCH_MIGRATIONS = {
+        1: lambda old_instances: old_instances
+    }
+
+    def __init__(self, name, code):
+        self.name = name
+        self.code = code
+
+
+class Label__v1(CaseClass):
+    CC_TYPES = OrderedDict([('text', str)])
+    CC_V = 1
+
+    def __init__(self, text):
+        self.text = text
+
+
+class Label(CaseClass):
+    CC_TYPES = OrderedDict([('text', str), ('color', str)])
+    CC_V = 2
+    CC_MIGRATIONS = {
+        1: lambda old: Label(old.text, 'black')
+    }
+
+    def __init__(self, text, color):
+        self.text = text
+        self.color = color
+
+
+class Box__v1(CaseClass):
+    CC_TYPES = OrderedDict([('name', str)])
+    CC_V = 1
+
+    def __init__(self, name):
+        self.name = name
+
+
+class Box(CaseClass):
+    CC_TYPES = OrderedDict([('name', str), ('labels', cc_list(Label))])
+    CC_V = 2
+    CC_MIGRATIONS = {
+        # Returns an old version of the labels, which is migrated as well when the result is read as a Box
+        1: lambda old: Box(old.name, [Label__v1(old.name)])
+    }
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+
+class TestBatchMigrations:
+    def setup_method(self, method):
+        del country_batches[:]
+
+    def test_records_are_grouped_by_source_version(self, env):
+        ds = [env.cc_to_dict(Country__v1('France')), env.cc_to_dict(Country__v2('GB')), env.cc_to_dict(Country('US', 300L)),
+              env.cc_to_dict(Country__v1('Japan')), env.cc_to_dict(Country__v2('IT')), env.cc_to_dict(Country__v1('Israel'))]
+
+        countries = env.cc_from_dict_batch(ds, Country)
+
+        assert countries == [Country('FR', None), Country('GB', None), Country('US', 300L), Country('JP', None), Country('IT', None), Country('IL', None)]
+        assert country_batches == [3]
+
+    def test_json_batch(self, env):
+        strs = [env.cc_to_json_str(Country__v1(name)) for name in sorted(COUNTRY_CODES)]
+
+        assert env.cc_from_json_str_batch(strs, Country) == [Country('FR', None), Country('IL', None), Country('JP', None)]
+        assert env.cc_from_json_str_batch([], Country) == []
+        assert country_batches == [3]
+
+    def test_owned_input(self, env):
+        d = env.cc_to_dict(Huge([1, 2], 2))
+        owned_d = env.cc_to_dict(Huge([1, 2], 2))
+
+        assert env.cc_from_dict_batch([d], Huge)[0].values is not d['values']
+        assert env.cc_from_dict_batch([owned_d], Huge, owns_input=True)[0].values is owned_d['values']
+
+    def test_single_record_uses_batch_migration(self, env):
+        assert env.cc_from_json_str(env.cc_to_json_str(Country__v1('Israel')), Country) == Country('IL', None)
+        assert country_batches == [1]
+
+    def test_migrate_batch(self):
+        countries = Country.migrate_batch([Country__v1('France'), Country__v1('Japan')], CaseClassVersionedType(Country, 1))
+
+        assert countries == [Country('FR', None), Country('JP', None)]
+
+    def test_migration_metrics_and_cache(self):
+        env = create_default_env()
+        env.deserialization_ctx = CaseClassDeserializationContext(migration_cache=CaseClassMigrationCache(10))
+        env.metrics_sink = InMemoryMetricsSink()
+        ds = [env.cc_to_dict(Country__v1('France')) for _ in range(2)]
+
+        first = env.cc_from_dict_batch([dict(d) for d in ds], Country)
+        second = env.cc_from_dict_batch([dict(d) for d in ds], Country)
+
+        assert second[0] is second[1] and any(second[0] is country for country in first)
+        assert country_batches == [2]
+        timings = env.metrics_sink.snapshot()['timings']
+        assert timings[('migrate', 'Country', 1, 2)]['count'] == 1
+        assert timings[('migrate', 'Country', 2, 3)]['count'] == 1
+
+    def test_batch_migration_must_keep_the_number_of_instances(self, env):
+        with pytest.raises(MigrationFunctionCaseClassException):
+            env.cc_from_dict_batch([env.cc_to_dict(BrokenCountry__v1('a')), env.cc_to_dict(BrokenCountry__v1('b'))], BrokenCountry)
+
+    def test_migrations_must_return_the_new_version(self):
+        env = create_default_env()
+        env.deserialization_ctx = CaseClassDeserializationContext(migration_cache=CaseClassMigrationCache(10))
+        unmigrated_d = env.cc_to_dict(UnmigratedCountry__v1('a'))
+
+        with pytest.raises(CaseClassCreationException):
+            env.cc_from_dict(dict(unmigrated_d), UnmigratedCountry)
+        with pytest.raises(CaseClassCreationException):
+            env.cc_from_dict_batch([dict(unmigrated_d)], UnmigratedCountry)
+        with pytest.raises(MigrationFunctionCaseClassException):
+            env.cc_from_dict_batch([env.cc_to_dict(UnmigratedBatchCountry__v1('a'))], UnmigratedBatchCountry)
+        with pytest.raises(MigrationFunctionCaseClassException):
+            UnmigratedBatchCountry.migrate(UnmigratedBatchCountry__v1('a'), UnmigratedBatchCountry__v1.get_versioned_type())
+        # Nothing is cached, so the next call fails as well
+        with pytest.raises(CaseClassCreationException):
+            env.cc_from_dict_batch([dict(unmigrated_d)], UnmigratedCountry)
+
+    def test_batch_results_are_the_same_as_single_record_results(self, env):
+        d = env.cc_to_dict(Box__v1('a'))
+
+        single = env.cc_from_dict(dict(d), Box)
+        batch = env.cc_from_dict_batch([dict(d)], Box)[0]
+
+        assert single == batch == Box('a', [Label('a', 'black')])
+        assert type(single.labels[0]) is Label and type(batch.labels[0]) is Label
+
+
+class Attachment__v1(CaseClass):
+    CC_TYPES = OrderedDict([('data', cc_bytes), ('chunks', cc_list(cc_bytes))])
+    CC_V = 1
+
+    def __init__(self, data, chunks):
+        self.data = data
+        self.chunks = chunks
+
+
+class Attachment(CaseClass):
+    CC_TYPES = OrderedDict([('data', cc_bytes), ('chunks', cc_list(cc_bytes)), ('name', str)])
+    CC_V = 2
+    CC_MIGRATIONS = {
+        1: lambda old: Attachment(old.data, old.chunks, 'unnamed')
+    }
+
+    def __init__(self, data, chunks, name):
+        self.data = data
+        self.chunks = chunks
+        self.name = name
+
+
+class TestBinaryFieldMigrationTests:
+    def test_binary_fields_are_migrated(self, env):
+        old = Attachment__v1('\x00\x01hello', ['\xff', ''])
+
+        from_json = env.cc_from_json_str(env.cc_to_json_str(old), Attachment)
+        from_dict = env.cc_from_dict(env.cc_to_dict(old), Attachment)
+
+        assert from_json == from_dict == Attachment('\x00\x01hello', ['\xff', ''], 'unnamed')
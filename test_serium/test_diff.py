@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+
+import os
+import uuid
+from collections import OrderedDict
+
+import pytest
+
+import sys
+
+# This needs to come first, before any serium imports
+sys.path.insert(0, os.path.join(sys.path[0], '..'))
+
+from serium.caseclasses import CaseClass, SeriumEnv, CaseClassSerializationContext, CaseClassDeserializationContext, cc_to_json_str
+from serium.diff import cc_diff, cc_apply_patch, cc_patch_to_json_str, cc_patch_from_json_str
+from serium.digest import cc_digest
+from serium.types import cc_list, cc_dict, cc_self_type, cc_uuid, cc_subtype_key, cc_subtype_value
+from serium.cc_exceptions import CaseClassInvalidParameterException, CaseClassUnknownFieldException
+
+
+class Address(CaseClass):
+    CC_TYPES = OrderedDict([('street', str), ('city', str)])
+
+    def __init__(self, street, city):
+        self.street = street
+        self.city = city
+
+
+class LineItem(CaseClass):
+    CC_TYPES = OrderedDict([('sku', str), ('quantity', int)])
+
+    def __init__(self, sku, quantity):
+        self.sku = sku
+        self.quantity = quantity
+
+
+class Order(CaseClass):
+    CC_TYPES = OrderedDict([
+        ('order_id', cc_uuid),
+        ('tags', cc_list(str)),
+        ('address', Address),
+        ('items', cc_list(LineItem)),
+        ('items_by_sku', cc_dict(str, LineItem))
+    ])
+
+    def __init__(self, order_id, tags, address, items, items_by_sku):
+        self.order_id = order_id
+        self.tags = tags
+        self.address = address
+        self.items = items
+        self.items_by_sku = items_by_sku
+
+
+class Tree(CaseClass):
+    CC_TYPES = OrderedDict([('value', int), ('children', cc_list(cc_self_type))])
+
+    def __init__(self, value, children):
+        self.value = value
+        self.children = children
+
+
+class Card(CaseClass):
+    CC_TYPES = OrderedDict([('last_digits', str)])
+
+    def __init__(self, last_digits):
+        self.last_digits = last_digits
+
+
+class Cash(CaseClass):
+    CC_TYPES = OrderedDict([('currency', str)])
+
+    def __init__(self, currency):
+        self.currency = currency
+
+
+class Payment(CaseClass):
+    CC_TYPES = OrderedDict([('method_type', cc_subtype_key('method')), ('method', cc_subtype_value('method_type'))])
+
+    def __init__(self, method_type, method):
+        self.method_type = method_type
+        self.method = method
+
+
+def order():
+    items = [LineItem('sku-{}'.format(i), i) for i in range(100)]
+    return Order(uuid.UUID(int=1), ['a', 'b'], Address('Main St', 'Springfield'), items, {item.sku: item for item in items})
+
+
+def round_trip(patch):
+    return cc_patch_from_json_str(cc_patch_to_json_str(patch))
+
+
+class TestDiffTests:
+    def test_leaf_change(self):
+        old = order()
+        new = old.copy(address=old.address.copy(city='Shelbyville'))
+
+        patch = cc_diff(old, new)
+        patched = cc_apply_patch(old, round_trip(patch))
+
+        assert patch == {'_ccpatch': 1, '_ccvt': 'Order/1', 'fields': {'address': {'f': {'city': {'v': 'Shelbyville'}}}}}
+        assert patched == new
+        # Unchanged parts are shared with the base
+        assert patched.items is old.items and patched.items_by_sku is old.items_by_sku
+        assert type(patched.address.city) is str
+
+    def test_no_changes(self):
+        old = order()
+
+        patch = cc_diff(old, order())
+
+        assert patch['fields'] == {}
+        assert cc_apply_patch(old, patch) == old
+
+    def test_list_changes(self):
+        old = order()
+        items = list(old.items)
+        items[7] = items[7].copy(quantity=70)
+        new = old.copy(items=items, tags=['a', 'c'])
+
+        patch = cc_diff(old, new)
+        patched = cc_apply_patch(old, round_trip(patch))
+
+        assert patch['fields'] == {'items': {'l': [(7, {'f': {'quantity': {'v': 70}}})]}, 'tags': {'v': ['a', 'c']}}
+        assert patched == new
+        assert patched.items[6] is old.items[6]
+        assert len(cc_patch_to_json_str(patch)) < len(cc_to_json_str(new)) / 10
+
+    def test_list_length_change(self):
+        old = order()
+        new = old.copy(items=old.items[:50])
+
+        assert cc_apply_patch(old, round_trip(cc_diff(old, new))) == new
+
+    def test_dict_changes(self):
+        old = order()
+        items_by_sku = dict(old.items_by_sku)
+        del items_by_sku['sku-1']
+        items_by_sku['sku-2'] = LineItem('sku-2', 20)
+        items_by_sku['new'] = LineItem('new', 1)
+        new = old.copy(items_by_sku=items_by_sku)
+
+        patch = cc_diff(old, new)
+        patched = cc_apply_patch(old, round_trip(patch))
+
+        assert patch['fields']['items_by_sku']['r'] == ['sku-1']
+        assert sorted(k for k, _ in patch['fields']['items_by_sku']['d']) == ['new', 'sku-2']
+        assert patched == new
+        assert patched.items_by_sku['sku-3'] is old.items_by_sku['sku-3']
+
+    def test_none_values(self):
+        old = order()
+        new = old.copy(address=None)
+
+        assert cc_apply_patch(old, round_trip(cc_diff(old, new))) == new
+        assert cc_apply_patch(new, round_trip(cc_diff(new, old))) == old
+
+    def test_subtypes(self):
+        old = Payment('Card', Card('1234'))
+        new = Payment('Cash', Cash('USD'))
+
+        assert cc_apply_patch(old, round_trip(cc_diff(old, new))) == new
+        assert cc_apply_patch(old, round_trip(cc_diff(old, old.copy(method=Card('5678'))))) == Payment('Card', Card('5678'))
+
+    def test_equal_digests_are_not_compared(self):
+        old = order()
+        new = order()
+        cc_digest(old)
+        cc_digest(new)
+
+        assert cc_diff(old, new)['fields'] == {}
+
+    def test_deep_structure(self):
+        old = Tree(0, [])
+        for i in range(1, 3000):
+            old = Tree(i, [old])
+        new = old.copy(value=-1)
+
+        assert cc_diff(old, new)['fields'] == {'value': {'v': -1}}
+        assert cc_apply_patch(old, cc_diff(old, new)).children[0] is old.children[0]
+
+    def test_deep_change(self):
+        depth = 20000
+        old = Tree(0, [])
+        for i in range(1, depth):
+            old = Tree(i, [old])
+        # Copies the whole chain, with a different value at its deepest level
+        new = Tree(-1, [])
+        nodes = [old]
+        while nodes[-1].children:
+            nodes.append(nodes[-1].children[0])
+        for node in reversed(nodes[:-1]):
+            new = Tree(node.value, [new])
+
+        patched = cc_apply_patch(old, cc_diff(old, new))
+
+        deepest = patched
+        for _ in range(depth - 1):
+            deepest = deepest.children[0]
+        assert deepest.value == -1 and deepest.children == []
+        assert patched.value == depth - 1
+
+    def test_binary_env(self):
+        env = SeriumEnv(CaseClassSerializationContext(), CaseClassDeserializationContext(), BinarySerialization())
+        old = order()
+        new = old.copy(order_id=uuid.UUID(int=2))
+
+        patch = cc_diff(old, new, env)
+
+        assert patch['fields'] == {'order_id': {'v': uuid.UUID(int=2).bytes}}
+        assert cc_apply_patch(old, patch, env) == new
+
+    def test_invalid_patches(self):
+        old = order()
+        patch = cc_diff(old, old.copy(tags=[]))
+
+        with pytest.raises(CaseClassInvalidParameterException):
+            cc_diff(old, old.address)
+        with pytest.raises(CaseClassInvalidParameterException):
+            cc_apply_patch(old.address, patch)
+        with pytest.raises(CaseClassInvalidParameterException):
+            cc_apply_patch(old, dict(patch, _ccpatch=2))
+        with pytest.raises(CaseClassUnknownFieldException):
+            cc_apply_patch(old, dict(patch, fields={'unknown': {'v': 1}}))
+        with pytest.raises(CaseClassInvalidParameterException):
+            cc_apply_patch(old, dict(patch, fields={'items': {'l': [[1000, {'v': None}]]}}))
+
+
+class BinarySerialization(object):
+    binary_values = True
+
+    def serialize(self, d, **kwargs):
+        raise NotImplementedError()
+
+    def deserialize(self, s, **kwargs):
+        raise NotImplementedError()
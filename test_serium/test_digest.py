@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+import gc
+import json
+import os
+import uuid
+from collections import OrderedDict
+
+import pytest
+
+import sys
+
+# This needs to come first, before any serium imports
+sys.path.insert(0, os.path.join(sys.path[0], '..'))
+
+from serium import digest
+from serium.caseclasses import CaseClass, cc_to_dict
+from serium.digest import cc_digest, cc_to_canonical_json
+from serium.types import cc_list, cc_dict, cc_self_type, cc_uuid, cc_subtype_key, cc_subtype_value
+from serium.cc_exceptions import CaseClassInvalidParameterException
+
+
+class Item(CaseClass):
+    CC_TYPES = OrderedDict([('sku', str), ('price', float), ('attributes', dict)])
+
+    def __init__(self, sku, price, attributes):
+        self.sku = sku
+        self.price = price
+        self.attributes = attributes
+
+
+class Cart(CaseClass):
+    CC_TYPES = OrderedDict([('cart_id', cc_uuid), ('items', cc_list(Item)), ('by_sku', cc_dict(str, Item)), ('main_item', Item)])
+
+    def __init__(self, cart_id, items, by_sku, main_item):
+        self.cart_id = cart_id
+        self.items = items
+        self.by_sku = by_sku
+        self.main_item = main_item
+
+
+class Item2(CaseClass):
+    CC_TYPES = OrderedDict([('sku', str), ('price', float), ('attributes', dict)])
+    CC_V = 2
+
+    def __init__(self, sku, price, attributes):
+        self.sku = sku
+        self.price = price
+        self.attributes = attributes
+
+
+class Tree(CaseClass):
+    CC_TYPES = OrderedDict([('value', int), ('children', cc_list(cc_self_type))])
+
+    def __init__(self, value, children):
+        self.value = value
+        self.children = children
+
+
+class Shipped(CaseClass):
+    CC_TYPES = OrderedDict([('carrier', str)])
+
+    def __init__(self, carrier):
+        self.carrier = carrier
+
+
+class Status(CaseClass):
+    CC_TYPES = OrderedDict([('status_type', cc_subtype_key('details')), ('details', cc_subtype_value('status_type'))])
+
+    def __init__(self, status_type, details):
+        self.status_type = status_type
+        self.details = details
+
+
+def cart(price=1.5):
+    items = [Item('sku-{}'.format(i), i * price, {'color': 'red', 'size': i}) for i in range(3)]
+    return Cart(uuid.UUID(int=1), items, {item.sku: item for item in items}, items[0])
+
+
+class TestDigestTests:
+    def test_equal_instances(self):
+        first = cart()
+        second = cart()
+
+        assert first is not second
+        assert cc_digest(first) == cc_digest(second)
+        assert len(cc_digest(first)) == 40
+        assert cc_digest(first) != cc_digest(cart(price=2.5))
+        assert cc_digest(Item('a', 1.0, {})) != cc_digest(Item('b', 1.0, {}))
+        assert cc_digest(Item('a', 1.0, {})) != cc_digest(Item('a', 1.0, None))
+
+    def test_dict_order(self):
+        # 1 and 9 collide in a small dict, so the iteration order depends on the insertion order
+        first = {}
+        first[1] = 'a'
+        first[9] = 'b'
+        second = {}
+        second[9] = 'b'
+        second[1] = 'a'
+        assert first.keys() != second.keys()
+
+        assert cc_digest(Item('x', 1.0, first)) == cc_digest(Item('x', 1.0, second))
+        assert cc_to_canonical_json(Item('x', 1.0, first)) == cc_to_canonical_json(Item('x', 1.0, second))
+
+    def test_version_is_part_of_the_digest(self):
+        assert cc_digest(Item('a', 1.0, {})) != cc_digest(Item2('a', 1.0, {}))
+
+    def test_digest_is_cached(self, monkeypatch):
+        original = cart()
+        cc_digest(original)
+        hashed = []
+        instance_digest = digest._instance_digest
+        monkeypatch.setattr(digest, '_instance_digest', lambda cc: hashed.append(cc) or instance_digest(cc))
+
+        cc_digest(original)
+        changed = original.copy(main_item=original.main_item.copy(price=10.0))
+        changed_digest = cc_digest(changed)
+
+        # Only the changed instance and its parent are hashed, and the unchanged items are reused
+        assert hashed == [changed.main_item, changed]
+        assert changed_digest == instance_digest(changed) != cc_digest(original)
+
+    def test_cache_entries_are_released(self):
+        cc_digest(cart())
+        gc.collect()
+
+        assert all(ref() is not None for ref, _ in digest._digests.values())
+
+    def test_subtypes(self):
+        assert cc_digest(Status('Shipped', Shipped('ups'))) != cc_digest(Status('Shipped', Shipped('fedex')))
+
+    def test_deep_structure(self):
+        tree = Tree(0, [])
+        for i in range(1, 3000):
+            tree = Tree(i, [tree])
+
+        assert cc_digest(tree) == cc_digest(tree.copy())
+
+    def test_canonical_json(self):
+        original = cart()
+
+        s = cc_to_canonical_json(original)
+
+        assert json.loads(s) == cc_to_dict(original)
+        assert s == json.dumps(cc_to_dict(cart()), sort_keys=True, separators=(',', ':'))
+        assert ' ' not in s
+
+    def test_invalid_input(self):
+        with pytest.raises(CaseClassInvalidParameterException):
+            cc_digest({'sku': 'a'})
+        with pytest.raises(CaseClassInvalidParameterException):
+            cc_to_canonical_json(None)
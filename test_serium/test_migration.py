@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+import json
+import os
+from collections import OrderedDict
+
+import pytest
+
+import sys
+
+# This needs to come first, before any serium imports
+sys.path.insert(0, os.path.join(sys.path[0], '..'))
+
+from serium.caseclasses import CaseClass, create_default_env
+from serium.migration import migrate_file, migrate_records, migrate_record
+from serium.cli import main, import_cc_type
+from serium.cc_exceptions import MigrationFunctionCaseClassException, CaseClassCannotBeFoundException
+
+
+class Point__v1(CaseClass):
+    CC_TYPES = OrderedDict([('x', int), ('y', int)])
+    CC_V = 1
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+# Allows simulating a migration which is interrupted in the middle
+FAIL_ON_X = set()
+
+
+def migrate_point_v1(old):
+    if old.x in FAIL_ON_X:
+        raise Exception('Simulated failure')
+    return Point__v2(old.x, old.y, 'unnamed')
+
+
+class Point__v2(CaseClass):
+    CC_TYPES = OrderedDict([('x', int), ('y', int), ('name', str)])
+    CC_V = 2
+    CC_MIGRATIONS = {
+        1: migrate_point_v1
+    }
+
+    def __init__(self, x, y, name):
+        self.x = x
+        self.y = y
+        self.name = name
+
+
+class Point(CaseClass):
+    CC_TYPES = OrderedDict([('x', int), ('y', int), ('name', str), ('z', int)])
+    CC_V = 3
+    CC_MIGRATIONS = {
+        2: lambda old: Point(old.x, old.y, old.name, 0)
+    }
+
+    def __init__(self, x, y, name, z):
+        self.x = x
+        self.y = y
+        self.name = name
+        self.z = z
+
+
+@pytest.fixture
+def env(request):
+    return create_default_env()
+
+
+def write_mixed_version_records(env, path, count):
+    with open(path, 'wb') as f:
+        for i in range(count):
+            if i % 3 == 0:
+                p = Point__v1(i, i * 10)
+            elif i % 3 == 1:
+                p = Point__v2(i, i * 10, 'p%d' % i)
+            else:
+                p = Point(i, i * 10, 'p%d' % i, i * 100)
+            f.write(env.cc_to_json_str(p) + '\n')
+
+
+def expected_points(count):
+    result = []
+    for i in range(count):
+        if i % 3 == 0:
+            result.append(Point(i, i * 10, 'unnamed', 0))
+        elif i % 3 == 1:
+            result.append(Point(i, i * 10, 'p%d' % i, 0))
+        else:
+            result.append(Point(i, i * 10, 'p%d' % i, i * 100))
+    return result
+
+
+def read_points(env, path):
+    with open(path, 'rb') as f:
+        return [env.cc_from_json_str(line, Point) for line in f]
+
+
+class TestMigration:
+    def test_migrate_record(self, env):
+        source_version, s = migrate_record(env.cc_to_json_str(Point__v1(1, 2)), Point)
+
+        assert source_version == 'Point/1'
+        assert json.loads(s)['_ccvt'] == 'Point/3'
+        assert env.cc_from_json_str(s, Point) == Point(1, 2, 'unnamed', 0)
+
+    def test_migrate_records(self, env):
+        lines = [env.cc_to_json_str(Point__v1(i, i)) for i in range(5)] + ['', env.cc_to_json_str(Point(9, 9, 'a', 9))]
+
+        results = list(migrate_records(lines, Point, chunk_size=2))
+
+        assert [len(migrated_lines) for migrated_lines, _ in results] == [2, 2, 1, 1]
+        assert [env.cc_from_json_str(line, Point) for migrated_lines, _ in results for line in migrated_lines] == \
+               [Point(i, i, 'unnamed', 0) for i in range(5)] + [Point(9, 9, 'a', 9)]
+
+    @pytest.mark.parametrize('processes', [1, 3])
+    def test_migrate_file(self, env, tmpdir, processes):
+        input_path = str(tmpdir.join('input.jsonl'))
+        output_path = str(tmpdir.join('output.jsonl'))
+        write_mixed_version_records(env, input_path, 100)
+
+        report = migrate_file(input_path, output_path, Point, processes=processes, chunk_size=7)
+
+        assert report.total == 100
+        assert report.resumed_from == 0
+        assert report.version_counts == {'Point/1': 34, 'Point/2': 33, 'Point/3': 33}
+        assert read_points(env, output_path) == expected_points(100)
+        assert sorted(os.listdir(str(tmpdir))) == ['input.jsonl', 'output.jsonl']
+
+    @pytest.mark.parametrize('processes', [1, 2])
+    def test_unversioned_records(self, env, tmpdir, processes):
+        input_path = str(tmpdir.join('input.jsonl'))
+        output_path = str(tmpdir.join('output.jsonl'))
+        with open(input_path, 'wb') as f:
+            f.write(env.cc_to_json_str(Point__v1(1, 10)) + '\n')
+            f.write(json.dumps({'x': 2, 'y': 20, 'name': 'p2', 'z': 200}) + '\n')
+
+        report = migrate_file(input_path, output_path, Point, processes=processes)
+
+        assert report.version_counts == {'Point/1': 1, 'unversioned': 1}
+        assert read_points(env, output_path) == [Point(1, 10, 'unnamed', 0), Point(2, 20, 'p2', 200)]
+
+    def test_migrated_file_does_not_need_migration(self, env, tmpdir):
+        input_path = str(tmpdir.join('input.jsonl'))
+        output_path = str(tmpdir.join('output.jsonl'))
+        compacted_path = str(tmpdir.join('compacted.jsonl'))
+        write_mixed_version_records(env, input_path, 10)
+
+        migrate_file(input_path, output_path, Point)
+        report = migrate_file(output_path, compacted_path, Point)
+
+        assert report.version_counts == {'Point/3': 10}
+
+    def test_resume_after_failure(self, env, tmpdir):
+        input_path = str(tmpdir.join('input.jsonl'))
+        output_path = str(tmpdir.join('output.jsonl'))
+        write_mixed_version_records(env, input_path, 30)
+
+        FAIL_ON_X.add(24)
+        try:
+            with pytest.raises(MigrationFunctionCaseClassException):
+                migrate_file(input_path, output_path, Point, chunk_size=5, checkpoint_interval=2)
+        finally:
+            FAIL_ON_X.clear()
+
+        assert not os.path.exists(output_path)
+        checkpoint = json.load(open(output_path + '.checkpoint'))
+        assert checkpoint['records'] == 20
+
+        report = migrate_file(input_path, output_path, Point, chunk_size=5, checkpoint_interval=2)
+
+        assert report.resumed_from == 20
+        assert report.total == 30
+        assert report.version_counts == {'Point/1': 10, 'Point/2': 10, 'Point/3': 10}
+        assert read_points(env, output_path) == expected_points(30)
+        assert not os.path.exists(output_path + '.checkpoint')
+
+    def test_cli(self, env, tmpdir, capsys):
+        input_path = str(tmpdir.join('input.jsonl'))
+        output_path = str(tmpdir.join('output.jsonl'))
+        write_mixed_version_records(env, input_path, 6)
+
+        assert main(['migrate', input_path, output_path, '--type', '{}:Point'.format(__name__), '--processes', '2']) == 0
+
+        assert read_points(env, output_path) == expected_points(6)
+        assert 'Point/1: 2' in capsys.readouterr()[0]
+
+    def test_import_unknown_type(self):
+        with pytest.raises(CaseClassCannotBeFoundException):
+            import_cc_type('{}.UnknownPoint'.format(__name__))
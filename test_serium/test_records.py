@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+import os
+import uuid
+from collections import OrderedDict
+
+import pytest
+
+import sys
+
+# This needs to come first, before any serium imports
+sys.path.insert(0, os.path.join(sys.path[0], '..'))
+
+from serium.caseclasses import CaseClass
+from serium.records import cc_to_records, cc_from_records, records_dtype
+from serium.types import cc_list, cc_uuid, cc_timestamp
+from serium.cc_exceptions import CaseClassInvalidParameterException, CaseClassFieldTypeException
+
+numpy = pytest.importorskip('numpy')
+
+
+class Position(CaseClass):
+    CC_TYPES = OrderedDict([('x', float), ('y', float)])
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class Vehicle(CaseClass):
+    CC_TYPES = OrderedDict([
+        ('vehicle_id', long),
+        ('name', str),
+        ('passengers', int),
+        ('active', bool),
+        ('position', Position),
+        ('tags', cc_list(str))
+    ])
+
+    def __init__(self, vehicle_id, name, passengers, active, position, tags):
+        self.vehicle_id = vehicle_id
+        self.name = name
+        self.passengers = passengers
+        self.active = active
+        self.position = position
+        self.tags = tags
+
+
+class Tracker(CaseClass):
+    CC_TYPES = OrderedDict([('tracker_id', cc_uuid), ('vehicle', Vehicle)])
+
+    def __init__(self, tracker_id, vehicle):
+        self.tracker_id = tracker_id
+        self.vehicle = vehicle
+
+
+class Event(CaseClass):
+    CC_TYPES = OrderedDict([('at', cc_timestamp), ('name', str)])
+
+    def __init__(self, at, name):
+        self.at = at
+        self.name = name
+
+
+def vehicles(count):
+    return [Vehicle(long(i), 'v{}'.format(i), i % 4, i % 2 == 0, Position(i * 0.5, -i * 0.5), ['t{}'.format(i)]) for i in range(count)]
+
+
+class TestRecordsTests:
+    def test_round_trip(self):
+        original = vehicles(10)
+
+        records = cc_to_records(original)
+        instances = cc_from_records(records, Vehicle)
+
+        assert instances == original
+        assert type(instances[0].vehicle_id) is long
+        assert records.dtype == records_dtype(Vehicle)
+        assert records.dtype.names == ('vehicle_id', 'name', 'passengers', 'active', 'position.x', 'position.y', 'tags')
+
+    def test_numeric_columns_are_vectorized(self):
+        records = cc_to_records(vehicles(100))
+
+        assert records['passengers'].dtype == numpy.int64
+        assert records['active'].dtype == numpy.bool_
+        assert records['position.x'].dtype == numpy.float64
+        assert records['passengers'].sum() == sum(i % 4 for i in range(100))
+        assert records['position.y'][records['active']].min() == -49.0
+        # Object columns hold the values as is
+        assert records['tags'][3] == ['t3']
+
+    def test_columns(self):
+        columns = cc_to_records(vehicles(3), as_columns=True)
+
+        assert columns.keys() == ['vehicle_id', 'name', 'passengers', 'active', 'position.x', 'position.y', 'tags']
+        assert columns['name'].tolist() == ['v0', 'v1', 'v2']
+        assert cc_from_records(columns, Vehicle) == vehicles(3)
+
+    def test_columns_can_be_lists(self):
+        columns = {'x': [1, 2], 'y': numpy.array([0.5, 1.5], dtype='float32')}
+
+        assert cc_from_records(columns, Position) == [Position(1.0, 0.5), Position(2.0, 1.5)]
+
+    def test_nested_records(self):
+        original = [Tracker(uuid.UUID(int=i), vehicle) for i, vehicle in enumerate(vehicles(5))]
+
+        records = cc_to_records(original)
+
+        assert records.dtype.names[:3] == ('tracker_id', 'vehicle.vehicle_id', 'vehicle.name')
+        assert cc_from_records(records, Tracker) == original
+
+    def test_empty_list(self):
+        records = cc_to_records([], Vehicle)
+
+        assert len(records) == 0
+        assert cc_from_records(records, Vehicle) == []
+        with pytest.raises(CaseClassInvalidParameterException):
+            cc_to_records([])
+
+    def test_invalid_input(self):
+        with pytest.raises(CaseClassInvalidParameterException):
+            cc_to_records([Position(1.0, 2.0), vehicles(1)[0]])
+        with pytest.raises(CaseClassFieldTypeException):
+            cc_to_records([Vehicle(1L, 'a', 1, True, None, [])])
+        with pytest.raises(CaseClassInvalidParameterException):
+            cc_from_records({'x': [1.0]}, Position)
+        with pytest.raises(CaseClassInvalidParameterException):
+            cc_from_records({'x': [1.0], 'y': [1.0, 2.0]}, Position)
+
+    def test_timestamp_columns(self):
+        original = [Event(1500000000123, 'a'), Event(None, 'b')]
+
+        records = cc_to_records(original)
+
+        assert records['at'].dtype == numpy.dtype('M8[ms]')
+        assert records['at'][0] == numpy.datetime64('2017-07-14T02:40:00.123')
+        assert numpy.isnat(records['at'][1])
+        assert cc_from_records(records, Event) == original